@@ -0,0 +1,148 @@
+"""
+Harness of the adaptive download concurrency on a simulated bandwidth-limited link
+
+A fake yt-dlp is put first in the PATH. Its downloads share a link of fixed
+bandwidth, each stream is capped below it, and the link loses efficiency when
+too many streams compete (like a server throttling connections).
+The best number of active downloads is then between those two limits.
+
+yt-dlpp runs with a fixed minimum, a fixed maximum and the adaptive mode,
+the decisions of the adaptive controller are printed.
+
+Usage: python benchmarks/adaptive_concurrency.py [n_videos]
+"""
+
+import os
+import subprocess
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+_LINK_RATE = 8 * 1024**2
+_STREAM_RATE = 2 * 1024**2
+_CONGESTION_KNEE = 6
+_VIDEO_SIZE = 4 * 1024**2
+_MIN_WORKERS = 1
+_MAX_WORKERS = 16
+
+_FAKE_YT_DLP = """#!{python}
+import json, os, sys, time
+
+args = sys.argv[1:]
+streams_dir = {streams_dir!r}
+
+if "--dump-json" in args:
+    for url in (arg for arg in args if arg.startswith("http")):
+        video_id = url.rsplit("=", 1)[-1]
+        info = {{
+            "id": video_id,
+            "title": "Video " + video_id,
+            "extractor_key": "Generic",
+            "original_url": url,
+            "webpage_url": url,
+        }}
+        print(json.dumps(info), flush=True)
+    sys.exit(0)
+
+with open(args[args.index("--load-info-json") + 1]) as file:
+    info = json.load(file)
+video = {{"id": info["id"], "original_url": info["original_url"], "title": info["title"]}}
+stream_path = os.path.join(streams_dir, str(os.getpid()))
+open(stream_path, "w").close()
+downloaded, start, tick = 0, time.monotonic(), 0.1
+try:
+    while downloaded < {video_size}:
+        n_streams = len(os.listdir(streams_dir))
+        efficiency = max(0.2, 1 - 0.15 * max(0, n_streams - {knee}))
+        speed = min({stream_rate}, {link_rate} * efficiency / n_streams)
+        time.sleep(tick)
+        downloaded = min(downloaded + speed * tick, {video_size})
+        progress = {{
+            "downloaded_bytes": downloaded,
+            "total_bytes": {video_size},
+            "total_bytes_estimate": "NA",
+            "eta": ({video_size} - downloaded) / speed,
+            "speed": speed,
+            "elapsed": time.monotonic() - start,
+        }}
+        print(json.dumps({{"video": video, "progress": progress}}), flush=True)
+finally:
+    os.remove(stream_path)
+"""
+
+
+def _create_fake_yt_dlp(bin_dir: str, streams_dir: str) -> None:
+    path = os.path.join(bin_dir, "yt-dlp")
+    with open(path, "w") as file:
+        file.write(
+            _FAKE_YT_DLP.format(
+                python=sys.executable,
+                streams_dir=streams_dir,
+                video_size=_VIDEO_SIZE,
+                stream_rate=_STREAM_RATE,
+                link_rate=_LINK_RATE,
+                knee=_CONGESTION_KNEE,
+            )
+        )
+    os.chmod(path, 0o755)
+
+
+def _run(args: list[str], urls: list[str], env: dict[str, str]) -> tuple[float, str]:
+    """Run yt-dlpp on the urls, return the duration and the logs"""
+    command = (
+        sys.executable,
+        "-m",
+        "yt_dlpp.main",
+        "--n-info-workers=4",
+        "--info-cache=off",
+        "--no-journal",
+        # The fake would count post-processing runs as downloads
+        "--n-pp-workers=0",
+        *args,
+        *urls,
+    )
+    start = time.perf_counter()
+    process = subprocess.run(
+        command,
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    return time.perf_counter() - start, process.stderr
+
+
+def main() -> None:
+    n_videos = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    urls = [f"https://example.com/watch?v={i}" for i in range(n_videos)]
+    ideal = n_videos * _VIDEO_SIZE / _LINK_RATE
+    print(f"Ideal duration on the link: {ideal:.2f} s")
+    with TemporaryDirectory() as bin_dir, TemporaryDirectory() as streams_dir:
+        _create_fake_yt_dlp(bin_dir, streams_dir)
+        env = {
+            **os.environ,
+            "PATH": bin_dir + os.pathsep + os.environ["PATH"],
+            "LOG_LEVEL": "INFO",
+        }
+        runs = {
+            f"fixed {_MIN_WORKERS}": [f"--n-dl-workers={_MIN_WORKERS}"],
+            f"fixed {_MAX_WORKERS}": [f"--n-dl-workers={_MAX_WORKERS}"],
+            "adaptive": [
+                f"--n-dl-workers={_MAX_WORKERS}",
+                f"--min-dl-workers={_MIN_WORKERS}",
+                "--adaptive-dl-workers",
+                "--adaptive-period=1",
+            ],
+        }
+        for name, args in runs.items():
+            duration, logs = _run(args, urls, env)
+            print(f"{name:>10}: {duration:6.2f} s")
+            if name == "adaptive":
+                for line in logs.splitlines():
+                    if "Download slots" in line or "Holding" in line:
+                        print("           " + line.split("] ", 1)[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Benchmark of a coordinator and its agents on localhost, on the fake yt-dlp
+
+Every configuration runs a coordinator on a playlist, and agents downloading its
+videos to their own directory, with a slow fake download, and reports:
+
+- Videos/s: videos downloaded per second of wall time, by all the agents.
+- Files: videos downloaded, at least all of them. Videos that a killed agent
+  downloaded but didn't report yet are downloaded again by another one.
+- Per agent: videos downloaded by every agent.
+
+In the last configuration, an agent is killed (along with its workers) midway,
+its leased videos are reassigned to the others once their lease times out.
+
+Usage: python benchmarks/distributed_agents.py [n_videos]
+"""
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from tempfile import TemporaryDirectory
+from typing import Optional, TypedDict
+
+import fake_yt_dlp
+
+_N_DL_WORKERS = 2
+_LEASE_TIMEOUT = 3
+_CLUSTER_KEY = "benchmark"
+_FAKE_ENV = {
+    "YTDLPP_FAKE_FILE_SIZE": "1M",
+    "YTDLPP_FAKE_SPEED": "1M",
+}
+
+
+class _ConfigDict(TypedDict):
+    n_agents: int
+    kill_after: Optional[float]
+
+
+class _ResultDict(TypedDict):
+    videos_per_second: float
+    n_files: int
+    n_files_per_agent: list[int]
+
+
+_CONFIGS: dict[str, _ConfigDict] = {
+    "1 agent": _ConfigDict(n_agents=1, kill_after=None),
+    "2 agents": _ConfigDict(n_agents=2, kill_after=None),
+    "3 agents": _ConfigDict(n_agents=3, kill_after=None),
+    "3 agents, 1 killed": _ConfigDict(n_agents=3, kill_after=5),
+}
+
+
+def _get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _count_files(directory: str) -> int:
+    if not os.path.isdir(directory):
+        return 0
+    return sum(1 for entry in os.scandir(directory) if not entry.name.endswith(".part"))
+
+
+def _run(config: _ConfigDict, n_videos: int, work_dir: str) -> _ResultDict:
+    """Run a coordinator and its agents on a playlist, return the measures"""
+    bin_dir = os.path.join(work_dir, "bin")
+    os.mkdir(bin_dir)
+    fake_yt_dlp.install(bin_dir)
+    env = {
+        **os.environ,
+        "PATH": bin_dir + os.pathsep + os.environ["PATH"],
+        **_FAKE_ENV,
+        "YTDLPP_FAKE_PLAYLIST_SIZE": str(n_videos),
+        "YTDLPP_CLUSTER_KEY": _CLUSTER_KEY,
+    }
+    address = f"127.0.0.1:{_get_free_port()}"
+    base_command = (sys.executable, "-m", "yt_dlpp.main")
+    coordinator_command = (
+        *base_command,
+        f"--coordinator={address}",
+        f"--lease-timeout={_LEASE_TIMEOUT}",
+        "--info-cache=off",
+        "--no-journal",
+        "https://example.com/playlist?list=benchmark",
+    )
+    agent_dirs = [
+        os.path.join(work_dir, f"agent-{i}") for i in range(config["n_agents"])
+    ]
+
+    # Agents wait for the coordinator to start, they get their own process group
+    # so that a killed agent takes its workers along, like a crashed machine.
+    start = time.time()
+    coordinator = subprocess.Popen(
+        coordinator_command, env=env, stdout=subprocess.DEVNULL
+    )
+    agents = [
+        subprocess.Popen(
+            (
+                *base_command,
+                f"--agent={address}",
+                f"--n-dl-workers={_N_DL_WORKERS}",
+                f"--paths={agent_dir}",
+            ),
+            env=env,
+            stdout=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        for agent_dir in agent_dirs
+    ]
+    if config["kill_after"] is not None:
+        time.sleep(config["kill_after"])
+        os.killpg(agents[0].pid, signal.SIGKILL)
+    return_code = coordinator.wait()
+    duration = time.time() - start
+    for agent in agents:
+        agent.wait()
+    if return_code != 0:
+        raise RuntimeError(f"The coordinator exited with code {return_code}")
+
+    n_files_per_agent = [_count_files(agent_dir) for agent_dir in agent_dirs]
+    n_files = sum(n_files_per_agent)
+    return _ResultDict(
+        videos_per_second=n_files / duration,
+        n_files=n_files,
+        n_files_per_agent=n_files_per_agent,
+    )
+
+
+def main() -> None:
+    n_videos = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    print(f"{'configuration':>20} {'videos/s':>9} {'files':>7}  per agent")
+    for name, config in _CONFIGS.items():
+        with TemporaryDirectory() as work_dir:
+            result = _run(config, n_videos, work_dir)
+        per_agent = " ".join(str(n) for n in result["n_files_per_agent"])
+        print(
+            f"{name:>20} {result['videos_per_second']:9.1f} "
+            f"{result['n_files']:>3}/{n_videos:<3}  {per_agent}"
+        )
+
+
+if __name__ == "__main__":
+    main()
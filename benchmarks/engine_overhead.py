@@ -0,0 +1,63 @@
+"""
+Benchmark of the per-video overhead of the yt-dlp engines
+
+Small media files are served from a local HTTP server, so that the measured time
+is dominated by what yt-dlpp and yt-dlp do around each download.
+
+Usage: python benchmarks/engine_overhead.py [n_videos]
+"""
+
+import os
+import subprocess
+import sys
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import TemporaryDirectory
+from threading import Thread
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+
+def _run(engine: str, urls: list[str], output_dir: str) -> float:
+    """Run yt-dlpp on the urls with a single worker per stage, return the duration"""
+    command = (
+        sys.executable,
+        "-m",
+        "yt_dlpp.main",
+        "--n-info-workers=1",
+        "--n-dl-workers=1",
+        f"--engine={engine}",
+        f"--paths={output_dir}",
+        *urls,
+    )
+    start = time.perf_counter()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    n_videos = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with TemporaryDirectory() as media_dir, TemporaryDirectory() as output_dir:
+        for i in range(n_videos):
+            with open(os.path.join(media_dir, f"video{i}.mp4"), "wb") as file:
+                file.write(os.urandom(64 * 1024))
+        handler = partial(_QuietHandler, directory=media_dir)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+        urls = [f"http://{host}:{port}/video{i}.mp4" for i in range(n_videos)]
+        for engine in ("subprocess", "embedded"):
+            duration = _run(engine, urls, os.path.join(output_dir, engine))
+            print(
+                f"{engine:>10}: {duration:6.2f} s total, "
+                f"{duration / n_videos * 1000:7.1f} ms per video"
+            )
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
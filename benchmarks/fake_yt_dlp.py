@@ -0,0 +1,428 @@
+"""
+Fake yt-dlp replaying the fixtures of examples/, without any network access
+
+It understands the yt-dlp args used by the subprocess engine, extracts the infos
+of any url from the fixtures and writes dummy files for downloads.
+It is configured by environment variables:
+
+- YTDLPP_FAKE_FIXTURES: directory of the fixtures (default: examples/ of the repo)
+- YTDLPP_FAKE_LATENCY: seconds taken by the extraction of every video (default: 0)
+- YTDLPP_FAKE_PLAYLIST_SIZE: number of videos in playlists (default: 12)
+- YTDLPP_FAKE_FILE_SIZE: size of downloaded files in bytes (default: 1M)
+- YTDLPP_FAKE_SPEED: download speed in bytes per second (default: 0, unlimited)
+- YTDLPP_FAKE_PROGRESS_RATE: progress lines printed per second (default: 10)
+- YTDLPP_FAKE_PP_TIME: seconds taken by the post-processing of videos (default: 0)
+- YTDLPP_FAKE_EVENTS: file every run is appended to as a JSON line (default: none)
+
+Urls with a `list` query parameter are playlists, the others are videos
+identified by their `v` query parameter or else by the end of their path.
+
+Benchmarks install it as `yt-dlp` in a directory put first in the PATH of yt-dlpp,
+that runs it with its subprocess engine.
+
+Usage: python benchmarks/fake_yt_dlp.py [yt-dlp args] [urls]
+"""
+
+import json
+import math
+import os
+import sys
+import time
+import zlib
+from argparse import ArgumentParser, Namespace
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Optional, TypedDict
+from urllib.parse import parse_qs, urlparse
+
+_DEFAULT_FIXTURES = Path(__file__).resolve().parents[1] / "examples"
+_SIZE_UNITS = "KMGT"
+_SHIM = """#!{python}
+import runpy, sys
+
+sys.argv[0] = {path!r}
+runpy.run_path({path!r}, run_name="__main__")
+"""
+_DEFAULT_OUTPUT = "%(title)s [%(id)s].%(ext)s"
+_OUTPUT_TYPES = (
+    "subtitle",
+    "thumbnail",
+    "description",
+    "annotation",
+    "infojson",
+    "link",
+    "pl_thumbnail",
+    "pl_description",
+    "pl_infojson",
+    "chapter",
+    "pl_video",
+)
+
+
+class _SettingsDict(TypedDict):
+    fixtures: Path
+    latency: float
+    playlist_size: int
+    file_size: int
+    speed: float
+    progress_rate: float
+    pp_time: float
+    events: Optional[str]
+
+
+class _FakeArgsNamespace(Namespace):
+    dump_json: bool
+    dump_single_json: bool
+    flat_playlist: bool
+    playlist_items: Optional[str]
+    load_info_json: Optional[str]
+    paths: Optional[list[str]]
+    output: Optional[list[str]]
+    limit_rate: Optional[str]
+    progress_template: Optional[str]
+    no_progress: bool
+    fixup: Optional[str]
+    urls: list[str]
+
+
+class _FormatDict(dict):
+    """Fields of an output template, missing ones are replaced like yt-dlp does"""
+
+    def __missing__(self, key: str) -> str:
+        return "NA"
+
+
+def _parse_size(value: str) -> float:
+    """Parse a size in bytes, with an optional binary unit (eg. 50K, 4.2M)"""
+    value = value.strip().upper()
+    if value and value[-1] in _SIZE_UNITS:
+        return float(value[:-1]) * 1024 ** (_SIZE_UNITS.index(value[-1]) + 1)
+    return float(value)
+
+
+def _get_settings() -> _SettingsDict:
+    """Get the settings of the fake from the environment"""
+    speed = os.getenv("YTDLPP_FAKE_SPEED", "0")
+    return _SettingsDict(
+        fixtures=Path(os.getenv("YTDLPP_FAKE_FIXTURES", _DEFAULT_FIXTURES)),
+        latency=float(os.getenv("YTDLPP_FAKE_LATENCY", "0")),
+        playlist_size=int(os.getenv("YTDLPP_FAKE_PLAYLIST_SIZE", "12")),
+        file_size=int(_parse_size(os.getenv("YTDLPP_FAKE_FILE_SIZE", "1M"))),
+        speed=_parse_size(speed) or math.inf,
+        progress_rate=float(os.getenv("YTDLPP_FAKE_PROGRESS_RATE", "10")),
+        pp_time=float(os.getenv("YTDLPP_FAKE_PP_TIME", "0")),
+        events=os.getenv("YTDLPP_FAKE_EVENTS") or None,
+    )
+
+
+def _create_parser() -> ArgumentParser:
+    """Create the parser of the yt-dlp args understood by the fake"""
+    parser = ArgumentParser(prog="yt-dlp", add_help=False, allow_abbrev=False)
+    parser.add_argument("--dump-json", "-j", action="store_true")
+    parser.add_argument("--dump-single-json", "-J", action="store_true")
+    parser.add_argument("--flat-playlist", action="store_true")
+    parser.add_argument("--playlist-items", "-I")
+    parser.add_argument("--load-info-json")
+    parser.add_argument("--paths", "-P", action="append")
+    parser.add_argument("--output", "-o", action="append")
+    parser.add_argument("--limit-rate", "-r")
+    parser.add_argument("--progress-template")
+    parser.add_argument("--no-progress", action="store_true")
+    parser.add_argument("--fixup")
+    parser.add_argument("urls", nargs="*")
+    return parser
+
+
+@lru_cache(maxsize=1)
+def _load_video_fixtures(fixtures: Path) -> list[dict[str, Any]]:
+    """Load the video infos replayed for every video"""
+    infos = []
+    try:
+        with open(fixtures / "playlist-dump.json", "r", encoding="utf-8") as file:
+            infos.extend(json.loads(line) for line in file if line.strip())
+        with open(fixtures / "video-info.json", "r", encoding="utf-8") as file:
+            infos.append(json.load(file))
+    except OSError:
+        pass
+    if len(infos) == 0:
+        infos.append({"title": "Video", "extractor_key": "Generic", "ext": "mp4"})
+    return infos
+
+
+@lru_cache(maxsize=1)
+def _load_playlist_fixture(fixtures: Path) -> dict[str, Any]:
+    """Load the playlist info replayed for every playlist, without its entries"""
+    try:
+        with open(fixtures / "playlist-info.json", "r", encoding="utf-8") as file:
+            info = json.load(file)
+    except OSError:
+        return {}
+    info.pop("entries", None)
+    return info
+
+
+def _parse_url(url: str) -> tuple[Optional[str], str]:
+    """Get the playlist id (None for videos) and the video id of a url"""
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    if "list" in query:
+        return query["list"][0], query["list"][0]
+    if "v" in query:
+        return None, query["v"][0]
+    return None, parsed.path.rstrip("/").rsplit("/", 1)[-1] or parsed.netloc
+
+
+def _get_video_url(playlist_url: str, video_id: str) -> str:
+    """Get the url of a playlist video, on the host of the playlist"""
+    parsed = urlparse(playlist_url)
+    return f"{parsed.scheme}://{parsed.netloc}/watch?v={video_id}"
+
+
+def _select_items(spec: Optional[str], size: int) -> list[int]:
+    """Get the 1-based indices of the playlist items selected by a spec"""
+    if spec is None:
+        return list(range(1, size + 1))
+    indices = []
+    for part in spec.split(","):
+        start, separator, stop = part.partition(":")
+        if not separator:
+            indices.append(int(start))
+            continue
+        first = int(start) if start else 1
+        last = int(stop) if stop else size
+        indices.extend(range(first, min(last, size) + 1))
+    return [index for index in indices if 1 <= index <= size]
+
+
+def _get_video_info(settings: _SettingsDict, url: str, video_id: str) -> dict[str, Any]:
+    """Get the info of a video, replayed from one of the fixtures"""
+    fixtures = _load_video_fixtures(settings["fixtures"])
+    template = fixtures[zlib.crc32(video_id.encode()) % len(fixtures)]
+    info = {**template}
+    info.pop("requested_formats", None)
+    info.update(
+        id=video_id,
+        display_id=video_id,
+        title=f"{template.get('title', 'Video')} ({video_id})",
+        original_url=url,
+        webpage_url=url,
+        filesize=settings["file_size"],
+    )
+    return info
+
+
+def _get_flat_entry(
+    url: str, video_id: str, title: str, playlist_id: str
+) -> dict[str, Any]:
+    """Get the flat playlist entry of a video"""
+    return {
+        "_type": "url",
+        "ie_key": "Youtube",
+        "id": video_id,
+        "url": url,
+        "title": title,
+        "playlist_id": playlist_id,
+    }
+
+
+def _get_playlist_entries(
+    settings: _SettingsDict, args: _FakeArgsNamespace, url: str, playlist_id: str
+) -> list[dict[str, Any]]:
+    """Get the infos of the selected entries of a playlist, flat or not"""
+    size = settings["playlist_size"]
+    entries = []
+    for index in _select_items(args.playlist_items, size):
+        video_id = f"{playlist_id}-{index}"
+        video_url = _get_video_url(url, video_id)
+        if args.flat_playlist:
+            title = f"Video ({video_id})"
+            entries.append(_get_flat_entry(video_url, video_id, title, playlist_id))
+            continue
+        info = _get_video_info(settings, video_url, video_id)
+        info.update(
+            playlist=playlist_id,
+            playlist_id=playlist_id,
+            playlist_index=index,
+            playlist_count=size,
+            playlist_webpage_url=url,
+        )
+        entries.append(info)
+    return entries
+
+
+def _print_line(value: Any) -> None:
+    """Print a JSON line on stdout, as soon as it is available"""
+    sys.stdout.write(json.dumps(value) + "\n")
+    sys.stdout.flush()
+
+
+def _dump_json(settings: _SettingsDict, args: _FakeArgsNamespace) -> int:
+    """Print the infojson of every video of the urls, return the number of lines"""
+    n_lines = 0
+    for url in args.urls:
+        playlist_id, video_id = _parse_url(url)
+        if playlist_id is None:
+            entries = [_get_video_info(settings, url, video_id)]
+        else:
+            entries = _get_playlist_entries(settings, args, url, playlist_id)
+        for entry in entries:
+            if entry.get("_type") != "url":
+                time.sleep(settings["latency"])
+            _print_line(entry)
+            n_lines += 1
+    return n_lines
+
+
+def _dump_single_json(settings: _SettingsDict, args: _FakeArgsNamespace) -> int:
+    """Print the infojson of the url, playlists included, return the number of lines"""
+    time.sleep(settings["latency"])
+    url = args.urls[-1]
+    playlist_id, video_id = _parse_url(url)
+    if playlist_id is None:
+        _print_line(_get_video_info(settings, url, video_id))
+        return 1
+    info = {
+        **_load_playlist_fixture(settings["fixtures"]),
+        "_type": "playlist",
+        "id": playlist_id,
+        "title": f"Playlist ({playlist_id})",
+        "webpage_url": url,
+        "original_url": url,
+        "playlist_count": settings["playlist_size"],
+        "entries": _get_playlist_entries(settings, args, url, playlist_id),
+    }
+    _print_line(info)
+    return 1
+
+
+def _get_file_path(args: _FakeArgsNamespace, info: dict[str, Any]) -> str:
+    """Get the path of the file of a video, from the output template and paths"""
+    templates = [
+        value
+        for value in args.output or ()
+        if value.split(":", 1)[0] not in _OUTPUT_TYPES
+    ]
+    template = templates[-1] if templates else _DEFAULT_OUTPUT
+    fields = _FormatDict(
+        (key, str(value).replace("/", "⧸")) for key, value in info.items()
+    )
+    try:
+        name = template % fields
+    except (TypeError, ValueError):
+        name = _DEFAULT_OUTPUT % fields
+    homes = [
+        value.removeprefix("home:")
+        for value in args.paths or ()
+        if ":" not in value or value.startswith("home:")
+    ]
+    return os.path.join(homes[-1] if homes else ".", name)
+
+
+def _download(settings: _SettingsDict, args: _FakeArgsNamespace) -> tuple[str, int]:
+    """
+    Download a video to a dummy file and post-process it,
+    return the kind of run and the number of lines printed
+    """
+    if args.load_info_json is not None:
+        with open(args.load_info_json, "r", encoding="utf-8") as file:
+            info = json.load(file)
+    else:
+        url = args.urls[-1]
+        info = _get_video_info(settings, url, _parse_url(url)[1])
+    path = _get_file_path(args, info)
+    size = settings["file_size"]
+
+    # Files that are already downloaded are only post-processed
+    n_lines = 0
+    downloaded = os.path.isfile(path) and os.path.getsize(path) == size
+    if not downloaded:
+        speed = settings["speed"]
+        if args.limit_rate is not None:
+            speed = min(speed, _parse_size(args.limit_rate))
+        show_progress = args.progress_template is not None and not args.no_progress
+        video = {key: info.get(key) for key in ("id", "original_url", "title")}
+        start = time.monotonic()
+        period = 1 / settings["progress_rate"]
+        done = 0
+        while done < size:
+            if math.isinf(speed):
+                done = size
+            else:
+                time.sleep(min(period, (size - done) / speed))
+                done = min(size, (time.monotonic() - start) * speed)
+            if show_progress:
+                progress = {
+                    "downloaded_bytes": done,
+                    "total_bytes": size,
+                    "total_bytes_estimate": "NA",
+                    "eta": "NA" if math.isinf(speed) else (size - done) / speed,
+                    "speed": "NA" if math.isinf(speed) else speed,
+                    "elapsed": time.monotonic() - start,
+                }
+                _print_line({"video": video, "progress": progress})
+                n_lines += 1
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as file:
+            file.truncate(size)
+
+    # Post-processing is skipped when deferred
+    if args.fixup != "never":
+        time.sleep(settings["pp_time"])
+    return ("post_process" if downloaded else "download"), n_lines
+
+
+def _get_start_time() -> float:
+    """Get the time the process started at, interpreter startup included if known"""
+    now = time.time()
+    try:
+        with open("/proc/self/stat", "r") as file:
+            # The process name may contain spaces, fields are read after it
+            start_ticks = int(file.read().rsplit(")", 1)[1].split()[19])
+    except OSError:
+        return now
+    uptime = time.clock_gettime(time.CLOCK_BOOTTIME)
+    return now - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+
+
+def _record_event(
+    settings: _SettingsDict, kind: str, start: float, n_lines: int
+) -> None:
+    """Append a run to the events file, if any"""
+    if settings["events"] is None:
+        return
+    event = {"kind": kind, "start": start, "end": time.time(), "lines": n_lines}
+    with open(settings["events"], "a", encoding="utf-8") as file:
+        file.write(json.dumps(event) + "\n")
+
+
+def install(bin_dir: str) -> None:
+    """Install the fake as yt-dlp in a directory, to put first in the PATH"""
+    path = os.path.join(bin_dir, "yt-dlp")
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(
+            _SHIM.format(python=sys.executable, path=str(Path(__file__).resolve()))
+        )
+    os.chmod(path, 0o755)
+
+
+def main() -> None:
+    start = _get_start_time()
+    settings = _get_settings()
+    args: _FakeArgsNamespace
+    args, _ = _create_parser().parse_known_args()
+    # Values of the options the fake doesn't know are parsed as urls
+    args.urls = [url for url in args.urls if "://" in url]
+    if args.dump_json:
+        kind, n_lines = "info", _dump_json(settings, args)
+    elif args.dump_single_json:
+        kind, n_lines = "info", _dump_single_json(settings, args)
+    elif args.load_info_json is not None or args.urls:
+        kind, n_lines = _download(settings, args)
+    else:
+        print("ERROR: You must provide at least one URL.", file=sys.stderr)
+        sys.exit(2)
+    _record_event(settings, kind, start, n_lines)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Benchmark of the orchestration overhead of yt-dlpp, on the fake yt-dlp
+
+Every configuration runs yt-dlpp offline on a playlist or a batch of videos,
+with the fake yt-dlp settings and yt-dlpp args of the configuration, and reports:
+
+- Videos/s: videos downloaded per second of wall time.
+- TTFD: time from the start of yt-dlpp to the end of the first download.
+- Overhead: wall time per video not spent in the fake yt-dlp runs
+  of the busiest stage (info extraction, download or post-processing).
+- Peak RSS: peak of the summed resident memory of yt-dlpp's processes,
+  the fake yt-dlp processes excluded (sampled from /proc, on Linux).
+- IPC: lines read from the yt-dlp processes (infojsons and progress) per second.
+
+Usage: python benchmarks/pipeline_overhead.py [n_videos]
+"""
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+from typing import Optional, TypedDict
+
+import fake_yt_dlp
+
+_N_INFO_WORKERS = 4
+_N_DL_WORKERS = 4
+_N_PP_WORKERS = 2
+_SAMPLE_PERIOD = 0.05
+
+
+class _ConfigDict(TypedDict):
+    env: dict[str, str]
+    args: list[str]
+    batch: bool
+
+
+class _ResultDict(TypedDict):
+    videos_per_second: float
+    ttfd: Optional[float]
+    overhead: float
+    peak_rss: Optional[int]
+    ipc_rate: float
+
+
+_CONFIGS: dict[str, _ConfigDict] = {
+    "baseline": _ConfigDict(env={}, args=[], batch=False),
+    "asyncio": _ConfigDict(env={}, args=["--runtime=asyncio"], batch=False),
+    "batch urls": _ConfigDict(env={}, args=[], batch=True),
+    "extraction latency": _ConfigDict(
+        env={"YTDLPP_FAKE_LATENCY": "0.05"}, args=[], batch=False
+    ),
+    "progress lines": _ConfigDict(
+        env={
+            "YTDLPP_FAKE_FILE_SIZE": "4M",
+            "YTDLPP_FAKE_SPEED": "16M",
+            "YTDLPP_FAKE_PROGRESS_RATE": "100",
+        },
+        args=[],
+        batch=False,
+    ),
+    "post-processing": _ConfigDict(
+        env={"YTDLPP_FAKE_PP_TIME": "0.1"},
+        args=[f"--n-pp-workers={_N_PP_WORKERS}"],
+        batch=False,
+    ),
+    "inline post-processing": _ConfigDict(
+        env={"YTDLPP_FAKE_PP_TIME": "0.1"}, args=[], batch=False
+    ),
+}
+
+
+def _get_descendants(pid: int) -> list[int]:
+    """Get the pids of the descendants of a process"""
+    children: dict[int, list[int]] = {}
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = Path(entry.path, "stat").read_text()
+        except OSError:
+            continue
+        # The process name may contain spaces, fields are read after it
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry.name))
+    descendants, pending = [], [pid]
+    while pending:
+        pids = children.get(pending.pop(), [])
+        descendants.extend(pids)
+        pending.extend(pids)
+    return descendants
+
+
+def _get_tree_rss(pid: int) -> int:
+    """Get the summed resident memory of a process and its descendants, in bytes"""
+    rss = 0
+    for tree_pid in (pid, *_get_descendants(pid)):
+        try:
+            # The fake is run by its interpreter as [python, <bin dir>/yt-dlp, ...]
+            if b"/yt-dlp\0" in Path(f"/proc/{tree_pid}/cmdline").read_bytes():
+                continue
+            pages = int(Path(f"/proc/{tree_pid}/statm").read_text().split()[1])
+        except OSError:
+            continue
+        rss += pages * os.sysconf("SC_PAGE_SIZE")
+    return rss
+
+
+def _sample_rss(pid: int, stop: Event, peak: list[int]) -> None:
+    """Keep the peak resident memory of a process tree until stopped"""
+    while not stop.wait(_SAMPLE_PERIOD):
+        peak[0] = max(peak[0], _get_tree_rss(pid))
+
+
+def _run(config: _ConfigDict, n_videos: int, work_dir: str) -> _ResultDict:
+    """Run yt-dlpp on a configuration, return its measures"""
+    events_path = os.path.join(work_dir, "events.jsonl")
+    bin_dir = os.path.join(work_dir, "bin")
+    os.mkdir(bin_dir)
+    fake_yt_dlp.install(bin_dir)
+    env = {
+        **os.environ,
+        "PATH": bin_dir + os.pathsep + os.environ["PATH"],
+        "YTDLPP_FAKE_PLAYLIST_SIZE": str(n_videos),
+        "YTDLPP_FAKE_EVENTS": events_path,
+        **config["env"],
+    }
+    if config["batch"]:
+        batch_path = os.path.join(work_dir, "batch.txt")
+        with open(batch_path, "w") as file:
+            for i in range(n_videos):
+                file.write(f"https://example.com/watch?v={i}\n")
+        inputs = [f"--batch-file={batch_path}"]
+    else:
+        inputs = ["https://example.com/playlist?list=benchmark"]
+    command = (
+        sys.executable,
+        "-m",
+        "yt_dlpp.main",
+        f"--n-info-workers={_N_INFO_WORKERS}",
+        f"--n-dl-workers={_N_DL_WORKERS}",
+        "--info-cache=off",
+        "--no-journal",
+        f"--paths={os.path.join(work_dir, 'output')}",
+        *config["args"],
+        *inputs,
+    )
+
+    # Run yt-dlpp, sampling its memory meanwhile
+    start = time.time()
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+    stop, peak = Event(), [0]
+    sampler = None
+    if os.path.isdir("/proc"):
+        sampler = Thread(target=_sample_rss, args=(process.pid, stop, peak))
+        sampler.start()
+    return_code = process.wait()
+    duration = time.time() - start
+    stop.set()
+    if sampler is not None:
+        sampler.join()
+    if return_code != 0:
+        raise RuntimeError(f"yt-dlpp exited with code {return_code}")
+
+    # Measure from the runs of the fake yt-dlp
+    with open(events_path, "r") as file:
+        events = [json.loads(line) for line in file]
+    download_ends = [e["end"] for e in events if e["kind"] == "download"]
+    busy = {"info": 0.0, "download": 0.0, "post_process": 0.0}
+    for event in events:
+        busy[event["kind"]] += event["end"] - event["start"]
+    # Post-processing done by download workers is part of their runs
+    critical_path = max(
+        busy["info"] / _N_INFO_WORKERS,
+        busy["download"] / _N_DL_WORKERS,
+        busy["post_process"] / _N_PP_WORKERS,
+    )
+    return _ResultDict(
+        videos_per_second=len(download_ends) / duration,
+        ttfd=min(download_ends) - start if download_ends else None,
+        overhead=max(duration - critical_path, 0) / n_videos,
+        peak_rss=peak[0] if sampler is not None else None,
+        ipc_rate=sum(event["lines"] for event in events) / duration,
+    )
+
+
+def main() -> None:
+    n_videos = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    print(
+        f"{'configuration':>24} {'videos/s':>9} {'TTFD':>8} "
+        f"{'overhead':>12} {'peak RSS':>10} {'IPC':>12}"
+    )
+    for name, config in _CONFIGS.items():
+        with TemporaryDirectory() as work_dir:
+            result = _run(config, n_videos, work_dir)
+        ttfd = "-" if result["ttfd"] is None else f"{result['ttfd']:.2f} s"
+        peak_rss = result["peak_rss"]
+        if peak_rss is None:
+            # Without /proc, only the largest process is known
+            peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+        print(
+            f"{name:>24} {result['videos_per_second']:9.1f} {ttfd:>8} "
+            f"{result['overhead'] * 1000:7.1f} ms/v {peak_rss / 1024**2:6.0f} MiB "
+            f"{result['ipc_rate']:6.0f} msg/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
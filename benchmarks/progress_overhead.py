@@ -0,0 +1,89 @@
+"""
+Benchmark of the per-update overhead of progress reporting
+
+Compares sending progress lines through a queue, like download workers used to,
+with writing them to a progress board slot. A consumer process drains the queue
+or polls the board meanwhile.
+
+Usage: python benchmarks/progress_overhead.py [n_updates]
+"""
+
+import sys
+import time
+from multiprocessing import Event, JoinableQueue, Process
+
+from yt_dlpp.engines.engine import ProgressLineDict
+from yt_dlpp.progress.progress_board import ProgressBoard
+
+
+def _get_progress_line(i: int) -> ProgressLineDict:
+    return ProgressLineDict(
+        video={"id": "dQw4w9WgXcQ", "original_url": "", "title": "Some video"},
+        progress={
+            "downloaded_bytes": i * 1024,
+            "total_bytes": 1024**3,
+            "total_bytes_estimate": "NA",
+            "eta": 12.0,
+            "speed": 1024**2,
+            "elapsed": i / 100,
+        },
+    )
+
+
+def _drain_queue(queue: JoinableQueue) -> None:
+    while (item := queue.get()) is not None:
+        queue.task_done()
+    queue.task_done()
+
+
+def _poll_board(board: ProgressBoard, stop: Event) -> None:
+    while not stop.is_set():
+        board.read()
+        time.sleep(0.2)
+
+
+def _bench_queue(progress_lines: list[ProgressLineDict]) -> float:
+    """Send the progress lines through a queue, return the duration until drained"""
+    queue = JoinableQueue()
+    consumer = Process(target=_drain_queue, args=(queue,), daemon=True)
+    consumer.start()
+    start = time.perf_counter()
+    for progress_line in progress_lines:
+        queue.put(progress_line)
+    queue.put(None)
+    queue.join()
+    duration = time.perf_counter() - start
+    consumer.join()
+    return duration
+
+
+def _bench_board(progress_lines: list[ProgressLineDict]) -> float:
+    """Write the progress lines to a board slot, return the duration"""
+    board = ProgressBoard(1)
+    stop = Event()
+    consumer = Process(target=_poll_board, args=(board, stop), daemon=True)
+    consumer.start()
+    slot = board.claim_slot()
+    start = time.perf_counter()
+    for progress_line in progress_lines:
+        board.write(slot, progress_line)
+    duration = time.perf_counter() - start
+    stop.set()
+    consumer.join()
+    board.unlink()
+    return duration
+
+
+def main() -> None:
+    n_updates = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    progress_lines = [_get_progress_line(i) for i in range(n_updates)]
+    for name, bench in (("queue", _bench_queue), ("board", _bench_board)):
+        duration = bench(progress_lines)
+        print(
+            f"{name:>6}: {duration:6.2f} s total, "
+            f"{duration / n_updates * 1e6:6.2f} µs per update"
+        )
+
+
+if __name__ == "__main__":
+    main()
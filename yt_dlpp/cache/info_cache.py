@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import zlib
+from multiprocessing import Value
+from time import time
+from typing import Iterable, Literal, Optional
+
+InfoCacheMode = Literal["use", "refresh"]
+
+# Expiry timestamp of a signed media url, eg. googlevideo.com's ?expire=1700000000
+_EXPIRE_PATTERN = re.compile(r"[?&/]expire[=/](\d+)")
+
+
+def get_default_info_cache_path() -> str:
+    """Get the default path of the info cache database"""
+    cache_home = os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "yt-dlpp", "info-cache.sqlite")
+
+
+class InfoCache:
+    """
+    On-disk cache of yt-dlp info extraction results, shared by the info workers
+
+    - Video infojsons are stored once, keyed by their url.
+    - Expansions store the list of infos that an input url (or range of playlist items)
+      produced, and playlist counts store the result of probing a playlist.
+    - Every key is scoped to the yt-dlp args that affect extraction.
+    - Entries expire after a TTL, and the least recently used ones are evicted
+      when the total size exceeds the budget.
+    - Infos with signed format urls also expire a margin before the earliest of
+      these urls, so that they are never replayed to download from an expired url.
+    - Every input url lookup counts as one hit or miss,
+      the counters are shared between processes.
+    """
+
+    _EXPIRY_MARGIN = 30 * 60
+
+    _path: str
+    _mode: InfoCacheMode
+    _ttl: float
+    _max_size: int
+    _scope: str
+    _cached_connection: Optional[sqlite3.Connection] = None
+
+    def __init__(
+        self,
+        path: str,
+        mode: InfoCacheMode,
+        ttl: float,
+        max_size: int,
+        scope: str,
+    ) -> None:
+        self._path = path
+        self._mode = mode
+        self._ttl = ttl
+        self._max_size = max_size
+        self._scope = scope
+        self.hits = Value("L", 0)
+        self.misses = Value("L", 0)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # --- Protected methods
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        """Get the process' connection to the database"""
+        if self._cached_connection is None:
+            # The threads of the asyncio runtime share the connection
+            connection = sqlite3.connect(
+                self._path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, "
+                "data BLOB NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "accessed_at REAL NOT NULL, "
+                "expires_at REAL)"
+            )
+            # Caches written before the expiry of format urls was recorded are cleared,
+            # their format urls may have expired
+            columns = {
+                row[1] for row in connection.execute("PRAGMA table_info(entries)")
+            }
+            if "expires_at" not in columns:
+                connection.execute("DELETE FROM entries")
+                connection.execute("ALTER TABLE entries ADD COLUMN expires_at REAL")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)"
+            )
+            self._cached_connection = connection
+        return self._cached_connection
+
+    def _key(self, kind: str, url: str, playlist_items: Optional[str] = None) -> str:
+        """Get the key of a cache entry"""
+        key = f"{self._scope}:{kind}:{url}"
+        if playlist_items is not None:
+            key += f"#{playlist_items}"
+        return key
+
+    def _count(self, hit: bool) -> None:
+        """Count a cache hit or miss"""
+        counter = self.hits if hit else self.misses
+        with counter.get_lock():
+            counter.value += 1
+
+    def _get(self, keys: list[str]) -> Optional[list[bytes]]:
+        """Get the data of fresh entries, in order, or None if any is missing"""
+        if self._mode != "use":
+            return None
+        now = time()
+        min_created_at = now - self._ttl
+        found: dict[str, bytes] = {}
+        try:
+            # SQLite limits the number of query parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key, data FROM entries "
+                    f"WHERE key IN ({placeholders}) AND created_at >= ? "
+                    f"AND (expires_at IS NULL OR expires_at > ?)",
+                    (*chunk, min_created_at, now),
+                )
+                found.update(rows)
+            if len(found) < len(set(keys)):
+                return None
+            self._connection.executemany(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?",
+                ((now, key) for key in found),
+            )
+        except sqlite3.Error as e:
+            logging.warning("Failed to read from the info cache: %s", e)
+            return None
+        return [found[key] for key in keys]
+
+    def _put(self, key: str, value: bytes, expires_at: Optional[float] = None) -> None:
+        """Store an entry, fresh until it expires if given"""
+        data = zlib.compress(value)
+        now = time()
+        try:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now, expires_at),
+            )
+        except sqlite3.Error as e:
+            logging.warning("Failed to write to the info cache: %s", e)
+
+    def _evict(self) -> None:
+        """Evict expired entries, then least recently used ones to fit the budget"""
+        try:
+            connection = self._connection
+            now = time()
+            connection.execute(
+                "DELETE FROM entries WHERE created_at < ? OR expires_at <= ?",
+                (now - self._ttl, now),
+            )
+            (total_size,) = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+            if total_size <= self._max_size:
+                return
+            evicted = []
+            for key, size in connection.execute(
+                "SELECT key, size FROM entries ORDER BY accessed_at"
+            ):
+                evicted.append((key,))
+                total_size -= size
+                if total_size <= self._max_size:
+                    break
+            logging.debug("Evicting %d info cache entries", len(evicted))
+            connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        except sqlite3.Error as e:
+            logging.warning("Failed to evict from the info cache: %s", e)
+
+    # --- Public methods
+
+    def get_infos(
+        self, url: str, playlist_items: Optional[str] = None
+    ) -> Optional[list[str]]:
+        """Get the infojsons produced by an input url, or None on a miss"""
+        expansion = self._get([self._key("expansion", url, playlist_items)])
+        info_jsons = None
+        if expansion is not None:
+            info_urls = json.loads(zlib.decompress(expansion[0]))
+            infos = self._get([self._key("info", info_url) for info_url in info_urls])
+            if infos is not None:
+                info_jsons = [zlib.decompress(info).decode() for info in infos]
+        self._count(info_jsons is not None)
+        return info_jsons
+
+    def put_info(self, info_url: str, info_json: str) -> None:
+        """Store a video infojson, until its earliest signed url expires"""
+        expires_at = None
+        expiries = [int(expiry) for expiry in _EXPIRE_PATTERN.findall(info_json)]
+        if len(expiries) > 0:
+            expires_at = min(expiries) - self._EXPIRY_MARGIN
+        self._put(self._key("info", info_url), info_json.encode(), expires_at)
+
+    def put_expansion(
+        self, url: str, playlist_items: Optional[str], info_urls: Iterable[str]
+    ) -> None:
+        """Store the urls of the infos produced by an input url"""
+        value = json.dumps(list(info_urls)).encode()
+        self._put(self._key("expansion", url, playlist_items), value)
+        self._evict()
+
+    def get_playlist_count(self, url: str) -> Optional[int]:
+        """
+        Get the entry count of a probed playlist, or None on a miss.
+        Not counted, it is looked up after the infos of the url missed.
+        """
+        data = self._get([self._key("count", url)])
+        return None if data is None else int(zlib.decompress(data[0]))
+
+    def put_playlist_count(self, url: str, count: int) -> None:
+        """Store the entry count of a probed playlist"""
+        self._put(self._key("count", url), str(count).encode())
@@ -0,0 +1,78 @@
+import math
+from hashlib import blake2b
+
+
+class _BloomFilter:
+    """Bloom filter sized for a capacity and false positive rate"""
+
+    capacity: int
+    count: int
+
+    _n_bits: int
+    _n_hashes: int
+    _bits: bytearray
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = capacity
+        self.count = 0
+        self._n_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self._n_hashes = max(1, round(self._n_bits / capacity * math.log(2)))
+        self._bits = bytearray((self._n_bits + 7) // 8)
+
+    def _get_positions(self, item: str) -> list[int]:
+        """Get the bit positions of an item, by double hashing"""
+        digest = blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self._n_bits for i in range(self._n_hashes)]
+
+    def add(self, item: str) -> None:
+        for position in self._get_positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._get_positions(item)
+        )
+
+
+class ScalableBloomFilter:
+    """
+    Set-like filter of strings with a bounded false positive rate and a small memory
+    footprint, that grows with the number of items
+
+    - Items are never reported absent if they were added,
+      but may be reported present when they were not (a false positive).
+    - When a filter is full, a bigger one with a tighter error rate is added,
+      so that the compound false positive rate stays under the requested one.
+      (See Almeida et al., "Scalable Bloom Filters")
+    """
+
+    _GROWTH = 2
+    _TIGHTENING = 0.5
+
+    _error_rate: float
+    _filters: list[_BloomFilter]
+
+    def __init__(self, error_rate: float, initial_capacity: int = 10_000) -> None:
+        self._error_rate = error_rate
+        self._filters = [
+            _BloomFilter(initial_capacity, error_rate * (1 - self._TIGHTENING))
+        ]
+
+    def add(self, item: str) -> None:
+        last = self._filters[-1]
+        if last.count >= last.capacity:
+            error_rate = (
+                self._error_rate
+                * (1 - self._TIGHTENING)
+                * self._TIGHTENING ** len(self._filters)
+            )
+            last = _BloomFilter(last.capacity * self._GROWTH, error_rate)
+            self._filters.append(last)
+        last.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        return any(item in bloom_filter for bloom_filter in self._filters)
@@ -0,0 +1,79 @@
+import logging
+import os
+from optparse import OptParseError
+from typing import Any, Optional, Sequence
+
+from yt_dlpp.interceptors.interceptor import DlInterceptor
+
+try:
+    from yt_dlp import YoutubeDL, parse_options
+    from yt_dlp.utils import YoutubeDLError
+except ImportError:
+    YoutubeDL = parse_options = YoutubeDLError = None
+
+
+class OutputTemplate:
+    """
+    Resolver of the files that yt-dlp will download videos to
+
+    - The `-o` and `--paths` args are resolved against a video infojson,
+      like yt-dlp does when downloading it. This requires the yt-dlp package.
+    - Post-processors changing the extension (eg. remuxing) are not accounted for,
+      those videos are then left for yt-dlp to skip.
+    """
+
+    _params: dict[str, Any]
+    _cached_ydl: Optional[YoutubeDL] = None
+
+    def __init__(self, ydl_args: Sequence[str]) -> None:
+        """
+        Create an output template from yt-dlp args.
+
+        Raises ImportError without the yt-dlp package, ValueError on invalid args.
+        """
+        if parse_options is None:
+            raise ImportError("No module named 'yt_dlp'")
+        _, allowed = DlInterceptor().parse_known_args(ydl_args)
+        try:
+            self._params = parse_options(allowed).ydl_opts
+        except OptParseError as e:
+            raise ValueError(str(e)) from e
+        self._params.update(quiet=True, simulate=True)
+
+    @property
+    def _ydl(self) -> YoutubeDL:
+        """Get the YoutubeDL instance used to resolve filenames"""
+        if self._cached_ydl is None:
+            self._cached_ydl = YoutubeDL(self._params)
+        return self._cached_ydl
+
+    def get_filename(self, info_dict: dict[str, Any]) -> Optional[str]:
+        """Get the absolute path of a video's final file, or None if unknown"""
+        try:
+            filename = self._ydl.prepare_filename(info_dict)
+        except YoutubeDLError as e:
+            logging.debug("Failed to resolve the output template: %s", e)
+            return None
+        return os.path.abspath(filename) if filename else None
+
+
+class OutputIndex:
+    """
+    Index of the files already present in the output directories
+
+    - Every directory is listed once, the first time a file is looked up in it.
+    """
+
+    _directories: dict[str, set[str]]
+
+    def __init__(self) -> None:
+        self._directories = {}
+
+    def __contains__(self, filename: str) -> bool:
+        directory, name = os.path.split(filename)
+        if directory not in self._directories:
+            try:
+                self._directories[directory] = set(os.listdir(directory))
+            except OSError:
+                self._directories[directory] = set()
+        return name in self._directories[directory]
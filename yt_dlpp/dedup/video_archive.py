@@ -0,0 +1,64 @@
+import logging
+import os
+import sqlite3
+from hashlib import blake2b
+from typing import Optional
+
+
+class VideoArchive:
+    """
+    Persistent index of downloaded videos, by archive id
+
+    - Archive ids follow yt-dlp's `--download-archive` format: "<extractor> <id>".
+    - Only a 64 bit hash of every id is stored, as the table's integer key,
+      so lookups are a single index seek and nothing is held in memory.
+    - The download workers add videos, the dedup worker looks them up.
+    """
+
+    _path: str
+    _cached_connection: Optional[sqlite3.Connection] = None
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        """Get the process' connection to the archive"""
+        if self._cached_connection is None:
+            # The threads of the asyncio runtime share the connection
+            connection = sqlite3.connect(
+                self._path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS videos (hash INTEGER PRIMARY KEY)"
+            )
+            self._cached_connection = connection
+        return self._cached_connection
+
+    @staticmethod
+    def _hash(archive_id: str) -> int:
+        """Hash an archive id to a signed 64 bit integer"""
+        digest = blake2b(archive_id.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little", signed=True)
+
+    def add(self, archive_id: str) -> None:
+        try:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO videos VALUES (?)", (self._hash(archive_id),)
+            )
+        except sqlite3.Error as e:
+            logging.warning("Failed to add %s to the video archive: %s", archive_id, e)
+
+    def __contains__(self, archive_id: str) -> bool:
+        try:
+            row = self._connection.execute(
+                "SELECT 1 FROM videos WHERE hash = ?", (self._hash(archive_id),)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(
+                "Failed to look %s up in the video archive: %s", archive_id, e
+            )
+            return False
+        return row is not None
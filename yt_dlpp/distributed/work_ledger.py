@@ -0,0 +1,258 @@
+import logging
+from collections import deque
+from itertools import count
+from multiprocessing.managers import BaseManager, Server
+from threading import Lock, Thread
+from time import monotonic
+from typing import Iterator, Optional, TypedDict
+
+from yt_dlpp.engines.engine import ProgressLineDict
+from yt_dlpp.progress.progress_board import get_board_video_id
+from yt_dlpp.workers.download_worker import DownloadEndDict
+from yt_dlpp.workers.info_worker import VideoInfoDict
+
+# Methods of the ledger that agents may call
+AGENT_METHODS = ("get_lease_timeout", "lease", "renew", "complete", "fail")
+
+
+def parse_address(value: str) -> tuple[str, int]:
+    """Parse a [HOST:]PORT address, the host defaulting to localhost"""
+    host, _, port = value.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class LeaseDict(TypedDict):
+    """
+    Video leased to an agent
+
+    - The infojson of the video is sent along, if any,
+      so that the agent doesn't extract it again.
+    """
+
+    lease_id: int
+    item: VideoInfoDict
+    info_json: Optional[str]
+
+
+class LeaseReportDict(TypedDict):
+    """End of a leased video reported by an agent, the error is None if downloaded"""
+
+    item: VideoInfoDict
+    end: DownloadEndDict
+    error: Optional[str]
+
+
+class LeaseStateDict(TypedDict):
+    """Video leased to an agent, until the deadline"""
+
+    item: VideoInfoDict
+    agent: str
+    deadline: float
+
+
+class WorkLedger:
+    """
+    Videos to download, leased to the agents of a coordinator
+
+    - Agents lease videos, and report their end.
+    - Leases last a timeout from the last call of their agent,
+      agents renew them with heartbeats that also carry their progress.
+    - Expired leases (eg. of a dead agent) are reassigned first,
+      late reports of an expired lease are ignored.
+    - Once closed, agents are told that there will be no more videos.
+    - Methods are called concurrently from the threads of the manager's server
+      and from the lease worker, they take the ledger lock.
+    """
+
+    _lock: Lock
+    _lease_timeout: float
+    _pending: deque[VideoInfoDict]
+    _leases: dict[int, LeaseStateDict]
+    _lease_ids: Iterator[int]
+    _agents: dict[str, float]
+    _progress: dict[str, list[ProgressLineDict]]
+    _reports: list[LeaseReportDict]
+    _closed: bool
+    _told_closed: set[str]
+
+    def __init__(self, lease_timeout: float) -> None:
+        self._lock = Lock()
+        self._lease_timeout = lease_timeout
+        self._pending = deque()
+        self._leases = {}
+        self._lease_ids = count()
+        self._agents = {}
+        self._progress = {}
+        self._reports = []
+        self._closed = False
+        self._told_closed = set()
+
+    # --- Protected methods
+
+    def _see(self, agent: str) -> None:
+        """Record that an agent is alive, renewing its leases"""
+        now = monotonic()
+        self._agents[agent] = now
+        for lease in self._leases.values():
+            if lease["agent"] == agent:
+                lease["deadline"] = now + self._lease_timeout
+
+    def _is_alive(self, agent: str, now: float) -> bool:
+        return now - self._agents[agent] < self._lease_timeout
+
+    def _end(self, lease_id: int, end: DownloadEndDict, error: Optional[str]) -> bool:
+        """Record the end of a lease, return whether it was still valid"""
+        with self._lock:
+            lease = self._leases.pop(lease_id, None)
+            if lease is None:
+                return False
+            agent = lease["agent"]
+            self._see(agent)
+            # The progress of the ended video is from a heartbeat sent before it ended,
+            # read from the agent's board
+            video_id = end["video_id"]
+            if video_id is not None:
+                video_id = get_board_video_id(video_id)
+            self._progress[agent] = [
+                progress_line
+                for progress_line in self._progress.get(agent, [])
+                if progress_line["video"]["id"] != video_id
+            ]
+            self._reports.append(
+                LeaseReportDict(item=lease["item"], end=end, error=error)
+            )
+            return True
+
+    # --- Agent methods
+
+    def get_lease_timeout(self) -> float:
+        """Get the seconds after which the leases of a silent agent expire"""
+        return self._lease_timeout
+
+    def lease(self, agent: str, n: int) -> Optional[list[LeaseDict]]:
+        """Lease up to n videos to an agent, return None if there will be no more"""
+        with self._lock:
+            self._see(agent)
+            if self._closed and len(self._pending) == 0:
+                self._told_closed.add(agent)
+                return None
+            leases = []
+            deadline = monotonic() + self._lease_timeout
+            while len(leases) < n and len(self._pending) > 0:
+                item = self._pending.popleft()
+                lease_id = next(self._lease_ids)
+                self._leases[lease_id] = LeaseStateDict(
+                    item=item, agent=agent, deadline=deadline
+                )
+                leases.append(LeaseDict(lease_id=lease_id, item=item, info_json=None))
+
+        # Infojsons are read out of the lock, agents download from the url if missing
+        for lease in leases:
+            item = lease["item"]
+            if item["info_path"] is None:
+                continue
+            try:
+                with open(item["info_path"], "r", encoding="utf-8") as file:
+                    lease["info_json"] = file.read()
+            except OSError as e:
+                logging.warning("Could not read the infojson of a video: %s", e)
+            lease["item"] = VideoInfoDict(**{**item, "info_path": None})
+        return leases
+
+    def renew(self, agent: str, progress_lines: list[ProgressLineDict]) -> None:
+        """Renew the leases of an agent, and record the progress of its downloads"""
+        with self._lock:
+            self._see(agent)
+            self._progress[agent] = progress_lines
+
+    def complete(self, lease_id: int, end: DownloadEndDict) -> bool:
+        """Record that a leased video was downloaded, return whether it counted"""
+        return self._end(lease_id, end, None)
+
+    def fail(self, lease_id: int, end: DownloadEndDict, error: str) -> bool:
+        """Record that a leased video failed, return whether it counted"""
+        return self._end(lease_id, end, error)
+
+    # --- Coordinator methods
+
+    def add(self, item: VideoInfoDict) -> None:
+        """Add a video to lease"""
+        with self._lock:
+            self._pending.append(item)
+
+    def take_reports(self) -> list[LeaseReportDict]:
+        """Take the ends of the leased videos reported since the last call"""
+        with self._lock:
+            reports, self._reports = self._reports, []
+        return reports
+
+    def expire(self) -> list[LeaseStateDict]:
+        """Take back the expired leases to reassign their videos, return them"""
+        now = monotonic()
+        with self._lock:
+            expired_ids = [
+                lease_id
+                for lease_id, lease in self._leases.items()
+                if lease["deadline"] <= now
+            ]
+            expired = [self._leases.pop(lease_id) for lease_id in expired_ids]
+            # Reassigned first, they were leased before the pending ones
+            self._pending.extendleft(reversed([lease["item"] for lease in expired]))
+        return expired
+
+    def get_progress(self) -> list[ProgressLineDict]:
+        """Get the progress of the downloads of the live agents"""
+        now = monotonic()
+        with self._lock:
+            return [
+                progress_line
+                for agent, progress_lines in self._progress.items()
+                if self._is_alive(agent, now)
+                for progress_line in progress_lines
+            ]
+
+    def close(self) -> None:
+        """Tell the agents that ask for videos that there will be no more"""
+        with self._lock:
+            self._closed = True
+
+    def has_waiting_agents(self) -> bool:
+        """Check if live agents were not told yet that the ledger is closed"""
+        now = monotonic()
+        with self._lock:
+            return any(
+                self._is_alive(agent, now) and agent not in self._told_closed
+                for agent in self._agents
+            )
+
+
+class _LedgerServerManager(BaseManager):
+    """Manager serving the work ledger of a coordinator"""
+
+
+class LedgerManager(BaseManager):
+    """
+    Manager connecting an agent to the work ledger of a coordinator, over TCP
+
+    - Calls are authenticated with the cluster key, but their data is pickled,
+      so only trusted agents must know the key.
+    """
+
+
+LedgerManager.register("get_ledger")
+
+
+def serve_ledger(ledger: WorkLedger, address: tuple[str, int], key: bytes) -> Server:
+    """Serve a ledger to the agents from threads of the current process"""
+    _LedgerServerManager.register(
+        "get_ledger", callable=lambda: ledger, exposed=AGENT_METHODS
+    )
+    server = _LedgerServerManager(address, key).get_server()
+    Thread(target=server.serve_forever, name="LedgerServer", daemon=True).start()
+    return server
+
+
+def stop_ledger_server(server: Server) -> None:
+    """Stop serving a ledger, closing the connections of the agents"""
+    server.stop_event.set()
+    server.listener.close()
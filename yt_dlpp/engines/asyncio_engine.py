@@ -0,0 +1,93 @@
+import asyncio
+import sys
+from asyncio import AbstractEventLoop, StreamReader
+from asyncio.subprocess import PIPE
+from queue import SimpleQueue
+from time import perf_counter
+from typing import Callable, Optional, Sequence
+
+from yt_dlpp.engines.subprocess_engine import SubprocessEngine
+from yt_dlpp.metrics.pipeline_metrics import SpawnMetrics
+
+# Infojsons are dumped on a single line, that may be far above asyncio's default limit
+_LINE_LIMIT = 64 * 1024 * 1024
+
+
+class AsyncioSubprocessEngine(SubprocessEngine):
+    """
+    Subprocess engine whose yt-dlp processes are managed by an asyncio event loop
+
+    - Operations are still blocking for their caller (a worker thread),
+      but the child processes and their pipes are handled by the loop.
+    - Output lines are passed back to the caller's thread, so that callbacks
+      don't run on the loop.
+    """
+
+    _loop: AbstractEventLoop
+
+    def __init__(
+        self,
+        ydl_args: Sequence[str],
+        flat_playlists: bool,
+        loop: AbstractEventLoop,
+        spawn_metrics: Optional[SpawnMetrics] = None,
+    ) -> None:
+        super().__init__(ydl_args, flat_playlists, spawn_metrics)
+        self._loop = loop
+
+    async def _collect_errors_async(
+        self, stream: StreamReader, quiet: bool, errors: list[str]
+    ) -> None:
+        """Read the stderr of yt-dlp, keeping its error messages"""
+        async for raw_line in stream:
+            line = raw_line.decode("utf-8", errors="replace")
+            if not quiet:
+                sys.stderr.write(line)
+            if (message := self._get_error_message(line)) is not None:
+                errors.append(message)
+
+    async def _stream_command(
+        self,
+        command: Sequence[str],
+        quiet: bool,
+        output_lines: SimpleQueue[Optional[str]],
+    ) -> tuple[int, Optional[str]]:
+        """
+        Run a command, put its output lines in the queue, then None.
+        Return the exit code and the last error message.
+        """
+        try:
+            start = perf_counter()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *command,
+                    stdout=PIPE,
+                    stderr=PIPE,
+                    limit=_LINE_LIMIT,
+                )
+            except OSError:
+                self._record_spawn(start, failed=True)
+                raise
+            self._record_spawn(start)
+            errors = []
+            error_reader = asyncio.ensure_future(
+                self._collect_errors_async(process.stderr, quiet, errors)
+            )
+            async for line in process.stdout:
+                output_lines.put(line.decode("utf-8"))
+            return_code = await process.wait()
+            await error_reader
+            return return_code, errors[-1] if errors else None
+        finally:
+            output_lines.put(None)
+
+    def _run_command(
+        self, command: Sequence[str], on_line: Callable[[str], None], quiet: bool
+    ) -> tuple[int, Optional[str]]:
+        output_lines = SimpleQueue()
+        future = asyncio.run_coroutine_threadsafe(
+            self._stream_command(command, quiet, output_lines), self._loop
+        )
+        while (line := output_lines.get()) is not None:
+            on_line(line)
+        return future.result()
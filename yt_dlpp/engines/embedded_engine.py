@@ -0,0 +1,271 @@
+import json
+from functools import partial
+from optparse import OptParseError
+from typing import Any, Callable, Optional, Sequence
+
+from yt_dlp import YoutubeDL, parse_options
+from yt_dlp.utils import YoutubeDLError
+
+from yt_dlpp.engines.engine import (
+    Engine,
+    EngineError,
+    InfoCallback,
+    ProgressCallback,
+    ProgressLineDict,
+    RateLimitCallback,
+)
+from yt_dlpp.interceptors.interceptor import (
+    DlInterceptor,
+    InfoInterceptor,
+    PostProcessingDeferralInterceptor,
+    PostProcessingInterceptor,
+)
+
+
+class _InfoYoutubeDL(YoutubeDL):
+    """YoutubeDL that passes the infojson of every processed video to a callback"""
+
+    on_info: Optional[Callable[[dict[str, Any], str], None]] = None
+
+    # HACK: Forced printings are where `--dump-json` prints infojsons,
+    # for processed videos as well as for flat playlist entries.
+    # The method is private, so it has to be overriden by its mangled name.
+    def _YoutubeDL__forced_printings(self, info_dict, *args, **kwargs):
+        super()._YoutubeDL__forced_printings(info_dict, *args, **kwargs)
+        if self.on_info is not None:
+            sanitized_info_dict = self.sanitize_info(info_dict)
+            self.on_info(sanitized_info_dict, json.dumps(sanitized_info_dict))
+
+
+class _FetchYoutubeDL(YoutubeDL):
+    """YoutubeDL that downloads videos without post-processing them"""
+
+    # Formats are merged and fixed up by post-processors too.
+    # Downloaded files are not moved either, so that post-processing finds them.
+    def post_process(self, filename, info, files_to_move=None):
+        info["filepath"] = filename
+        return info
+
+
+class EmbeddedEngine(Engine):
+    """
+    Engine that drives yt-dlp through its python API
+
+    - One long-lived YoutubeDL instance is kept per worker process and per operation,
+      which avoids paying the interpreter startup and extractor imports for every item.
+    - CLI args are translated to YoutubeDL params once, when creating the engine.
+    - Progress is reported through progress hooks.
+    """
+
+    _info_params: dict[str, Any]
+    _dl_params: dict[str, Any]
+    _fetch_params: dict[str, Any]
+    _post_process_params: dict[str, Any]
+    _on_progress: Optional[ProgressCallback] = None
+    _get_rate_limit: Optional[RateLimitCallback] = None
+    _cached_info_ydl: Optional[_InfoYoutubeDL] = None
+    _cached_dl_ydl: Optional[YoutubeDL] = None
+    _cached_fetch_ydl: Optional[_FetchYoutubeDL] = None
+    _cached_post_process_ydl: Optional[YoutubeDL] = None
+
+    def __init__(self, ydl_args: Sequence[str], flat_playlists: bool = False) -> None:
+        super().__init__(ydl_args, flat_playlists)
+        self._info_params = self._translate_args(InfoInterceptor())
+        self._info_params.update(simulate=True, quiet=True)
+        if flat_playlists:
+            self._info_params.update(extract_flat="in_playlist")
+        self._dl_params = self._translate_args(DlInterceptor())
+        self._dl_params.update(quiet=True, noprogress=True)
+        self._fetch_params = self._translate_args(
+            DlInterceptor(), PostProcessingInterceptor()
+        )
+        self._fetch_params.update(quiet=True, noprogress=True, fixup="never")
+        # Downloaded files are only fixed up when forced to
+        self._post_process_params = self._translate_args(DlInterceptor())
+        self._post_process_params.update(quiet=True, noprogress=True)
+        if self._post_process_params.get("fixup") is None:
+            self._post_process_params.update(fixup="force")
+
+    def _translate_args(self, *interceptors) -> dict[str, Any]:
+        """Translate the CLI args allowed by all the interceptors to YoutubeDL params"""
+        allowed = self._ydl_args
+        for interceptor in interceptors:
+            _, allowed = interceptor.parse_known_args(allowed)
+        try:
+            return parse_options(allowed).ydl_opts
+        except OptParseError as e:
+            raise EngineError(str(e)) from e
+
+    @property
+    def _info_ydl(self) -> _InfoYoutubeDL:
+        """Get the YoutubeDL instance used for info extraction"""
+        if self._cached_info_ydl is None:
+            self._cached_info_ydl = _InfoYoutubeDL(self._info_params)
+        return self._cached_info_ydl
+
+    @property
+    def _dl_ydl(self) -> YoutubeDL:
+        """Get the YoutubeDL instance used for downloads"""
+        if self._cached_dl_ydl is None:
+            ydl = YoutubeDL(self._dl_params)
+            ydl.add_progress_hook(partial(self._progress_hook, ydl))
+            self._cached_dl_ydl = ydl
+        return self._cached_dl_ydl
+
+    @property
+    def _fetch_ydl(self) -> _FetchYoutubeDL:
+        """Get the YoutubeDL instance used for downloads without post-processing"""
+        if self._cached_fetch_ydl is None:
+            ydl = _FetchYoutubeDL(self._fetch_params)
+            ydl.add_progress_hook(partial(self._progress_hook, ydl))
+            self._cached_fetch_ydl = ydl
+        return self._cached_fetch_ydl
+
+    @property
+    def _post_process_ydl(self) -> YoutubeDL:
+        """Get the YoutubeDL instance used for post-processing"""
+        if self._cached_post_process_ydl is None:
+            self._cached_post_process_ydl = YoutubeDL(self._post_process_params)
+        return self._cached_post_process_ydl
+
+    def _apply_rate_limit(self, ydl: YoutubeDL) -> None:
+        """Update the rate limit of the running download, if limited"""
+        # Downloaders read it from the params for every chunk
+        if self._get_rate_limit is not None:
+            ydl.params["ratelimit"] = max(self._get_rate_limit(), 1)
+
+    def _progress_hook(self, ydl: YoutubeDL, status: dict[str, Any]) -> None:
+        """Convert a yt-dlp progress status to a progress line"""
+        self._apply_rate_limit(ydl)
+        if self._on_progress is None:
+            return
+        info = status.get("info_dict", {})
+        progress_line: ProgressLineDict = {
+            "video": {key: info.get(key) for key in ("id", "original_url", "title")},
+            "progress": {
+                key: status[key]
+                for key in (
+                    "downloaded_bytes",
+                    "total_bytes",
+                    "total_bytes_estimate",
+                    "eta",
+                    "speed",
+                    "elapsed",
+                )
+                if status.get(key) is not None
+            },
+        }
+        self._on_progress(progress_line)
+
+    def extract_info(
+        self, url: str, on_info: InfoCallback, playlist_items: Optional[str] = None
+    ) -> None:
+        ydl = self._info_ydl
+        ydl.on_info = lambda info_dict, info_json: on_info(url, info_dict, info_json)
+        ydl.params["playlist_items"] = playlist_items
+        try:
+            # Videos are only processed (and passed to the callback) in download mode,
+            # the simulate param prevents any actual download.
+            ydl.extract_info(url)
+        except YoutubeDLError as e:
+            raise EngineError(str(e)) from e
+        finally:
+            ydl.on_info = None
+            ydl.params["playlist_items"] = self._info_params.get("playlist_items")
+
+    def probe_playlist(self, url: str, on_info: InfoCallback) -> Optional[int]:
+        ydl = self._info_ydl
+        ydl.on_info = lambda info_dict, info_json: on_info(url, info_dict, info_json)
+        try:
+            # Unprocessed playlists are returned before their entries are resolved
+            ie_result = ydl.extract_info(url, download=False, process=False)
+            if ie_result.get("_type") in ("playlist", "multi_video"):
+                if ie_result.get("playlist_count") is not None:
+                    return ie_result["playlist_count"]
+                if isinstance(ie_result.get("entries"), list):
+                    return len(ie_result["entries"])
+            ydl.process_ie_result(ie_result)
+        except YoutubeDLError as e:
+            raise EngineError(str(e)) from e
+        finally:
+            ydl.on_info = None
+        return None
+
+    def _download(
+        self,
+        ydl: YoutubeDL,
+        run: Callable[[YoutubeDL], int],
+        on_progress: Optional[ProgressCallback],
+        get_rate_limit: Optional[RateLimitCallback] = None,
+    ) -> None:
+        """Run a download with a YoutubeDL instance"""
+        # HACK: The return code is sticky in YoutubeDL, it has to be reset between items
+        ydl._download_retcode = 0
+        self._on_progress = on_progress
+        self._get_rate_limit = get_rate_limit
+        user_rate_limit = ydl.params.get("ratelimit")
+        self._apply_rate_limit(ydl)
+        try:
+            return_code = run(ydl)
+        except YoutubeDLError as e:
+            raise EngineError(str(e)) from e
+        finally:
+            self._on_progress = None
+            self._get_rate_limit = None
+            ydl.params["ratelimit"] = user_rate_limit
+        if return_code != 0:
+            raise EngineError(f"yt-dlp returned code {return_code}")
+
+    def download_info_file(
+        self,
+        info_path: str,
+        on_progress: ProgressCallback,
+        get_rate_limit: Optional[RateLimitCallback] = None,
+    ) -> None:
+        self._download(
+            self._dl_ydl,
+            lambda ydl: ydl.download_with_info_file(info_path),
+            on_progress,
+            get_rate_limit,
+        )
+
+    def download_url(
+        self,
+        url: str,
+        on_progress: ProgressCallback,
+        get_rate_limit: Optional[RateLimitCallback] = None,
+    ) -> None:
+        self._download(
+            self._dl_ydl,
+            lambda ydl: ydl.download([url]),
+            on_progress,
+            get_rate_limit,
+        )
+
+    def can_change_rate_limit(self) -> bool:
+        return True
+
+    def can_defer_post_processing(self) -> bool:
+        interceptor = PostProcessingDeferralInterceptor()
+        return not interceptor.prevents_deferral(self._ydl_args)
+
+    def fetch_info_file(
+        self,
+        info_path: str,
+        on_progress: ProgressCallback,
+        get_rate_limit: Optional[RateLimitCallback] = None,
+    ) -> None:
+        self._download(
+            self._fetch_ydl,
+            lambda ydl: ydl.download_with_info_file(info_path),
+            on_progress,
+            get_rate_limit,
+        )
+
+    def post_process_info_file(self, info_path: str) -> None:
+        # Downloaded files are found by yt-dlp, that only post-processes them
+        self._download(
+            self._post_process_ydl,
+            lambda ydl: ydl.download_with_info_file(info_path),
+            None,
+        )
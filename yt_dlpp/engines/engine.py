@@ -0,0 +1,170 @@
+import json
+from abc import ABC, abstractmethod
+from hashlib import sha256
+from typing import Any, Callable, Literal, Optional, Sequence, TypedDict
+
+from yt_dlpp.interceptors.interceptor import InfoInterceptor
+
+
+class _VideoSubdict(TypedDict):
+    id: str
+    original_url: str
+    title: str
+
+
+class _ProgressSubdict(TypedDict):
+    downloaded_bytes: int
+    total_bytes: int
+    total_bytes_estimate: int
+    eta: Literal["NA"] | float
+    speed: Literal["NA"] | float
+    elapsed: float
+
+
+class ProgressLineDict(TypedDict):
+    video: _VideoSubdict
+    progress: _ProgressSubdict
+
+
+class EngineError(Exception):
+    """Error raised when a yt-dlp operation fails"""
+
+
+# Called with the input url, the parsed video infojson and the raw video infojson
+InfoCallback = Callable[[str, dict[str, Any], str], None]
+# Called with the input url and the error that made its extraction fail
+InfoErrorCallback = Callable[[str, EngineError], None]
+ProgressCallback = Callable[[ProgressLineDict], None]
+# Called for the current rate limit of a download, in bytes per second
+RateLimitCallback = Callable[[], float]
+
+
+class Engine(ABC):
+    """
+    Way of running yt-dlp operations for the workers
+
+    - An engine is created in the main process and copied to every worker,
+      so any heavy state must be created lazily, on first use.
+    - With flat playlists, playlist entries are not extracted
+      and are passed as flat entries (of `_type` "url") instead.
+    """
+
+    _ydl_args: Sequence[str]
+    _flat_playlists: bool
+
+    def __init__(self, ydl_args: Sequence[str], flat_playlists: bool = False) -> None:
+        self._ydl_args = ydl_args
+        self._flat_playlists = flat_playlists
+
+    def get_info_fingerprint(self) -> str:
+        """Get a digest of the args that affect info extraction"""
+        _, allowed = InfoInterceptor().parse_known_args(self._ydl_args)
+        scope = json.dumps([allowed, self._flat_playlists])
+        return sha256(scope.encode()).hexdigest()[:16]
+
+    @abstractmethod
+    def extract_info(
+        self, url: str, on_info: InfoCallback, playlist_items: Optional[str] = None
+    ) -> None:
+        """
+        Extract info from a url (may be a video or a playlist)
+        and pass every video infojson to the callback as soon as it is available.
+
+        If given, only the playlist items matching the spec are extracted
+        (see yt-dlp's `--playlist-items`).
+
+        Raises EngineError if the extraction fails.
+        """
+
+    @abstractmethod
+    def probe_playlist(self, url: str, on_info: InfoCallback) -> Optional[int]:
+        """
+        Get the entry count of a playlist url, without extracting its entries.
+
+        If the url is not a playlist, or its entry count is unknown,
+        it is extracted like with `extract_info` and None is returned.
+
+        Raises EngineError if the extraction fails.
+        """
+
+    def extract_info_batch(
+        self,
+        urls: Sequence[str],
+        on_info: InfoCallback,
+        on_error: InfoErrorCallback,
+    ) -> None:
+        """
+        Extract info from multiple urls, passing every video infojson to the callback
+        along with the input url it comes from.
+
+        A failing url is passed to the error callback and doesn't stop the others.
+        """
+        for url in urls:
+            try:
+                self.extract_info(url, on_info)
+            except EngineError as e:
+                on_error(url, e)
+
+    @abstractmethod
+    def download_info_file(
+        self,
+        info_path: str,
+        on_progress: ProgressCallback,
+        get_rate_limit: Optional[RateLimitCallback] = None,
+    ) -> None:
+        """
+        Download a video from its infojson file, passing progress to the callback.
+
+        If given, the download is limited to the rate given by the callback.
+        Engines that can't change it during a download keep the starting one.
+
+        Raises EngineError if the download fails.
+        """
+
+    @abstractmethod
+    def download_url(
+        self,
+        url: str,
+        on_progress: ProgressCallback,
+        get_rate_limit: Optional[RateLimitCallback] = None,
+    ) -> None:
+        """
+        Download a video from its url, passing progress to the callback.
+        The rate limit callback is used like with `download_info_file`.
+
+        Raises EngineError if the download fails.
+        """
+
+    def can_change_rate_limit(self) -> bool:
+        """Check if running downloads follow the changes of their rate limit"""
+        return False
+
+    def can_defer_post_processing(self) -> bool:
+        """
+        Check if downloads can be split between `fetch_info_file`
+        and `post_process_info_file`
+        """
+        return False
+
+    def fetch_info_file(
+        self,
+        info_path: str,
+        on_progress: ProgressCallback,
+        get_rate_limit: Optional[RateLimitCallback] = None,
+    ) -> None:
+        """
+        Download the media of a video from its infojson, passing progress to the callback.
+        Its post-processing (format merge, fixups and post-processors) is left
+        for `post_process_info_file`, the downloaded files are left in place for it.
+        The rate limit callback is used like with `download_info_file`.
+
+        Raises EngineError if the download fails.
+        """
+        self.download_info_file(info_path, on_progress, get_rate_limit)
+
+    def post_process_info_file(self, info_path: str) -> None:
+        """
+        Post-process a video whose media was downloaded by `fetch_info_file`.
+
+        Raises EngineError if the post-processing fails.
+        """
@@ -0,0 +1,408 @@
+import json
+import logging
+import os
+import sys
+from subprocess import PIPE, Popen
+from threading import Thread
+from time import perf_counter
+from typing import IO, Any, Callable, Optional, Sequence
+
+from yt_dlpp.engines.engine import (
+    Engine,
+    EngineError,
+    InfoCallback,
+    InfoErrorCallback,
+    ProgressCallback,
+    ProgressLineDict,
+    RateLimitCallback,
+)
+from yt_dlpp.interceptors.interceptor import (
+    DlInterceptor,
+    InfoInterceptor,
+    PostProcessingDeferralInterceptor,
+    PostProcessingInterceptor,
+)
+from yt_dlpp.metrics.pipeline_metrics import SpawnMetrics
+
+# Command running yt-dlp
+YT_DLP_COMMAND = ("yt-dlp",)
+
+
+class SubprocessEngine(Engine):
+    """
+    Engine that runs a new yt-dlp process for every operation
+
+    - With spawn metrics, the time taken to start every process is recorded.
+    """
+
+    _spawn_metrics: Optional[SpawnMetrics]
+    _cached_info_base_command: Optional[tuple[str]] = None
+    _cached_dl_allowed_args: Optional[tuple[str]] = None
+    _cached_progress_args: Optional[tuple[str]] = None
+    _cached_dl_base_command: Optional[tuple[str]] = None
+    _cached_fetch_base_command: Optional[tuple[str]] = None
+    _cached_post_process_base_command: Optional[tuple[str]] = None
+
+    def __init__(
+        self,
+        ydl_args: Sequence[str],
+        flat_playlists: bool = False,
+        spawn_metrics: Optional[SpawnMetrics] = None,
+    ) -> None:
+        super().__init__(ydl_args, flat_playlists)
+        self._spawn_metrics = spawn_metrics
+
+    def _record_spawn(self, start: float, failed: bool = False) -> None:
+        """Record the start of a process, begun at the given perf counter time"""
+        if self._spawn_metrics is None:
+            return
+        if failed:
+            self._spawn_metrics.record_failure()
+        else:
+            self._spawn_metrics.record_spawn(perf_counter() - start)
+
+    @property
+    def _info_base_command(self) -> tuple[str]:
+        """Generate the base info extraction command"""
+        if self._cached_info_base_command is None:
+            interceptor = InfoInterceptor()
+            _, allowed = interceptor.parse_known_args(self._ydl_args)
+            self._cached_info_base_command = (
+                *YT_DLP_COMMAND,
+                "--simulate",
+                *(("--flat-playlist",) if self._flat_playlists else ()),
+                *allowed,
+            )
+        return self._cached_info_base_command
+
+    @property
+    def _dl_allowed_args(self) -> tuple[str]:
+        """Get the yt-dlp args allowed for downloads"""
+        if self._cached_dl_allowed_args is None:
+            interceptor = DlInterceptor()
+            _, allowed = interceptor.parse_known_args(self._ydl_args)
+            self._cached_dl_allowed_args = tuple(allowed)
+        return self._cached_dl_allowed_args
+
+    @property
+    def _progress_args(self) -> tuple[str]:
+        """Generate the args making yt-dlp print its progress as JSON lines"""
+        if self._cached_progress_args is None:
+            progress_template = (
+                "{"
+                + '"video": %(info.{id,original_url,title})j,'
+                + '"progress": %(progress.{downloaded_bytes,total_bytes,total_bytes_estimate,eta,speed,elapsed})j'
+                + "}"
+            )
+            self._cached_progress_args = (
+                "--quiet",
+                "--progress",
+                "--newline",
+                "--progress-template",
+                progress_template,
+            )
+        return self._cached_progress_args
+
+    @property
+    def _dl_base_command(self) -> tuple[str]:
+        """Generate the base download command"""
+        if self._cached_dl_base_command is None:
+            self._cached_dl_base_command = (
+                *YT_DLP_COMMAND,
+                *self._progress_args,
+                *self._dl_allowed_args,
+            )
+        return self._cached_dl_base_command
+
+    @property
+    def _fetch_base_command(self) -> tuple[str]:
+        """Generate the base command of downloads without post-processing"""
+        if self._cached_fetch_base_command is None:
+            interceptor = PostProcessingInterceptor()
+            _, allowed = interceptor.parse_known_args(self._dl_allowed_args)
+            # Formats are merged by a post-processor too, that is disabled by hiding ffmpeg.
+            # Warnings are silenced, as yt-dlp warns about it for every merged video.
+            self._cached_fetch_base_command = (
+                *YT_DLP_COMMAND,
+                *self._progress_args,
+                *allowed,
+                "--no-warnings",
+                "--fixup",
+                "never",
+                "--ffmpeg-location",
+                os.devnull,
+            )
+        return self._cached_fetch_base_command
+
+    @property
+    def _post_process_base_command(self) -> tuple[str]:
+        """Generate the base command of post-processing runs"""
+        if self._cached_post_process_base_command is None:
+            # Files that are already downloaded are only fixed up when forced to,
+            # unless the user chose a fixup policy (the last one given wins).
+            self._cached_post_process_base_command = (
+                *YT_DLP_COMMAND,
+                "--quiet",
+                "--no-progress",
+                "--fixup",
+                "force",
+                *self._dl_allowed_args,
+            )
+        return self._cached_post_process_base_command
+
+    @staticmethod
+    def _get_error_message(line: str) -> Optional[str]:
+        """Get the message of a yt-dlp error line, None if it isn't one"""
+        if not line.startswith("ERROR:"):
+            return None
+        return line.removeprefix("ERROR:").strip()
+
+    @staticmethod
+    def _check_return_code(return_code: int, error: Optional[str]) -> None:
+        """Raise an EngineError if a yt-dlp command failed"""
+        if return_code == 0:
+            return
+        message = f"yt-dlp exited with code {return_code}"
+        raise EngineError(message if error is None else f"{message}: {error}")
+
+    def _collect_errors(self, stream: IO[str], quiet: bool, errors: list[str]) -> None:
+        """Read the stderr of yt-dlp, keeping its error messages"""
+        for line in stream:
+            if not quiet:
+                sys.stderr.write(line)
+            if (message := self._get_error_message(line)) is not None:
+                errors.append(message)
+
+    def _run_command(
+        self, command: Sequence[str], on_line: Callable[[str], None], quiet: bool
+    ) -> tuple[int, Optional[str]]:
+        """
+        Run a yt-dlp command, pass every line of its output to the callback
+        as soon as it is available and return the exit code,
+        along with the last error message of yt-dlp if any.
+
+        Errors are only shown if not quiet.
+        """
+        start = perf_counter()
+        try:
+            process = Popen(
+                command,
+                encoding="utf-8",
+                bufsize=1,
+                stdout=PIPE,
+                stderr=PIPE,
+            )
+        except OSError:
+            self._record_spawn(start, failed=True)
+            raise
+        self._record_spawn(start)
+        errors = []
+        error_reader = Thread(
+            target=self._collect_errors,
+            args=(process.stderr, quiet, errors),
+            daemon=True,
+        )
+        error_reader.start()
+        for line in process.stdout:
+            on_line(line)
+        return_code = process.wait()
+        error_reader.join()
+        return return_code, errors[-1] if errors else None
+
+    def _run_info_command(
+        self, args: Sequence[str], on_info: Callable[[dict[str, Any], str], None]
+    ) -> tuple[int, Optional[str]]:
+        """
+        Run a yt-dlp info extraction, pass every video infojson to the callback
+        as soon as it is available and return the exit code and last error
+        """
+
+        # Read the output as it comes.
+        # Playlists are dumped one entry per line, so videos can be passed on
+        # while yt-dlp is still enumerating the rest of the playlist.
+        def handle_line(output_line: str) -> None:
+            stripped_line = output_line.strip()
+            if len(stripped_line) == 0:
+                logging.debug("Empty line from yt-dlp")
+                return
+            try:
+                info_dict = json.loads(stripped_line)
+            except json.JSONDecodeError:
+                logging.debug("Invalid JSON line from yt-dlp: %s", stripped_line)
+                return
+            if not isinstance(info_dict, dict):
+                logging.debug("Invalid parsed value: %s", info_dict)
+                return
+            on_info(info_dict, stripped_line)
+
+        command = (*self._info_base_command, "--dump-json", *args)
+        return self._run_command(command, handle_line, quiet=True)
+
+    def extract_info(
+        self, url: str, on_info: InfoCallback, playlist_items: Optional[str] = None
+    ) -> None:
+        args = (url,) if playlist_items is None else ("-I", playlist_items, url)
+        return_code, error = self._run_info_command(
+            args, lambda info_dict, info_json: on_info(url, info_dict, info_json)
+        )
+        self._check_return_code(return_code, error)
+
+    def probe_playlist(self, url: str, on_info: InfoCallback) -> Optional[int]:
+        # Playlists are enumerated flat and stopped at the first item.
+        # Videos are not affected, and their infojson is dumped as usual.
+        command = (
+            *self._info_base_command,
+            "--dump-single-json",
+            "--flat-playlist",
+            "--playlist-items",
+            "1",
+            url,
+        )
+        output_lines = []
+        return_code, error = self._run_command(command, output_lines.append, quiet=True)
+        self._check_return_code(return_code, error)
+        info_json = "".join(output_lines).strip()
+        try:
+            info_dict = json.loads(info_json)
+        except json.JSONDecodeError as e:
+            raise EngineError(f"Invalid JSON from yt-dlp: {e}") from e
+        if info_dict.get("_type") not in ("playlist", "multi_video"):
+            on_info(url, info_dict, info_json)
+            return None
+        if info_dict.get("playlist_count") is None:
+            self.extract_info(url, on_info)
+            return None
+        return info_dict["playlist_count"]
+
+    @staticmethod
+    def _attribute_info(
+        info_dict: dict[str, Any], url_indices: dict[str, int], current: int
+    ) -> int:
+        """
+        Get the index of the input url that produced a video infojson.
+
+        yt-dlp processes its urls in order, so a video that doesn't reference
+        any of the remaining input urls (eg. playlist entries of a channel url)
+        belongs to the current one.
+        """
+        for key in ("original_url", "playlist_webpage_url"):
+            index: Optional[int] = url_indices.get(info_dict.get(key))
+            if index is not None and index >= current:
+                return index
+        return current
+
+    def extract_info_batch(
+        self,
+        urls: Sequence[str],
+        on_info: InfoCallback,
+        on_error: InfoErrorCallback,
+    ) -> None:
+        if len(urls) == 1:
+            return super().extract_info_batch(urls, on_info, on_error)
+
+        # Run a single yt-dlp for the whole batch.
+        # It continues with the next url when one fails.
+        url_indices: dict[str, int] = {}
+        for i, url in enumerate(urls):
+            url_indices.setdefault(url, i)
+        produced = [False] * len(urls)
+        current = 0
+
+        def handle_info(info_dict: dict[str, Any], info_json: str) -> None:
+            nonlocal current
+            current = self._attribute_info(info_dict, url_indices, current)
+            produced[current] = True
+            on_info(urls[current], info_dict, info_json)
+
+        return_code, _ = self._run_info_command(urls, handle_info)
+        if return_code == 0:
+            return
+
+        # The failing urls are not known, retry the silent ones alone
+        # to get their own error (or output, if they failed transiently).
+        logging.debug("Batch extraction exited with code %d", return_code)
+        silent_urls = [url for url, ok in zip(urls, produced) if not ok]
+        super().extract_info_batch(silent_urls, on_info, on_error)
+
+    def _download(
+        self,
+        base_command: Sequence[str],
+        *target: str,
+        on_progress: ProgressCallback,
+        get_rate_limit: Optional[RateLimitCallback],
+    ) -> None:
+        """Run a yt-dlp download and pass its progress along"""
+
+        # Get progress as soon as a line is available
+        def handle_line(line: str) -> None:
+            parsed_line: ProgressLineDict = json.loads(line)
+            on_progress(parsed_line)
+
+        # yt-dlp can't change its rate limit once started.
+        # Given after the user's args, it replaces their own.
+        rate_args = ()
+        if get_rate_limit is not None:
+            rate_args = ("--limit-rate", str(max(int(get_rate_limit()), 1)))
+        command = (*base_command, *rate_args, *target)
+        return_code, error = self._run_command(command, handle_line, quiet=False)
+        self._check_return_code(return_code, error)
+
+    def download_info_file(
+        self,
+        info_path: str,
+        on_progress: ProgressCallback,
+        get_rate_limit: Optional[RateLimitCallback] = None,
+    ) -> None:
+        self._download(
+            self._dl_base_command,
+            "--load-info-json",
+            info_path,
+            on_progress=on_progress,
+            get_rate_limit=get_rate_limit,
+        )
+
+    def download_url(
+        self,
+        url: str,
+        on_progress: ProgressCallback,
+        get_rate_limit: Optional[RateLimitCallback] = None,
+    ) -> None:
+        self._download(
+            self._dl_base_command,
+            url,
+            on_progress=on_progress,
+            get_rate_limit=get_rate_limit,
+        )
+
+    def can_defer_post_processing(self) -> bool:
+        interceptor = PostProcessingDeferralInterceptor()
+        return not interceptor.prevents_deferral(self._ydl_args)
+
+    def fetch_info_file(
+        self,
+        info_path: str,
+        on_progress: ProgressCallback,
+        get_rate_limit: Optional[RateLimitCallback] = None,
+    ) -> None:
+        # Without ffmpeg, yt-dlp would select a single file format instead,
+        # so the formats selected at extraction are requested explicitly.
+        try:
+            with open(info_path, "r", encoding="utf-8") as file:
+                format_id = json.load(file).get("format_id")
+        except (OSError, json.JSONDecodeError) as e:
+            raise EngineError(f"Invalid infojson: {e}") from e
+        format_args = () if format_id is None else ("--format", format_id)
+        self._download(
+            self._fetch_base_command,
+            *format_args,
+            "--load-info-json",
+            info_path,
+            on_progress=on_progress,
+            get_rate_limit=get_rate_limit,
+        )
+
+    def post_process_info_file(self, info_path: str) -> None:
+        # Downloaded files are found by yt-dlp, that only post-processes them
+        command = (*self._post_process_base_command, "--load-info-json", info_path)
+        return_code, error = self._run_command(command, lambda _: None, quiet=False)
+        self._check_return_code(return_code, error)
@@ -16,6 +16,14 @@ class AbstractInterceptor(ArgumentParser):
                 case tuple():
                     self.add_argument(*arg_or_argtuple)
 
+    def add_intercepted_flags(self, *args: str | tuple[str]):
+        for arg_or_argtuple in args:
+            match arg_or_argtuple:
+                case str():
+                    self.add_argument(arg_or_argtuple, action="store_true")
+                case tuple():
+                    self.add_argument(*arg_or_argtuple, action="store_true")
+
 
 class InputUrlInterceptorNamespace(Namespace):
     """Namespace for yt-dlp URLs interceptor"""
@@ -40,6 +48,65 @@ class InputUrlsInterceptor(AbstractInterceptor):
         return super().parse_known_args(args, namespace)
 
 
+class PlaylistSelectionInterceptorNamespace(Namespace):
+    """Namespace for yt-dlp playlist selection interceptor"""
+
+    playlist_items: str | None
+    playlist_start: str | None
+    playlist_end: str | None
+    playlist_reverse: bool
+    playlist_random: bool
+
+
+class PlaylistSelectionInterceptor(AbstractInterceptor):
+    """Parser to detect yt-dlp args selecting playlist items"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.add_intercepted_arguments(
+            ("--playlist-items", "-I"),
+            "--playlist-start",
+            "--playlist-end",
+        )
+        self.add_intercepted_flags(
+            "--playlist-reverse",
+            "--playlist-random",
+        )
+
+    def parse_known_args(
+        self,
+        args: Optional[Sequence[str]] = None,
+        namespace: Optional[Namespace] = None,
+    ) -> tuple[PlaylistSelectionInterceptorNamespace, list[str]]:
+        return super().parse_known_args(args, namespace)
+
+    def has_selection(self, args: Sequence[str]) -> bool:
+        """Check if the args select playlist items"""
+        selection, _ = self.parse_known_args(args)
+        return any(vars(selection).values())
+
+
+class RateLimitInterceptorNamespace(Namespace):
+    """Namespace for yt-dlp rate limit interceptor"""
+
+    limit_rate: str | None
+
+
+class RateLimitInterceptor(AbstractInterceptor):
+    """Parser to get the rate limit of yt-dlp downloads"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.add_intercepted_arguments(("--limit-rate", "-r"))
+
+    def parse_known_args(
+        self,
+        args: Optional[Sequence[str]] = None,
+        namespace: Optional[Namespace] = None,
+    ) -> tuple[RateLimitInterceptorNamespace, list[str]]:
+        return super().parse_known_args(args, namespace)
+
+
 class _AppInterceptor(AbstractInterceptor):
     """Parser to intercept aruments that are not allowed throughout the app"""
 
@@ -56,6 +123,10 @@ class _AppInterceptor(AbstractInterceptor):
             "--alias",
             "--batch-file",  # This is intercepted by InputUrlInterceptor only
         )
+        self.add_intercepted_flags(
+            "--flat-playlist",  # Flat extraction is managed by yt-dlpp
+            "--no-flat-playlist",
+        )
 
 
 class InfoInterceptor(_AppInterceptor):
@@ -84,3 +155,107 @@ class DlInterceptor(_AppInterceptor):
             "--dump-pages",
             "--print-traffic",
         )
+
+
+class PostProcessingInterceptor(AbstractInterceptor):
+    """Parser to intercept the arguments that post-process downloads"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.add_intercepted_arguments(
+            "--remux-video",
+            "--recode-video",
+            ("--postprocessor-args", "--ppa"),
+            ("--convert-subs", "--convert-sub", "--convert-subtitles"),
+            "--convert-thumbnails",
+            "--audio-format",
+            "--audio-quality",
+            "--exec",
+            "--exec-before-download",
+            "--use-postprocessor",
+            "--sponsorblock-mark",
+            "--sponsorblock-remove",
+            "--remove-chapters",
+            "--parse-metadata",
+            "--replace-in-metadata",
+            "--metadata-from-title",
+            "--concat-playlist",
+            "--fixup",
+            "--ffmpeg-location",
+            "--download-archive",
+        )
+        self.add_intercepted_flags(
+            ("--extract-audio", "-x"),
+            ("--keep-video", "-k"),
+            "--embed-subs",
+            "--embed-thumbnail",
+            ("--embed-metadata", "--add-metadata"),
+            ("--embed-chapters", "--add-chapters"),
+            "--embed-info-json",
+            "--split-chapters",
+            "--force-keyframes-at-cuts",
+            "--xattrs",
+        )
+
+
+class PostProcessingDeferralInterceptorNamespace(Namespace):
+    """Namespace for yt-dlp post-processing deferral interceptor"""
+
+    paths: list[str] | None
+    output: list[str] | None
+    download_sections: str | None
+    downloader: str | None
+    no_part: bool
+    no_continue: bool
+    force_overwrites: bool
+    live_from_start: bool
+
+
+class PostProcessingDeferralInterceptor(AbstractInterceptor):
+    """
+    Parser to detect yt-dlp args that prevent deferring the post-processing of downloads
+
+    - Deferred post-processing runs yt-dlp again on the downloaded files,
+      which must be left in place and not be downloaded again.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.add_argument("--paths", "-P", action="append")
+        self.add_argument("--output", "-o", action="append")
+        self.add_intercepted_arguments(
+            "--download-sections",
+            ("--downloader", "--external-downloader"),
+        )
+        self.add_intercepted_flags(
+            "--no-part",
+            "--no-continue",
+            "--force-overwrites",
+            "--live-from-start",
+        )
+
+    def parse_known_args(
+        self,
+        args: Optional[Sequence[str]] = None,
+        namespace: Optional[Namespace] = None,
+    ) -> tuple[PostProcessingDeferralInterceptorNamespace, list[str]]:
+        return super().parse_known_args(args, namespace)
+
+    def prevents_deferral(self, args: Sequence[str]) -> bool:
+        """Check if the args prevent deferring the post-processing of downloads"""
+        options, _ = self.parse_known_args(args)
+        # Files downloaded to a temporary path are moved away after the download
+        if any(path.lower().startswith("temp:") for path in options.paths or ()):
+            return True
+        if "-" in (options.output or ()):
+            return True
+        return any(
+            (
+                options.download_sections,
+                options.downloader,
+                options.no_part,
+                options.no_continue,
+                options.force_overwrites,
+                options.live_from_start,
+            )
+        )
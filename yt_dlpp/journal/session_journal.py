@@ -0,0 +1,168 @@
+import json
+import os
+import sqlite3
+from multiprocessing import JoinableQueue
+from time import time
+from typing import Any, Literal, Optional, TypedDict
+
+JournalKind = Literal["input", "video"]
+JournalState = Literal[
+    "queued",
+    "extracted",
+    "discovered",
+    "deduplicated",
+    "downloading",
+    "done",
+    "skipped",
+    "failed",
+]
+
+
+class JournalEventDict(TypedDict):
+    """
+    State transition of an input task or a video
+
+    - The info is the JSON of the video a video was discovered with, if any.
+    """
+
+    time: float
+    kind: JournalKind
+    key: str
+    state: JournalState
+    info: Optional[str]
+
+
+def get_default_sessions_dir() -> str:
+    """Get the default directory of the session journals"""
+    state_home = os.getenv("XDG_STATE_HOME") or os.path.expanduser("~/.local/state")
+    return os.path.join(state_home, "yt-dlpp", "sessions")
+
+
+def connect_journal(path: str) -> sqlite3.Connection:
+    """Open a journal database, creating it if needed"""
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS events ("
+        "seq INTEGER PRIMARY KEY, "
+        "time REAL NOT NULL, "
+        "kind TEXT NOT NULL, "
+        "key TEXT NOT NULL, "
+        "state TEXT NOT NULL, "
+        "info TEXT)"
+    )
+    # Journals written before infos were recorded
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(events)")}
+    if "info" not in columns:
+        connection.execute("ALTER TABLE events ADD COLUMN info TEXT")
+    connection.execute("CREATE INDEX IF NOT EXISTS events_key ON events (kind, key)")
+    return connection
+
+
+class SessionJournal:
+    """
+    Append-only journal of a session, recording the state transitions of its items
+
+    - Input tasks go from queued to extracted (or failed),
+      videos go from discovered to deduplicated, downloading and done (or failed),
+      or from discovered to skipped (eg. duplicates or archived videos).
+    - Workers only send events to the journal queue,
+      they are written in batches by the journal worker.
+    - A session is resumed from the tasks that were not extracted
+      and the videos that were not downloaded, with the infos they were
+      discovered with, so that they are deduplicated again like new videos.
+    - A finished session has nothing to resume, its journal is deleted.
+    """
+
+    path: str
+    queue: JoinableQueue
+
+    def __init__(self, path: str, queue: JoinableQueue) -> None:
+        self.path = path
+        self.queue = queue
+
+    # --- Protected methods
+
+    def _get_keys(
+        self, kind: JournalKind, *final_states: JournalState
+    ) -> tuple[set[str], list[str]]:
+        """Get all the keys of a kind, and those that never reached a final state"""
+        placeholders = ", ".join("?" * len(final_states))
+        connection = connect_journal(self.path)
+        try:
+            rows = connection.execute(
+                f"SELECT key, MAX(state IN ({placeholders})) FROM events "
+                "WHERE kind = ? GROUP BY key ORDER BY MIN(seq)",
+                (*final_states, kind),
+            ).fetchall()
+        finally:
+            connection.close()
+        all_keys = {key for key, _ in rows}
+        pending_keys = [key for key, is_final in rows if not is_final]
+        return all_keys, pending_keys
+
+    # --- Public methods
+
+    @staticmethod
+    def get_task_key(task: Any) -> str:
+        """Get the journal key of an input task"""
+        return json.dumps(task, sort_keys=True)
+
+    def record(
+        self,
+        kind: JournalKind,
+        key: str,
+        state: JournalState,
+        info: Optional[dict[str, Any]] = None,
+    ) -> None:
+        """Record the state transition of an item, along with its info if any"""
+        self.queue.put(
+            JournalEventDict(
+                time=time(),
+                kind=kind,
+                key=key,
+                state=state,
+                info=None if info is None else json.dumps(info),
+            )
+        )
+
+    def record_task(self, task: Any, state: JournalState) -> None:
+        """Record the state transition of an input task"""
+        self.record("input", self.get_task_key(task), state)
+
+    def get_tasks(self) -> tuple[set[str], list[Any]]:
+        """Get the keys of all the input tasks, and the tasks left to extract"""
+        all_keys, pending_keys = self._get_keys("input", "extracted")
+        return all_keys, [json.loads(key) for key in pending_keys]
+
+    def get_videos(self) -> tuple[set[str], list[str]]:
+        """Get the urls of all the videos, and those left to download"""
+        return self._get_keys("video", "done", "skipped")
+
+    def get_video_infos(self, video_urls: list[str]) -> dict[str, dict[str, Any]]:
+        """Get the infos some videos were last discovered with, by url"""
+        connection = connect_journal(self.path)
+        try:
+            rows = connection.execute(
+                "SELECT key, info FROM events "
+                "WHERE kind = 'video' AND info IS NOT NULL ORDER BY seq"
+            ).fetchall()
+        finally:
+            connection.close()
+        wanted = set(video_urls)
+        return {key: json.loads(info) for key, info in rows if key in wanted}
+
+    def is_finished(self) -> bool:
+        """Check if all input tasks were extracted, and all videos downloaded or skipped"""
+        _, pending_tasks = self._get_keys("input", "extracted")
+        _, pending_videos = self.get_videos()
+        return len(pending_tasks) == 0 and len(pending_videos) == 0
+
+    def delete(self) -> None:
+        """Delete the journal database, along with its WAL files"""
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.path + suffix)
+            except FileNotFoundError:
+                pass
@@ -1,16 +1,63 @@
 import logging
+import os
+import re
+import secrets
 import sys
 from argparse import ArgumentParser, Namespace
-from multiprocessing import JoinableQueue, cpu_count
+from datetime import datetime
+from itertools import chain
+from multiprocessing import cpu_count
 from os import getenv
-from typing import Optional, Sequence
+from tempfile import TemporaryDirectory
+from typing import Any, Iterable, Iterator, Optional, Sequence, TypedDict
 
-from yt_dlpp.interceptors.interceptor import InputUrlsInterceptor
+from yt_dlpp.cache.info_cache import InfoCache, get_default_info_cache_path
+from yt_dlpp.dedup.bloom_filter import ScalableBloomFilter
+from yt_dlpp.dedup.output_index import OutputIndex, OutputTemplate
+from yt_dlpp.dedup.video_archive import VideoArchive
+from yt_dlpp.distributed.work_ledger import parse_address
+from yt_dlpp.engines.asyncio_engine import AsyncioSubprocessEngine
+from yt_dlpp.engines.engine import Engine, EngineError
+from yt_dlpp.engines.subprocess_engine import SubprocessEngine
+from yt_dlpp.interceptors.interceptor import (
+    InputUrlsInterceptor,
+    PlaylistSelectionInterceptor,
+    RateLimitInterceptor,
+)
+from yt_dlpp.journal.session_journal import SessionJournal, get_default_sessions_dir
+from yt_dlpp.metrics.metered_queue import MeteredJoinableQueue
+from yt_dlpp.metrics.metrics_exporter import MetricsExporter
+from yt_dlpp.metrics.pipeline_metrics import (
+    PipelineMetrics,
+    QueueMetrics,
+    SpawnMetrics,
+    StageMetrics,
+)
+from yt_dlpp.metrics.profiler import WorkerProfiler
+from yt_dlpp.metrics.trace import Tracer
+from yt_dlpp.progress.progress_board import ProgressBoard
+from yt_dlpp.scheduling.bandwidth import BandwidthBudget, parse_rate
+from yt_dlpp.scheduling.concurrency import AimdController, ConcurrencyGate
+from yt_dlpp.scheduling.download_order import DOWNLOAD_ORDERS
+from yt_dlpp.scheduling.host_limiter import HostLimitDict, HostLimiter, host_limit
+from yt_dlpp.workers.agent_worker import AgentWorker
+from yt_dlpp.workers.async_runtime import (
+    AsyncQueue,
+    AsyncRuntime,
+    AsyncWorkerPool,
+    ThreadQueue,
+    ThreadWorker,
+)
 from yt_dlpp.workers.dedup_worker import DedupWorker
 from yt_dlpp.workers.download_worker import DownloadWorker
-from yt_dlpp.workers.info_worker import InfoWorker
+from yt_dlpp.workers.info_worker import InfoTask, InfoWorker, VideoInfoDict
+from yt_dlpp.workers.journal_worker import JournalWorker
+from yt_dlpp.workers.lease_worker import LeaseWorker
+from yt_dlpp.workers.post_process_worker import PostProcessWorker
 from yt_dlpp.workers.progress_worker import ProgressWorker
-from yt_dlpp.workers.worker import WorkerInterface, WorkerPool
+from yt_dlpp.workers.retry_worker import RetryWorker
+from yt_dlpp.workers.scheduler_worker import SchedulerWorker
+from yt_dlpp.workers.worker import Worker, WorkerInterface, WorkerPool
 
 
 def _setup_logging() -> None:
@@ -23,11 +70,327 @@ def _setup_logging() -> None:
     )
 
 
+def _create_engine(
+    name: str,
+    ytdlp_args: Sequence[str],
+    flat_playlists: bool,
+    runtime: Optional[AsyncRuntime],
+    spawn_metrics: SpawnMetrics,
+) -> Engine:
+    """Create the engine used by workers to run yt-dlp"""
+    match name:
+        case "subprocess" if runtime is not None:
+            return AsyncioSubprocessEngine(
+                ytdlp_args, flat_playlists, runtime.loop, spawn_metrics
+            )
+        case "subprocess":
+            return SubprocessEngine(ytdlp_args, flat_playlists, spawn_metrics)
+        case "embedded" if runtime is not None:
+            logging.error("The embedded engine can't be used with the asyncio runtime")
+            sys.exit(1)
+        case "embedded":
+            try:
+                from yt_dlpp.engines.embedded_engine import EmbeddedEngine
+            except ImportError as e:
+                logging.error("The embedded engine requires the yt-dlp package: %s", e)
+                sys.exit(1)
+            try:
+                return EmbeddedEngine(ytdlp_args, flat_playlists)
+            except EngineError as e:
+                logging.error("Invalid yt-dlp arguments: %s", e)
+                sys.exit(1)
+
+
+def _read_batch_file(path: str) -> Iterator[str]:
+    """
+    Read the urls of a batch file lazily, like yt-dlp does.
+    "-" is stdin, lines starting with "#", ";" or "]" are comments,
+    and so is the rest of a line after a whitespace and "#".
+    """
+    try:
+        file = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    except OSError as e:
+        logging.error("Error reading batch file: %s", e)
+        return
+    try:
+        for line in file:
+            url = line.removeprefix("\ufeff").lstrip()
+            if not url or url.startswith(("#", ";", "]")):
+                continue
+            yield re.split(r"\s#", url, maxsplit=1)[0].rstrip()
+    except (OSError, UnicodeDecodeError) as e:
+        logging.error("Error reading batch file: %s", e)
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+def _create_seen_set(args: "YtdlppParserNamespace") -> Any:
+    """Create a set of seen values, from the dedup backend"""
+    if args.dedup_backend == "set":
+        return set()
+    return ScalableBloomFilter(args.dedup_error_rate)
+
+
+def _unique(values: Iterable[str], seen: Any) -> Iterator[str]:
+    """Yield the values not seen yet"""
+    for value in values:
+        if value not in seen:
+            seen.add(value)
+            yield value
+
+
+def _create_queue(
+    runtime: Optional[AsyncRuntime],
+    maxsize: int,
+    metrics: QueueMetrics,
+    concurrent: bool = False,
+) -> Any:
+    """
+    Create a queue between workers, suited to the runtime.
+    With the asyncio runtime, concurrent queues are processed on the loop.
+    """
+    if runtime is None:
+        return MeteredJoinableQueue(maxsize, metrics)
+    if concurrent:
+        return AsyncQueue(runtime, maxsize, metrics)
+    return ThreadQueue(maxsize, metrics)
+
+
+def _create_pool(
+    runtime: Optional[AsyncRuntime],
+    n: int,
+    klass: type[Worker],
+    *args,
+    metrics: StageMetrics,
+) -> WorkerInterface:
+    """Create a pool of workers suited to the runtime"""
+    if runtime is None:
+        pool = WorkerPool.from_class(n, klass, *args)
+    else:
+        pool = AsyncWorkerPool.from_class(runtime, n, klass, *args)
+    pool.record_metrics(metrics)
+    return pool
+
+
+def _wrap_worker(
+    runtime: Optional[AsyncRuntime], worker: Worker, metrics: StageMetrics
+) -> WorkerInterface:
+    """Wrap a single worker to suit the runtime"""
+    worker.record_metrics(metrics)
+    if runtime is None:
+        return worker
+    return ThreadWorker(worker)
+
+
+class _StageDict(TypedDict):
+    """
+    Workers that are waited for together at shutdown
+
+    - Failed items of the stage are sent back to its first worker by the retry worker,
+      which is the last of the stage's workers.
+    """
+
+    workers: tuple[WorkerInterface, ...]
+    retry_worker: Optional[RetryWorker]
+
+
+def _wait_for_stage(stage: _StageDict) -> None:
+    """
+    Wait until the items of a stage are done, retries included.
+    Retried items go back to the first queue of the stage,
+    so the queues are joined again until no item was retried in the meantime.
+    """
+    queues = [worker.get_input_queue() for worker in stage["workers"]]
+    retry_worker = stage["retry_worker"]
+    while True:
+        n_retried = 0 if retry_worker is None else retry_worker.n_retried.value
+        for queue in queues:
+            queue.join()
+        if retry_worker is None or retry_worker.n_retried.value == n_retried:
+            return
+
+
+def _create_controller(
+    args: "YtdlppParserNamespace",
+) -> tuple[Optional[ConcurrencyGate], Optional[AimdController]]:
+    """Create the controller of active downloads, if asked to"""
+    if not args.adaptive_dl_workers:
+        return None, None
+    if not 1 <= args.min_dl_workers <= args.n_dl_workers:
+        logging.error("--min-dl-workers must be between 1 and --n-dl-workers")
+        sys.exit(1)
+    gate = ConcurrencyGate(args.min_dl_workers)
+    controller = AimdController(
+        gate, args.min_dl_workers, args.n_dl_workers, args.adaptive_period
+    )
+    return gate, controller
+
+
+def _create_budget(
+    args: "YtdlppParserNamespace", ytdlp_args: Sequence[str]
+) -> Optional[BandwidthBudget]:
+    """Create the download rate budget, the user's rate limit caps every share of it"""
+    if args.total_limit_rate is None:
+        return None
+    rate_limit, _ = RateLimitInterceptor().parse_known_args(ytdlp_args)
+    max_share = None
+    if rate_limit.limit_rate is not None:
+        try:
+            max_share = parse_rate(rate_limit.limit_rate)
+        except ValueError as e:
+            logging.error("Invalid yt-dlp arguments: %s", e)
+            sys.exit(1)
+    return BandwidthBudget(args.total_limit_rate, max_share, args.n_dl_workers)
+
+
+def _create_host_limiter(args: "YtdlppParserNamespace") -> Optional[HostLimiter]:
+    """Create the per host limits, if any"""
+    if args.host_concurrency <= 0 and args.host_rate <= 0 and not args.host_limits:
+        return None
+    default_limit = HostLimitDict(
+        concurrency=args.host_concurrency, rate=args.host_rate
+    )
+    return HostLimiter(dict(args.host_limits), default_limit)
+
+
+class _DiagnosticsDict(TypedDict):
+    """Diagnostics of a run, asked for by the user"""
+
+    tracer: Optional[Tracer]
+    profiler: Optional[WorkerProfiler]
+    exporter: Optional[MetricsExporter]
+
+
+def _start_stages(
+    args: "YtdlppParserNamespace",
+    runtime: Optional[AsyncRuntime],
+    metrics: PipelineMetrics,
+    stages: Sequence[_StageDict],
+) -> _DiagnosticsDict:
+    """Start the workers of the stages, with the diagnostics asked for"""
+
+    # Trace the items through the workers, if asked to
+    tracer = None
+    if args.trace is not None:
+        tracer = Tracer()
+        for stage in stages:
+            for worker in stage["workers"]:
+                worker.record_trace(tracer)
+
+    # Profile the workers, if asked to
+    profiler = None
+    if args.profile is not None:
+        try:
+            profiler = WorkerProfiler(args.profile)
+        except OSError as e:
+            logging.error("Could not create the profiles directory: %s", e)
+            sys.exit(1)
+        if runtime is not None and sys.version_info >= (3, 12):
+            logging.warning(
+                "Profiles are partial with the asyncio runtime on Python 3.12+, "
+                "as a single profiler can be active at a time in a process"
+            )
+        for stage in stages:
+            for worker in stage["workers"]:
+                worker.record_profile(profiler)
+
+    # Start the workers
+    logging.debug("Starting workers")
+    for stage in stages:
+        for worker in stage["workers"]:
+            worker.start()
+
+    # Expose the metrics, if asked to
+    exporter = None
+    if args.metrics_port is not None or args.metrics_file is not None:
+        try:
+            exporter = MetricsExporter(
+                metrics, args.metrics_port, args.metrics_file, args.metrics_interval
+            )
+        except OSError as e:
+            logging.error("Could not serve the metrics: %s", e)
+            sys.exit(1)
+        exporter.start()
+        if exporter.url is not None:
+            print(f"Metrics: {exporter.url}")
+
+    return _DiagnosticsDict(tracer=tracer, profiler=profiler, exporter=exporter)
+
+
+def _stop_stages(
+    args: "YtdlppParserNamespace",
+    stages: Sequence[_StageDict],
+    diagnostics: _DiagnosticsDict,
+) -> None:
+    """Wait for every stage to finish, one after the other, then save the diagnostics"""
+    for i, stage in enumerate(stages):
+        logging.debug("Waiting for stage %d to finish", i)
+        # Workers may send items back to their own input (eg. nested playlists),
+        # so their pending items must be done before they are dismissed.
+        _wait_for_stage(stage)
+        for worker in stage["workers"]:
+            kind = type(worker).__name__
+            worker_input_queue = worker.get_input_queue()
+            worker.dismiss()
+            logging.debug("Dismissed %s of stage %d", kind, i)
+            worker_input_queue.close()
+            worker_input_queue.join()
+            logging.debug("%s of stage %d finished", kind, i)
+    logging.debug("All workers finished")
+    if diagnostics["exporter"] is not None:
+        diagnostics["exporter"].stop()
+    if diagnostics["tracer"] is not None:
+        diagnostics["tracer"].save(args.trace)
+        print(f"Trace: {args.trace}")
+    if diagnostics["profiler"] is not None:
+        print(f"Profiles: {diagnostics['profiler'].summarize()}")
+
+
 class YtdlppParserNamespace(Namespace):
     """Namespace for yt-dlpp parser args"""
 
     n_info_workers: int
+    info_batch_size: int
+    info_batch_linger: float
+    playlist_shard_size: int
     n_dl_workers: int
+    adaptive_dl_workers: bool
+    min_dl_workers: int
+    n_pp_workers: int
+    adaptive_period: float
+    host_concurrency: int
+    host_rate: float
+    host_limits: list[tuple[str, HostLimitDict]]
+    download_order: str
+    queue_size: int
+    max_attempts: int
+    retry_delay: float
+    retry_max_delay: float
+    failure_report: Optional[str]
+    engine: str
+    runtime: str
+    progress_refresh_rate: float
+    flat_playlists: bool
+    info_cache: str
+    info_cache_path: str
+    info_cache_ttl: float
+    info_cache_max_size: float
+    dedup_backend: str
+    dedup_error_rate: float
+    video_archive: Optional[str]
+    skip_existing: bool
+    resume: Optional[str]
+    journal: bool
+    metrics_port: Optional[int]
+    metrics_file: Optional[str]
+    metrics_interval: float
+    trace: Optional[str]
+    profile: Optional[str]
+    coordinator: Optional[tuple[str, int]]
+    agent: Optional[tuple[str, int]]
+    cluster_key: Optional[str]
+    lease_timeout: float
 
 
 class YtdlppParser(ArgumentParser):
@@ -45,12 +408,310 @@ class YtdlppParser(ArgumentParser):
             default=cpu_count(),
             help="Number of info workers to use",
         )
+        self.add_argument(
+            "--info-batch-size",
+            type=int,
+            default=1,
+            help="Maximum number of urls an info worker extracts in a single yt-dlp run",
+        )
+        self.add_argument(
+            "--info-batch-linger",
+            type=float,
+            default=0.1,
+            help="Seconds an info worker waits for more urls to fill a batch",
+        )
+        self.add_argument(
+            "--playlist-shard-size",
+            type=int,
+            default=0,
+            help=(
+                "Split playlists bigger than this in ranges of entries, "
+                "extracted in parallel by the info workers (0 to disable)"
+            ),
+        )
+        self.add_argument(
+            "--flat-playlists",
+            action="store_true",
+            help=(
+                "Enumerate playlists without extracting their entries, "
+                "videos are then only extracted when downloading"
+            ),
+        )
         self.add_argument(
             "--n-dl-workers",
             type=int,
             default=cpu_count(),
             help="Number of download workers to use",
         )
+        self.add_argument(
+            "--adaptive-dl-workers",
+            action="store_true",
+            help=(
+                "Vary the number of active downloads between --min-dl-workers "
+                "and --n-dl-workers, following their aggregate throughput"
+            ),
+        )
+        self.add_argument(
+            "--min-dl-workers",
+            type=int,
+            default=1,
+            help="Minimum number of active downloads with --adaptive-dl-workers",
+        )
+        self.add_argument(
+            "--adaptive-period",
+            type=float,
+            default=5,
+            help="Seconds of throughput measured before each change of active downloads",
+        )
+        self.add_argument(
+            "--total-limit-rate",
+            type=parse_rate,
+            default=None,
+            help=(
+                "Maximum download rate of all downloads together in bytes per second "
+                "(eg. 50K or 4.2M), split between the active downloads following "
+                "their speed, --limit-rate still applies to each of them"
+            ),
+        )
+        self.add_argument(
+            "--n-pp-workers",
+            type=int,
+            default=0,
+            help=(
+                "Number of post-processing workers, merging formats and running "
+                "post-processors after downloads, each one in a second yt-dlp run "
+                "(0 to do it in the download workers)"
+            ),
+        )
+        self.add_argument(
+            "--host-concurrency",
+            type=int,
+            default=0,
+            help="Maximum number of simultaneous yt-dlp runs per host (0 for unlimited)",
+        )
+        self.add_argument(
+            "--host-rate",
+            type=float,
+            default=0,
+            help="Maximum number of yt-dlp runs started per second per host (0 for unlimited)",
+        )
+        self.add_argument(
+            "--host-limit",
+            dest="host_limits",
+            metavar="HOST=CONCURRENCY[/RATE]",
+            type=host_limit,
+            action="append",
+            default=[],
+            help="Limits of a host and its subdomains, overriding the defaults",
+        )
+        self.add_argument(
+            "--download-order",
+            choices=tuple(DOWNLOAD_ORDERS),
+            default="fifo",
+            help=(
+                "Order videos are downloaded in: as extracted, smallest first, "
+                "largest first, or interleaving the playlists they come from"
+            ),
+        )
+        self.add_argument(
+            "--queue-size",
+            type=int,
+            default=1000,
+            help=(
+                "Maximum number of items waiting between two stages, "
+                "producers wait for room beyond it (0 for unbounded)"
+            ),
+        )
+        self.add_argument(
+            "--max-attempts",
+            type=int,
+            default=3,
+            help="Number of times an url or video is tried before giving up on it",
+        )
+        self.add_argument(
+            "--retry-delay",
+            type=float,
+            default=5,
+            help="Seconds before the first retry, doubled with every attempt",
+        )
+        self.add_argument(
+            "--retry-max-delay",
+            type=float,
+            default=300,
+            help="Maximum number of seconds before a retry",
+        )
+        self.add_argument(
+            "--failure-report",
+            metavar="FILE",
+            help=(
+                "File the urls and videos that failed for good are appended to, "
+                "as JSON lines (defaults to one next to the session journal)"
+            ),
+        )
+        self.add_argument(
+            "--engine",
+            choices=("subprocess", "embedded"),
+            default="subprocess",
+            help=(
+                "How workers run yt-dlp: a new process per item, "
+                "or a long-lived in-process instance (requires the yt-dlp package)"
+            ),
+        )
+
+        self.add_argument(
+            "--runtime",
+            choices=("processes", "asyncio"),
+            default="processes",
+            help=(
+                "How workers run: one process each, or as tasks of a single process "
+                "driving yt-dlp processes with asyncio (requires the subprocess engine)"
+            ),
+        )
+        self.add_argument(
+            "--progress-refresh-rate",
+            type=float,
+            default=5,
+            help="Number of times per second download progress is redrawn",
+        )
+        self.add_argument(
+            "--info-cache",
+            choices=("off", "use", "refresh", "bypass"),
+            default="off",
+            help=(
+                "How to use the on-disk info cache: ignore it (off, or bypass), "
+                "read and write it, or only write it"
+            ),
+        )
+        self.add_argument(
+            "--info-cache-path",
+            default=get_default_info_cache_path(),
+            help="Path of the info cache database",
+        )
+        self.add_argument(
+            "--info-cache-ttl",
+            type=float,
+            default=6 * 3600,
+            help="Seconds after which cached infos are extracted again",
+        )
+        self.add_argument(
+            "--info-cache-max-size",
+            type=float,
+            default=1024,
+            help="Size in MiB above which the least recently used infos are evicted",
+        )
+
+        self.add_argument(
+            "--dedup-backend",
+            choices=("set", "bloom"),
+            default="set",
+            help=(
+                "How seen videos are remembered: exactly, "
+                "or in a bloom filter using less memory but with false positives"
+            ),
+        )
+        self.add_argument(
+            "--dedup-error-rate",
+            type=float,
+            default=1e-6,
+            help="False positive rate of the bloom filter dedup backend",
+        )
+        self.add_argument(
+            "--video-archive",
+            metavar="FILE",
+            help="Skip the videos recorded in this archive, and record downloaded ones",
+        )
+        self.add_argument(
+            "--skip-existing",
+            action="store_true",
+            help=(
+                "Skip videos whose file already exists before starting their download "
+                "(requires the yt-dlp package)"
+            ),
+        )
+        self.add_argument(
+            "--resume",
+            metavar="SESSION",
+            help="Resume an interrupted session, skipping its completed work",
+        )
+        self.add_argument(
+            "--no-journal",
+            dest="journal",
+            action="store_false",
+            help="Do not record the session in a journal, it can't be resumed then",
+        )
+        self.add_argument(
+            "--metrics-port",
+            type=int,
+            default=None,
+            help=(
+                "Serve live metrics of the pipeline (queue depths, stage latencies, "
+                "throughput) on this local port, in the Prometheus text format"
+            ),
+        )
+        self.add_argument(
+            "--metrics-file",
+            default=None,
+            help="File a JSON snapshot of the pipeline metrics is periodically written to",
+        )
+        self.add_argument(
+            "--metrics-interval",
+            type=float,
+            default=5,
+            help="Seconds between two writes of the metrics file",
+        )
+        self.add_argument(
+            "--trace",
+            metavar="FILE",
+            default=None,
+            help=(
+                "Write the timeline of every item through the workers to this file, "
+                "in the Chrome trace format (open it in Perfetto or chrome://tracing)"
+            ),
+        )
+        self.add_argument(
+            "--profile",
+            metavar="DIR",
+            default=None,
+            help=(
+                "Profile every worker with cProfile, writing a profile per worker "
+                "and a summary merged by stage to this directory"
+            ),
+        )
+        self.add_argument(
+            "--coordinator",
+            metavar="[HOST:]PORT",
+            type=parse_address,
+            default=None,
+            help=(
+                "Extract and deduplicate the videos, but lease them to agents "
+                "downloading them, serving them on this address (port 0 for any)"
+            ),
+        )
+        self.add_argument(
+            "--agent",
+            metavar="HOST:PORT",
+            type=parse_address,
+            default=None,
+            help=(
+                "Download the videos leased by the coordinator on this address "
+                "with the local download workers, instead of urls"
+            ),
+        )
+        self.add_argument(
+            "--cluster-key",
+            default=getenv("YTDLPP_CLUSTER_KEY"),
+            help=(
+                "Secret shared by a coordinator and its agents, generated by the "
+                "coordinator if missing (also set by the YTDLPP_CLUSTER_KEY "
+                "environment variable)"
+            ),
+        )
+        self.add_argument(
+            "--lease-timeout",
+            type=float,
+            default=60,
+            help="Seconds after which the videos of a silent agent are reassigned",
+        )
 
     def parse_known_args(
         self,
@@ -60,6 +721,155 @@ class YtdlppParser(ArgumentParser):
         return super().parse_known_args(args, namespace)
 
 
+def _run_agent(args: YtdlppParserNamespace, ytdlp_args: Sequence[str]) -> None:
+    """Download the videos leased by a coordinator, until it has no more"""
+    if args.cluster_key is None:
+        logging.error("Agents need the --cluster-key of their coordinator")
+        sys.exit(1)
+
+    # Create the runtime that drives the workers
+    runtime = None
+    if args.runtime == "asyncio":
+        runtime = AsyncRuntime(args.n_dl_workers + args.n_pp_workers)
+
+    # Create the engine running yt-dlp for the workers
+    metrics = PipelineMetrics()
+    engine = _create_engine(
+        args.engine,
+        ytdlp_args,
+        args.flat_playlists,
+        runtime,
+        metrics.spawns,
+    )
+    post_processed = args.n_pp_workers > 0 and engine.can_defer_post_processing()
+    if args.n_pp_workers > 0 and not post_processed:
+        logging.info("The yt-dlp options prevent deferring post-processing")
+
+    # Create the local state of downloads, the coordinator owns the rest
+    info_dir = TemporaryDirectory(prefix="yt-dlpp-")
+    progress_board = ProgressBoard(args.n_dl_workers)
+    gate, controller = _create_controller(args)
+    budget = _create_budget(args, ytdlp_args)
+    limiter = _create_host_limiter(args)
+    scheduled = limiter is not None or args.download_order != "fifo"
+    dispatch_gate = ConcurrencyGate(args.n_dl_workers) if scheduled else None
+
+    # Create the queues, download ends and failures are reported by the agent worker
+    logging.debug("Creating queues")
+    queue_size = args.queue_size
+    leased_video_queue = _create_queue(
+        runtime,
+        queue_size,
+        metrics.add_queue("leased_videos"),
+        concurrent=not scheduled,
+    )
+    download_queue = leased_video_queue
+    if scheduled:
+        download_queue = _create_queue(
+            runtime, queue_size, metrics.add_queue("downloads"), concurrent=True
+        )
+    post_process_queue = None
+    if post_processed:
+        post_process_queue = _create_queue(
+            runtime, queue_size, metrics.add_queue("post_processings"), concurrent=True
+        )
+    report_queue = _create_queue(runtime, 0, metrics.add_queue("lease_reports"))
+    progress_queue = _create_queue(
+        runtime, queue_size, metrics.add_queue("download_ends")
+    )
+
+    # Create the workers
+    logging.debug("Creating workers")
+    agent_worker = AgentWorker(
+        args.agent,
+        args.cluster_key.encode("utf-8"),
+        args.n_dl_workers,
+        info_dir.name,
+        progress_board,
+        progress_queue,
+        report_queue,
+        leased_video_queue,
+    )
+    download_workers = ()
+    if scheduled:
+        scheduler = SchedulerWorker(
+            DOWNLOAD_ORDERS[args.download_order](),
+            dispatch_gate,
+            limiter,
+            queue_size,
+            leased_video_queue,
+            download_queue,
+        )
+        download_workers += (
+            _wrap_worker(runtime, scheduler, metrics.add_stage("scheduler")),
+        )
+    download_workers += (
+        _create_pool(
+            runtime,
+            args.n_dl_workers,
+            DownloadWorker,
+            engine,
+            None,
+            None,
+            progress_board,
+            gate,
+            dispatch_gate,
+            limiter,
+            budget,
+            report_queue,
+            post_process_queue,
+            download_queue,
+            report_queue,
+            metrics=metrics.add_stage("download"),
+        ),
+    )
+    if post_processed:
+        download_workers += (
+            _create_pool(
+                runtime,
+                args.n_pp_workers,
+                PostProcessWorker,
+                engine,
+                None,
+                None,
+                report_queue,
+                post_process_queue,
+                report_queue,
+                metrics=metrics.add_stage("post_process"),
+            ),
+        )
+    download_workers += (
+        _wrap_worker(runtime, agent_worker, metrics.add_stage("agent")),
+    )
+    progress_workers = (
+        _wrap_worker(
+            runtime,
+            ProgressWorker(
+                progress_board,
+                args.progress_refresh_rate,
+                controller,
+                budget,
+                progress_queue,
+            ),
+            metrics.add_stage("progress"),
+        ),
+    )
+    stages = [
+        _StageDict(workers=download_workers, retry_worker=None),
+        _StageDict(workers=progress_workers, retry_worker=None),
+    ]
+    diagnostics = _start_stages(args, runtime, metrics, stages)
+
+    # Once the coordinator has no more videos, the agent's leases are all reported
+    print(f"Downloading videos from {args.agent[0]}:{args.agent[1]}...")
+    agent_worker.finished.wait()
+    _stop_stages(args, stages, diagnostics)
+    info_dir.cleanup()
+    progress_board.unlink()
+    if not agent_worker.connected.is_set():
+        sys.exit(1)
+
+
 def main():
     """App entry point"""
 
@@ -76,78 +886,411 @@ def main():
         raw_ydtdlp_args
     )
 
-    # Get the input URLs
-    urls = []
-    if input_urls_args.urls:
-        urls.extend(input_urls_args.urls)
+    # Agents download the videos of a coordinator instead of urls
+    if args.agent is not None:
+        if args.coordinator is not None:
+            logging.error("--coordinator and --agent are mutually exclusive")
+            sys.exit(1)
+        if input_urls_args.urls or input_urls_args.batch_file:
+            logging.warning(
+                "Agents download the videos of their coordinator, ignoring urls"
+            )
+        _run_agent(args, ytdlp_args)
+        return
+
+    # Get the input URLs, the batch file is read as they are sent to the workers
+    urls: Iterable[str] = input_urls_args.urls or ()
     if input_urls_args.batch_file:
         logging.debug("Reading URLs from batch file: %s", input_urls_args.batch_file)
-        try:
-            with open(input_urls_args.batch_file, "r") as file:
-                lines = file.readlines()
-            urls.extend({url for line in lines if (url := line.strip())})
-        except OSError as e:
-            logging.error("Error reading batch file: %s", e)
-    if len(urls) == 0:
+        urls = chain(urls, _read_batch_file(input_urls_args.batch_file))
+    urls = _unique(urls, _create_seen_set(args))
+
+    # Create the runtime that drives the workers
+    runtime = None
+    if args.runtime == "asyncio":
+        runtime = AsyncRuntime(
+            args.n_info_workers + args.n_dl_workers + args.n_pp_workers
+        )
+
+    # Create the metrics of the pipeline, recorded by the workers
+    metrics = PipelineMetrics()
+
+    # Create the journal of the session, or reopen it to resume
+    journal = None
+    tasks: Iterable[InfoTask] = urls
+    seen_videos, pending_videos = set(), []
+    if args.resume is not None:
+        session = args.resume
+        journal_path = os.path.join(get_default_sessions_dir(), f"{session}.sqlite")
+        if not os.path.isfile(journal_path):
+            logging.error("No journal for session %s", session)
+            sys.exit(1)
+        journal_queue = _create_queue(
+            runtime, args.queue_size, metrics.add_queue("journal")
+        )
+        journal = SessionJournal(journal_path, journal_queue)
+        known_tasks, pending_tasks = journal.get_tasks()
+        tasks = chain(
+            pending_tasks,
+            (u for u in urls if SessionJournal.get_task_key(u) not in known_tasks),
+        )
+        seen_videos, pending_videos = journal.get_videos()
+    elif args.journal:
+        session = datetime.now().strftime("%Y%m%d-%H%M%S-") + str(os.getpid())
+        sessions_dir = get_default_sessions_dir()
+        os.makedirs(sessions_dir, exist_ok=True)
+        journal_path = os.path.join(sessions_dir, f"{session}.sqlite")
+        journal_queue = _create_queue(
+            runtime, args.queue_size, metrics.add_queue("journal")
+        )
+        journal = SessionJournal(journal_path, journal_queue)
+    first_task = next(iter(tasks), None)
+    if first_task is None and len(pending_videos) == 0:
+        if args.resume is not None:
+            print(f"Session {args.resume} has nothing left to do")
+            journal.delete()
+            sys.exit(0)
         logging.error("No URLs to process")
         sys.exit(1)
+    if first_task is not None:
+        tasks = chain((first_task,), tasks)
+
+    # Sharding playlists would override the user's own playlist items selection
+    shard_size = args.playlist_shard_size
+    if shard_size > 0 and PlaylistSelectionInterceptor().has_selection(ytdlp_args):
+        logging.warning("Playlist items are selected, playlists will not be sharded")
+        shard_size = 0
+
+    # Create the engine running yt-dlp for the workers
+    engine = _create_engine(
+        args.engine,
+        ytdlp_args,
+        args.flat_playlists,
+        runtime,
+        metrics.spawns,
+    )
+
+    # Post-processing is left to its own workers, so that it doesn't hold download slots
+    post_processed = args.n_pp_workers > 0 and engine.can_defer_post_processing()
+    if args.coordinator is not None:
+        post_processed = False
+    elif args.n_pp_workers > 0 and not post_processed:
+        logging.info("The yt-dlp options prevent deferring post-processing")
+
+    # Create the cache of extracted infos, shared by the info workers
+    cache = None
+    if args.info_cache in ("use", "refresh"):
+        try:
+            cache = InfoCache(
+                args.info_cache_path,
+                args.info_cache,
+                args.info_cache_ttl,
+                int(args.info_cache_max_size * 1024 * 1024),
+                engine.get_info_fingerprint(),
+            )
+        except OSError as e:
+            logging.warning("Info cache disabled, could not be created: %s", e)
+
+    # Create the deduplication state, pending videos are deduplicated again
+    seen = _create_seen_set(args)
+    for video_url in seen_videos.difference(pending_videos):
+        seen.add(video_url)
+    archive = None
+    if args.video_archive is not None:
+        try:
+            archive = VideoArchive(args.video_archive)
+        except OSError as e:
+            logging.error("Could not create the video archive: %s", e)
+            sys.exit(1)
+
+    output_template, output_index = None, None
+    if args.skip_existing:
+        try:
+            output_template = OutputTemplate(ytdlp_args)
+            output_index = OutputIndex()
+        except ImportError as e:
+            logging.warning("Existing files can't be skipped without yt-dlp: %s", e)
+        except ValueError as e:
+            logging.error("Invalid yt-dlp arguments: %s", e)
+            sys.exit(1)
+
+    # Create the directory where video infojsons are passed between workers
+    info_dir = TemporaryDirectory(prefix="yt-dlpp-")
+    logging.debug("Created info directory: %s", info_dir.name)
+
+    # Create the shared memory where download workers publish their progress
+    progress_board = ProgressBoard(args.n_dl_workers)
+
+    # A coordinator leases the videos to its agents, that download them
+    leased = args.coordinator is not None
+    cluster_key = args.cluster_key
+    if leased and cluster_key is None:
+        cluster_key = secrets.token_urlsafe(16)
+        print(f"Cluster key: {cluster_key}")
+
+    # Create the controls of active downloads and their rate, left to the agents
+    gate, controller, budget = None, None, None
+    if not leased:
+        gate, controller = _create_controller(args)
+        budget = _create_budget(args, ytdlp_args)
+
+    # Create the per host limits, counted separately for each stage,
+    # so that info workers waiting for room downstream don't hold up downloads.
+    info_limiter = _create_host_limiter(args)
+    limiter = None if leased else _create_host_limiter(args)
+
+    # Limits and download orders are enforced by a scheduling stage before downloads,
+    # that holds videos back until a download worker is free.
+    scheduled = limiter is not None or args.download_order != "fifo"
+    if leased and scheduled:
+        logging.warning("Videos are leased in the order they are extracted")
+        scheduled = False
+    dispatch_gate = ConcurrencyGate(args.n_dl_workers) if scheduled else None
 
     # Create the queues
     logging.debug("Creating queues")
-    input_url_queue = JoinableQueue()
-    video_url_queue = JoinableQueue()
-    unique_video_url_queue = JoinableQueue()
-    progress_queue = JoinableQueue()
+    queue_size = args.queue_size
+    input_url_queue = _create_queue(
+        runtime, queue_size, metrics.add_queue("input_urls"), concurrent=True
+    )
+    video_url_queue = _create_queue(
+        runtime, queue_size, metrics.add_queue("video_urls")
+    )
+    unique_video_url_queue = _create_queue(
+        runtime,
+        queue_size,
+        metrics.add_queue("unique_video_urls"),
+        concurrent=not (scheduled or leased),
+    )
+    download_queue = unique_video_url_queue
+    if scheduled:
+        download_queue = _create_queue(
+            runtime, queue_size, metrics.add_queue("downloads"), concurrent=True
+        )
+    post_process_queue = None
+    if post_processed:
+        post_process_queue = _create_queue(
+            runtime, queue_size, metrics.add_queue("post_processings"), concurrent=True
+        )
+    progress_queue = _create_queue(
+        runtime, queue_size, metrics.add_queue("download_ends")
+    )
+    # Retry queues are unbounded, so that workers never wait to hand over failures
+    info_retry_queue = _create_queue(runtime, 0, metrics.add_queue("info_retries"))
+    download_retry_queue = _create_queue(
+        runtime, 0, metrics.add_queue("download_retries")
+    )
+
+    # Create the retry workers
+    report_path = args.failure_report
+    if report_path is None and journal is not None:
+        report_path = os.path.join(
+            get_default_sessions_dir(), f"{session}.failures.jsonl"
+        )
+    retry_workers = tuple(
+        RetryWorker(
+            stage,
+            args.max_attempts,
+            args.retry_delay,
+            args.retry_max_delay,
+            report_path,
+            retry_queue,
+            target_queue,
+        )
+        for stage, retry_queue, target_queue in (
+            ("info", info_retry_queue, input_url_queue),
+            ("download", download_retry_queue, unique_video_url_queue),
+        )
+    )
+    info_retry_worker, download_retry_worker = retry_workers
 
     # Create the workers
     logging.debug("Creating workers")
-    workers: tuple[WorkerInterface] = (
-        WorkerPool.from_class(
+    info_workers = (
+        _create_pool(
+            runtime,
             args.n_info_workers,
             InfoWorker,
-            ytdlp_args,
+            engine,
+            info_dir.name,
+            args.info_batch_size,
+            args.info_batch_linger,
+            shard_size,
+            cache,
+            journal,
+            output_template,
+            info_limiter,
+            info_retry_queue,
             input_url_queue,
             video_url_queue,
+            metrics=metrics.add_stage("info"),
         ),
-        DedupWorker(
-            video_url_queue,
-            unique_video_url_queue,
+        _wrap_worker(runtime, info_retry_worker, metrics.add_stage("info_retry")),
+    )
+    dedup_workers = (
+        _wrap_worker(
+            runtime,
+            DedupWorker(
+                seen,
+                archive,
+                output_index,
+                journal,
+                video_url_queue,
+                unique_video_url_queue,
+            ),
+            metrics.add_stage("dedup"),
         ),
-        WorkerPool.from_class(
-            args.n_dl_workers,
-            DownloadWorker,
-            ytdlp_args,
+    )
+    download_workers = ()
+    lease_worker = None
+    if leased:
+        lease_worker = LeaseWorker(
+            args.coordinator,
+            cluster_key.encode("utf-8"),
+            args.lease_timeout,
+            archive,
+            journal,
+            progress_board,
+            download_retry_queue,
             unique_video_url_queue,
             progress_queue,
+        )
+        download_workers += (
+            _wrap_worker(runtime, lease_worker, metrics.add_stage("lease")),
+        )
+    if scheduled:
+        scheduler = SchedulerWorker(
+            DOWNLOAD_ORDERS[args.download_order](),
+            dispatch_gate,
+            limiter,
+            queue_size,
+            unique_video_url_queue,
+            download_queue,
+        )
+        download_workers += (
+            _wrap_worker(runtime, scheduler, metrics.add_stage("scheduler")),
+        )
+    if not leased:
+        download_workers += (
+            _create_pool(
+                runtime,
+                args.n_dl_workers,
+                DownloadWorker,
+                engine,
+                archive,
+                journal,
+                progress_board,
+                gate,
+                dispatch_gate,
+                limiter,
+                budget,
+                download_retry_queue,
+                post_process_queue,
+                download_queue,
+                progress_queue,
+                metrics=metrics.add_stage("download"),
+            ),
+        )
+    if post_processed:
+        download_workers += (
+            _create_pool(
+                runtime,
+                args.n_pp_workers,
+                PostProcessWorker,
+                engine,
+                archive,
+                journal,
+                download_retry_queue,
+                post_process_queue,
+                progress_queue,
+                metrics=metrics.add_stage("post_process"),
+            ),
+        )
+    download_workers += (
+        _wrap_worker(
+            runtime, download_retry_worker, metrics.add_stage("download_retry")
         ),
-        ProgressWorker(
-            progress_queue,
+    )
+    progress_workers = (
+        _wrap_worker(
+            runtime,
+            ProgressWorker(
+                progress_board,
+                args.progress_refresh_rate,
+                controller,
+                budget,
+                progress_queue,
+            ),
+            metrics.add_stage("progress"),
         ),
     )
+    stages = [
+        _StageDict(workers=info_workers, retry_worker=info_retry_worker),
+        _StageDict(workers=dedup_workers, retry_worker=None),
+        _StageDict(workers=download_workers, retry_worker=download_retry_worker),
+        _StageDict(workers=progress_workers, retry_worker=None),
+    ]
+    if journal is not None:
+        journal_worker = JournalWorker(journal.path, 1000, 0.5, journal.queue)
+        journal_workers = (
+            _wrap_worker(runtime, journal_worker, metrics.add_stage("journal")),
+        )
+        stages.append(_StageDict(workers=journal_workers, retry_worker=None))
 
-    # Start the workers
-    logging.debug("Starting workers")
-    for worker in workers:
-        worker.start()
+    # Start the workers, with the diagnostics asked for
+    diagnostics = _start_stages(args, runtime, metrics, stages)
+
+    # Tell the agents where to find the coordinator
+    if lease_worker is not None:
+        lease_worker.ready.wait()
+        if lease_worker.port.value == 0:
+            sys.exit(1)
+        host = args.coordinator[0]
+        print(f"Coordinator: {host}:{lease_worker.port.value}")
 
     # Send the initial URLs to the queue
+    if journal is not None:
+        print(f"Session: {session} (resume with --resume {session})")
     print("Getting video info...")
     logging.debug("Sending initial URLs to the queue")
-    for url in urls:
-        logging.debug("\t %s", url)
-        input_url_queue.put(url)
-
-    # Wait for every step to finish, one after the other
-    for i, worker in enumerate(workers):
-        kind = "WorkerPool" if isinstance(worker, WorkerPool) else "Worker"
-        logging.debug("Waiting for %s %d to finish", kind, i)
-        worker.dismiss()
-        logging.debug("Dismissed %s %d", kind, i)
-        worker_input_queue = worker.get_input_queue()
-        worker_input_queue.close()
-        worker_input_queue.join()
-        logging.debug("%s %d finished", kind, i)
-    logging.debug("All workers finished")
+    for task in tasks:
+        logging.debug("\t %s", task)
+        if journal is not None:
+            journal.record_task(task, "queued")
+        input_url_queue.put(task)
+
+    # Videos left from a resumed session are downloaded again from their url,
+    # deduplicated from the infos they were discovered with: against the archive,
+    # the existing files and the videos extracted again meanwhile.
+    logging.debug("Sending %d pending videos to the queue", len(pending_videos))
+    video_infos = {} if journal is None else journal.get_video_infos(pending_videos)
+    for video_url in pending_videos:
+        video_info = VideoInfoDict(
+            original_url=video_url,
+            archive_id=None,
+            info_path=None,
+            filename=None,
+            size=None,
+            duration=None,
+            source_url=None,
+            lease_id=None,
+        )
+        video_info.update(video_infos.get(video_url, {}))
+        video_url_queue.put(video_info)
+
+    # Wait for every stage to finish, one after the other
+    _stop_stages(args, stages, diagnostics)
+    info_dir.cleanup()
+    progress_board.unlink()
+    if cache is not None:
+        print(f"Info cache: {cache.hits.value} hits, {cache.misses.value} misses")
+    if journal is not None and journal.is_finished():
+        logging.debug("Session %s finished, deleting its journal", session)
+        journal.delete()
+    n_failed = sum(retry_worker.n_failed.value for retry_worker in retry_workers)
+    if n_failed > 0:
+        details = f", see {report_path}" if report_path is not None else ""
+        print(f"Failed: {n_failed} urls or videos{details}")
 
     # If all went well, all of our workers finished
     # The remaining ones will be killed at exit since they're daemon processes
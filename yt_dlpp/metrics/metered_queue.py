@@ -0,0 +1,46 @@
+import multiprocessing
+from multiprocessing.queues import JoinableQueue
+from time import monotonic
+from typing import Any, Optional
+
+from yt_dlpp.metrics.pipeline_metrics import QueueMetrics
+
+
+class MeteredJoinableQueue(JoinableQueue):
+    """
+    JoinableQueue recording its depth and the time items wait in it
+
+    - Items are stamped when put and unwrapped when taken,
+      the monotonic clock being shared by the processes of the machine.
+    - Dismissal signals (None) are not recorded.
+    """
+
+    _metrics: QueueMetrics
+
+    def __init__(self, maxsize: int, metrics: QueueMetrics) -> None:
+        super().__init__(maxsize, ctx=multiprocessing.get_context())
+        self._metrics = metrics
+
+    def __getstate__(self) -> tuple:
+        return super().__getstate__(), self._metrics
+
+    def __setstate__(self, state: tuple) -> None:
+        queue_state, self._metrics = state
+        super().__setstate__(queue_state)
+
+    def put(self, obj: Any, block: bool = True, timeout: Optional[float] = None):
+        super().put((monotonic(), obj), block, timeout)
+        if obj is not None:
+            self._metrics.record_put()
+
+    def get_stamped(
+        self, block: bool = True, timeout: Optional[float] = None
+    ) -> tuple[float, Any]:
+        """Take the next item, with the time it was put at"""
+        put_time, obj = super().get(block, timeout)
+        if obj is not None:
+            self._metrics.record_get(monotonic() - put_time)
+        return put_time, obj
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        return self.get_stamped(block, timeout)[1]
@@ -0,0 +1,246 @@
+import json
+import logging
+import os
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread
+from typing import Any, Optional
+
+from yt_dlpp.metrics.pipeline_metrics import (
+    HistogramDict,
+    MetricsSnapshotDict,
+    PipelineMetrics,
+)
+
+
+def _format_histogram(name: str, labels: str, histogram: HistogramDict) -> list[str]:
+    """Format the samples of a histogram in the Prometheus text format"""
+    separator = "," if labels else ""
+    lines = [
+        f'{name}_bucket{{{labels}{separator}le="{bound}"}} {count}'
+        for bound, count in histogram["buckets"].items()
+    ]
+    braces = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{braces} {histogram['sum']}")
+    lines.append(f"{name}_count{braces} {histogram['count']}")
+    return lines
+
+
+def format_prometheus(snapshot: MetricsSnapshotDict) -> str:
+    """Format a snapshot of the metrics in the Prometheus text format"""
+    stages = snapshot["stages"]
+    queues = snapshot["queues"]
+    spawns = snapshot["spawns"]
+    families = (
+        (
+            "yt_dlpp_uptime_seconds",
+            "gauge",
+            "Seconds since yt-dlpp started",
+            [f"yt_dlpp_uptime_seconds {snapshot['uptime']}"],
+        ),
+        (
+            "yt_dlpp_stage_items_total",
+            "counter",
+            "Items processed by the workers of a stage",
+            [
+                f'yt_dlpp_stage_items_total{{stage="{name}"}} {stage["items"]}'
+                for name, stage in stages.items()
+            ],
+        ),
+        (
+            "yt_dlpp_stage_failures_total",
+            "counter",
+            "Items that failed in a stage",
+            [
+                f'yt_dlpp_stage_failures_total{{stage="{name}"}} {stage["failures"]}'
+                for name, stage in stages.items()
+            ],
+        ),
+        (
+            "yt_dlpp_stage_processing_seconds",
+            "histogram",
+            "Processing time of the items (or batches) of a stage",
+            [
+                line
+                for name, stage in stages.items()
+                for line in _format_histogram(
+                    "yt_dlpp_stage_processing_seconds",
+                    f'stage="{name}"',
+                    stage["processing_seconds"],
+                )
+            ],
+        ),
+        (
+            "yt_dlpp_queue_depth",
+            "gauge",
+            "Items waiting in a queue",
+            [
+                f'yt_dlpp_queue_depth{{queue="{name}"}} {queue["depth"]}'
+                for name, queue in queues.items()
+            ],
+        ),
+        (
+            "yt_dlpp_queue_items_total",
+            "counter",
+            "Items put in a queue",
+            [
+                f'yt_dlpp_queue_items_total{{queue="{name}"}} {queue["puts"]}'
+                for name, queue in queues.items()
+            ],
+        ),
+        (
+            "yt_dlpp_queue_wait_seconds",
+            "histogram",
+            "Time items waited in a queue",
+            [
+                line
+                for name, queue in queues.items()
+                for line in _format_histogram(
+                    "yt_dlpp_queue_wait_seconds",
+                    f'queue="{name}"',
+                    queue["wait_seconds"],
+                )
+            ],
+        ),
+        (
+            "yt_dlpp_spawns_total",
+            "counter",
+            "yt-dlp processes started",
+            [f"yt_dlpp_spawns_total {spawns['spawns']}"],
+        ),
+        (
+            "yt_dlpp_spawn_failures_total",
+            "counter",
+            "yt-dlp processes that could not be started",
+            [f"yt_dlpp_spawn_failures_total {spawns['failures']}"],
+        ),
+        (
+            "yt_dlpp_spawn_seconds",
+            "histogram",
+            "Time taken to start yt-dlp processes",
+            _format_histogram("yt_dlpp_spawn_seconds", "", spawns["spawn_seconds"]),
+        ),
+    )
+    lines = []
+    for name, kind, description, samples in families:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Handler serving the metrics at /metrics"""
+
+    _metrics: PipelineMetrics
+
+    def __init__(self, metrics: PipelineMetrics, *args, **kwargs) -> None:
+        self._metrics = metrics
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self) -> None:
+        if self.path.partition("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = format_prometheus(self._metrics.read()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logging.debug("Metrics request: " + format, *args)
+
+
+class MetricsExporter:
+    """
+    Exposes the pipeline metrics from the main process
+
+    - With a port, a local HTTP server serves them at /metrics,
+      in the Prometheus text format.
+    - With a file, a JSON snapshot is written to it periodically and when stopped.
+      It is replaced atomically, so that readers never see a partial one.
+    - JSON snapshots add the throughput of every stage since the previous one.
+    """
+
+    _metrics: PipelineMetrics
+    _file_path: Optional[str]
+    _interval: float
+    _server: Optional[ThreadingHTTPServer]
+    _stopped: Event
+    _writer: Optional[Thread]
+    _previous: Optional[MetricsSnapshotDict]
+
+    def __init__(
+        self,
+        metrics: PipelineMetrics,
+        port: Optional[int],
+        file_path: Optional[str],
+        interval: float,
+    ) -> None:
+        self._metrics = metrics
+        self._file_path = file_path
+        self._interval = interval
+        self._server = None
+        if port is not None:
+            handler = partial(_MetricsHandler, metrics)
+            self._server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self._stopped = Event()
+        self._writer = None
+        self._previous = None
+
+    @property
+    def url(self) -> Optional[str]:
+        """Url of the metrics endpoint, if served"""
+        if self._server is None:
+            return None
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def _write_file(self) -> None:
+        """Write a JSON snapshot of the metrics to the file"""
+        snapshot = self._metrics.read()
+        previous = self._previous
+        elapsed = snapshot["uptime"]
+        if previous is not None:
+            elapsed = snapshot["time"] - previous["time"]
+        throughput = {}
+        for name, stage in snapshot["stages"].items():
+            n_items = stage["items"]
+            if previous is not None and name in previous["stages"]:
+                n_items -= previous["stages"][name]["items"]
+            throughput[name] = n_items / elapsed if elapsed > 0 else 0.0
+        self._previous = snapshot
+        temp_path = f"{self._file_path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump({**snapshot, "items_per_second": throughput}, file, indent=1)
+            os.replace(temp_path, self._file_path)
+        except OSError as e:
+            logging.warning("Could not write the metrics file: %s", e)
+
+    def _write_periodically(self) -> None:
+        """Write the metrics file every interval until stopped"""
+        while not self._stopped.wait(self._interval):
+            self._write_file()
+
+    def start(self) -> None:
+        if self._server is not None:
+            Thread(
+                target=self._server.serve_forever, name="MetricsServer", daemon=True
+            ).start()
+        if self._file_path is not None:
+            self._writer = Thread(
+                target=self._write_periodically, name="MetricsWriter", daemon=True
+            )
+            self._writer.start()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        if self._writer is not None:
+            self._stopped.set()
+            self._writer.join()
+            self._write_file()
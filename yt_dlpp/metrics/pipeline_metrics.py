@@ -0,0 +1,196 @@
+import time
+from bisect import bisect_left
+from multiprocessing import Array
+from typing import TypedDict
+
+# Upper bounds of the duration histogram buckets, in seconds
+_BUCKET_BOUNDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+# Two counters, then the observation count and sum, then the bucket counts
+_N_COUNTERS = 2
+_COUNT = _N_COUNTERS
+_SUM = _N_COUNTERS + 1
+_BUCKETS = _N_COUNTERS + 2
+_ROW_SIZE = _BUCKETS + len(_BUCKET_BOUNDS) + 1
+
+
+def _format_bound(bound: float) -> str:
+    """Format a bucket bound like Prometheus `le` labels"""
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class HistogramDict(TypedDict):
+    """
+    Distribution of durations, in seconds
+
+    - Buckets are cumulative, keyed by their formatted upper bound.
+    """
+
+    count: int
+    sum: float
+    buckets: dict[str, int]
+
+
+class StageMetricsDict(TypedDict):
+    items: int
+    failures: int
+    processing_seconds: HistogramDict
+
+
+class QueueMetricsDict(TypedDict):
+    depth: int
+    puts: int
+    gets: int
+    wait_seconds: HistogramDict
+
+
+class SpawnMetricsDict(TypedDict):
+    spawns: int
+    failures: int
+    spawn_seconds: HistogramDict
+
+
+class MetricsSnapshotDict(TypedDict):
+    time: float
+    uptime: float
+    stages: dict[str, StageMetricsDict]
+    queues: dict[str, QueueMetricsDict]
+    spawns: SpawnMetricsDict
+
+
+class _MetricsRow:
+    """
+    Two counters and a duration histogram, in shared memory
+
+    - Rows are created by the main process before workers start,
+      and updated by any process.
+    - Every update takes the row lock once, for a few writes.
+    """
+
+    name: str
+
+    _values: Array
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._values = Array("d", _ROW_SIZE)
+
+    def _update(self, counter: int, n: int, seconds: float | None = None) -> None:
+        """Add to a counter, and observe a duration if any"""
+        with self._values.get_lock():
+            values = self._values.get_obj()
+            values[counter] += n
+            if seconds is not None:
+                values[_COUNT] += 1
+                values[_SUM] += seconds
+                values[_BUCKETS + bisect_left(_BUCKET_BOUNDS, seconds)] += 1
+
+    def _read(self) -> tuple[list[int], HistogramDict]:
+        """Get the counters and histogram of the row"""
+        with self._values.get_lock():
+            values = list(self._values.get_obj())
+        buckets = {}
+        total = 0
+        bounds = (*_BUCKET_BOUNDS, float("inf"))
+        for bound, count in zip(bounds, values[_BUCKETS:]):
+            total += int(count)
+            buckets[_format_bound(bound)] = total
+        histogram = HistogramDict(
+            count=int(values[_COUNT]), sum=values[_SUM], buckets=buckets
+        )
+        return [int(value) for value in values[:_N_COUNTERS]], histogram
+
+
+class StageMetrics(_MetricsRow):
+    """Metrics of the workers of a pipeline stage"""
+
+    def record_processing(self, seconds: float, n_items: int = 1) -> None:
+        """Record the processing of items (or of a batch of them)"""
+        self._update(0, n_items, seconds)
+
+    def record_failure(self) -> None:
+        """Record an item that failed"""
+        self._update(1, 1)
+
+    def read(self) -> StageMetricsDict:
+        (items, failures), histogram = self._read()
+        return StageMetricsDict(
+            items=items, failures=failures, processing_seconds=histogram
+        )
+
+
+class QueueMetrics(_MetricsRow):
+    """Metrics of a queue between workers"""
+
+    def record_put(self) -> None:
+        """Record an item put in the queue"""
+        self._update(0, 1)
+
+    def record_get(self, seconds: float) -> None:
+        """Record an item taken from the queue after waiting in it"""
+        self._update(1, 1, seconds)
+
+    def read(self) -> QueueMetricsDict:
+        (puts, gets), histogram = self._read()
+        return QueueMetricsDict(
+            depth=max(puts - gets, 0), puts=puts, gets=gets, wait_seconds=histogram
+        )
+
+
+class SpawnMetrics(_MetricsRow):
+    """Metrics of the yt-dlp processes started by the engine"""
+
+    def record_spawn(self, seconds: float) -> None:
+        """Record a process started in the given time"""
+        self._update(0, 1, seconds)
+
+    def record_failure(self) -> None:
+        """Record a process that could not be started"""
+        self._update(1, 1)
+
+    def read(self) -> SpawnMetricsDict:
+        (spawns, failures), histogram = self._read()
+        return SpawnMetricsDict(
+            spawns=spawns, failures=failures, spawn_seconds=histogram
+        )
+
+
+class PipelineMetrics:
+    """
+    Metrics of the pipeline stages, queues and yt-dlp processes
+
+    - Stages and queues are added by the main process before workers start,
+      and recorded to by the workers.
+    - Recording is always on, it only costs a lock and a few writes per item.
+    """
+
+    stages: dict[str, StageMetrics]
+    queues: dict[str, QueueMetrics]
+    spawns: SpawnMetrics
+
+    _start_time: float
+
+    def __init__(self) -> None:
+        self.stages = {}
+        self.queues = {}
+        self.spawns = SpawnMetrics("spawns")
+        self._start_time = time.time()
+
+    def add_stage(self, name: str) -> StageMetrics:
+        """Add the metrics of a stage"""
+        return self.stages.setdefault(name, StageMetrics(name))
+
+    def add_queue(self, name: str) -> QueueMetrics:
+        """Add the metrics of a queue"""
+        return self.queues.setdefault(name, QueueMetrics(name))
+
+    def read(self) -> MetricsSnapshotDict:
+        """Get a snapshot of all the metrics"""
+        now = time.time()
+        return MetricsSnapshotDict(
+            time=now,
+            uptime=now - self._start_time,
+            stages={name: stage.read() for name, stage in self.stages.items()},
+            queues={name: queue.read() for name, queue in self.queues.items()},
+            spawns=self.spawns.read(),
+        )
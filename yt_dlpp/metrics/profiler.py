@@ -0,0 +1,44 @@
+import os
+import pstats
+import re
+
+# Profiles of the workers, named by stage and index of the worker in it
+_WORKER_PROFILE_PATTERN = re.compile(r"^(?P<stage>.+)-(?P<index>\d+)\.prof$")
+
+
+class WorkerProfiler:
+    """
+    Deterministic profiler of the workers, with a profile per worker
+
+    - Workers profile their main loop, or the items they process with the
+      asyncio runtime, with cProfile in the thread that runs them.
+    - Profiles are dumped when workers are dismissed, named by their stage
+      and their index in it, to be opened with pstats or snakeviz.
+    - Once the workers are done, the main process merges the profiles of every
+      stage, and writes a summary of the functions that took the most time.
+    """
+
+    directory: str
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get_path(self, stage: str, index: int) -> str:
+        """Get the path of the profile of a worker"""
+        return os.path.join(self.directory, f"{stage}-{index}.prof")
+
+    def summarize(self, n_functions: int = 25) -> str:
+        """Merge the profiles of every stage and summarize them, return the summary path"""
+        stages: dict[str, list[str]] = {}
+        for entry in sorted(os.scandir(self.directory), key=lambda e: e.name):
+            if (match := _WORKER_PROFILE_PATTERN.match(entry.name)) is not None:
+                stages.setdefault(match["stage"], []).append(entry.path)
+        summary_path = os.path.join(self.directory, "summary.txt")
+        with open(summary_path, "w", encoding="utf-8") as file:
+            for stage, paths in stages.items():
+                stats = pstats.Stats(*paths, stream=file)
+                stats.dump_stats(os.path.join(self.directory, f"{stage}.prof"))
+                file.write(f"=== {stage} ({len(paths)} workers)\n")
+                stats.sort_stats(pstats.SortKey.TIME).print_stats(n_functions)
+        return summary_path
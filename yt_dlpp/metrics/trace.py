@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import shutil
+import zlib
+from itertools import count
+from multiprocessing import current_process
+from tempfile import mkdtemp
+from time import monotonic
+from typing import Any, Iterator, TextIO
+
+
+def get_item_key(item: Any) -> str:
+    """Get the url (or key) an item of the pipeline is about"""
+    match item:
+        case str():
+            return item
+        case {"original_url": str(url)} | {"url": str(url)} | {"key": str(url)}:
+            return url
+        case {"item": inner}:
+            return get_item_key(inner)
+    return ""
+
+
+class TraceWriter:
+    """
+    Writer of the trace events of a worker, in the Chrome trace format
+
+    - Events are written as JSON lines, line buffered,
+      so that they are not lost when the worker process exits.
+    - Every worker gets its own track, so that idle workers show as gaps.
+    - Processing spans are nested complete events on the worker's track,
+      waits are async events, as the waits of items overlap.
+    """
+
+    _origin: float
+    _file: TextIO
+    _pid: int
+    _tid: int
+    _ids: Iterator[int]
+
+    def __init__(self, origin: float, path: str, worker_name: str) -> None:
+        self._origin = origin
+        self._file = open(path, "a", buffering=1, encoding="utf-8")
+        self._pid = os.getpid()
+        self._tid = zlib.crc32(worker_name.encode("utf-8")) & 0x7FFFFFFF
+        self._ids = count()
+        process_name = current_process().name
+        if process_name == "MainProcess":
+            process_name = "yt-dlpp"
+        self._write({"ph": "M", "name": "process_name", "args": {"name": process_name}})
+        self._write({"ph": "M", "name": "thread_name", "args": {"name": worker_name}})
+
+    def _write(self, event: dict[str, Any]) -> None:
+        event.update(pid=self._pid, tid=self._tid)
+        self._file.write(json.dumps(event) + "\n")
+
+    def _get_timestamp(self, time: float) -> float:
+        """Get the trace timestamp of a monotonic time, in microseconds"""
+        return round((time - self._origin) * 1_000_000, 1)
+
+    def span(
+        self, name: str, start: float, end: float, item: Any, n_items: int = 1
+    ) -> None:
+        """Write the span of an item (or of a batch from it) processed by the worker"""
+        args: dict[str, Any] = {"item": get_item_key(item)}
+        if n_items > 1:
+            args["n_items"] = n_items
+        self._write(
+            {
+                "ph": "X",
+                "cat": "process",
+                "name": name,
+                "ts": self._get_timestamp(start),
+                "dur": round((end - start) * 1_000_000, 1),
+                "args": args,
+            }
+        )
+
+    def wait(self, name: str, start: float, end: float, item: Any) -> None:
+        """Write the span of an item waiting to be processed by the worker"""
+        event_id = f"{self._tid:x}.{next(self._ids)}"
+        args = {"item": get_item_key(item)}
+        for phase, time in (("b", start), ("e", end)):
+            self._write(
+                {
+                    "ph": phase,
+                    "cat": "wait",
+                    "name": name,
+                    "id": event_id,
+                    "ts": self._get_timestamp(time),
+                    "args": args,
+                }
+            )
+
+
+class Tracer:
+    """
+    Recorder of the spans of the items in the pipeline, in the Chrome trace format
+
+    - Workers write their events to their own file of a temporary directory,
+      so that tracing takes no lock and no IPC.
+    - Timestamps are relative to the creation of the tracer,
+      the monotonic clock being shared by the processes of the machine.
+    - Once the workers are done, the main process merges the files
+      into a trace that Perfetto or chrome://tracing can open.
+    """
+
+    _directory: str
+    _origin: float
+
+    def __init__(self) -> None:
+        self._directory = mkdtemp(prefix="yt-dlpp-trace-")
+        self._origin = monotonic()
+
+    def open(self, worker_name: str) -> TraceWriter:
+        """Open the writer of a worker, from the worker's process"""
+        path = os.path.join(self._directory, f"{os.getpid()}-{worker_name}.jsonl")
+        return TraceWriter(self._origin, path, worker_name)
+
+    def save(self, path: str) -> None:
+        """Merge the events of all the workers into a trace file"""
+        events = []
+        for entry in os.scandir(self._directory):
+            with open(entry.path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        events.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # The last line of a killed worker may be partial
+                        continue
+        try:
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+        except OSError as e:
+            logging.error("Could not write the trace: %s", e)
+        shutil.rmtree(self._directory, ignore_errors=True)
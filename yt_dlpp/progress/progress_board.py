@@ -0,0 +1,139 @@
+import math
+import struct
+from multiprocessing import Value
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional
+
+from yt_dlpp.engines.engine import ProgressLineDict
+
+_PROGRESS_KEYS = (
+    "downloaded_bytes",
+    "total_bytes",
+    "total_bytes_estimate",
+    "eta",
+    "speed",
+    "elapsed",
+)
+
+_VIDEO_ID_SIZE = 64
+_TITLE_SIZE = 256
+
+# Sequence number, then active flag, progress values, video id and video title
+_SEQUENCE = struct.Struct("<Q")
+_DATA = struct.Struct(f"<?6d{_VIDEO_ID_SIZE}s{_TITLE_SIZE}s")
+# Slots are aligned on cache lines, so that writers don't contend
+_SLOT_SIZE = math.ceil((_SEQUENCE.size + _DATA.size) / 64) * 64
+_MAX_READ_ATTEMPTS = 1000
+
+
+def get_board_video_id(video_id: str) -> str:
+    """Get a video id as it is read back from a board, truncated to fit in a slot"""
+    return video_id.encode()[:_VIDEO_ID_SIZE].rstrip(b"\0").decode(errors="ignore")
+
+
+class ProgressBoard:
+    """
+    Shared memory array of fixed layout progress slots, one per download worker
+
+    - Every worker claims a slot and is its only writer,
+      so updates need no lock and no allocation on the reader side.
+    - Slots are guarded by a sequence number (a seqlock): it is odd while a slot
+      is being written, and readers retry reads that overlapped a write.
+    - Unknown progress values are stored as NaN.
+    - Video ids and titles are truncated to fit in a slot,
+      ids are compared to the board's with `get_board_video_id`.
+    - The board is created by the main process, which has to unlink it at exit.
+    """
+
+    _n_slots: int
+    _memory: SharedMemory
+    _next_slot: Value
+    _sequences: dict[int, int]
+
+    def __init__(self, n_slots: int) -> None:
+        self._n_slots = n_slots
+        self._memory = SharedMemory(create=True, size=n_slots * _SLOT_SIZE)
+        self._next_slot = Value("i", 0)
+        self._sequences = {}
+
+    def _write(self, slot: int, *values) -> None:
+        """Write the data of a slot"""
+        offset = slot * _SLOT_SIZE
+        sequence = self._sequences.get(slot, 0)
+        _SEQUENCE.pack_into(self._memory.buf, offset, sequence + 1)
+        _DATA.pack_into(self._memory.buf, offset + _SEQUENCE.size, *values)
+        _SEQUENCE.pack_into(self._memory.buf, offset, sequence + 2)
+        self._sequences[slot] = sequence + 2
+
+    def _read(self, slot: int) -> Optional[tuple]:
+        """
+        Read the data of a slot, retrying reads torn by a concurrent write.
+        Return None if the slot stays busy (eg. its writer died while writing).
+        """
+        offset = slot * _SLOT_SIZE
+        for _ in range(_MAX_READ_ATTEMPTS):
+            (sequence,) = _SEQUENCE.unpack_from(self._memory.buf, offset)
+            if sequence % 2 == 1:
+                continue
+            values = _DATA.unpack_from(self._memory.buf, offset + _SEQUENCE.size)
+            if _SEQUENCE.unpack_from(self._memory.buf, offset)[0] == sequence:
+                return values
+        return None
+
+    def claim_slot(self) -> int:
+        """Get a slot that no other process writes to"""
+        with self._next_slot.get_lock():
+            slot = self._next_slot.value
+            self._next_slot.value += 1
+        if slot >= self._n_slots:
+            raise IndexError("All progress board slots are claimed")
+        return slot
+
+    def write(self, slot: int, progress_line: ProgressLineDict) -> None:
+        """Overwrite a slot with the progress of a video"""
+        progress = progress_line["progress"]
+        values = []
+        for key in _PROGRESS_KEYS:
+            try:
+                values.append(float(progress[key]))
+            except (KeyError, TypeError, ValueError):
+                values.append(math.nan)
+        video = progress_line["video"]
+        video_id = get_board_video_id(str(video.get("id") or "")).encode()
+        title = str(video.get("title") or "").encode()[:_TITLE_SIZE]
+        self._write(slot, True, *values, video_id, title)
+
+    def clear(self, slot: int) -> None:
+        """Mark a slot as not reporting any progress"""
+        self._write(slot, False, *(math.nan for _ in _PROGRESS_KEYS), b"", b"")
+
+    def read(self) -> list[ProgressLineDict]:
+        """Get the progress of every active slot"""
+        return list(self.read_slots().values())
+
+    def read_slots(self) -> dict[int, ProgressLineDict]:
+        """Get the progress of every active slot, by slot"""
+        progress_lines = {}
+        for slot in range(self._n_slots):
+            data = self._read(slot)
+            if data is None or not data[0]:
+                continue
+            _, *values, video_id, title = data
+            progress_lines[slot] = ProgressLineDict(
+                video={
+                    "id": video_id.rstrip(b"\0").decode(errors="ignore"),
+                    "original_url": "",
+                    "title": title.rstrip(b"\0").decode(errors="ignore"),
+                },
+                progress={
+                    key: value
+                    for key, value in zip(_PROGRESS_KEYS, values)
+                    if not math.isnan(value)
+                },
+            )
+        return progress_lines
+
+    def unlink(self) -> None:
+        """Release the shared memory, once no process uses the board anymore"""
+        self._memory.close()
+        self._memory.unlink()
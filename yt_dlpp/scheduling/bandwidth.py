@@ -0,0 +1,131 @@
+import math
+import re
+from contextlib import contextmanager
+from multiprocessing import Array, Lock
+from typing import Iterator, Optional
+
+from yt_dlpp.engines.engine import RateLimitCallback
+
+_RATE_PATTERN = re.compile(r"(\d+(?:\.\d+)?)([KMGTPEZY]?)", re.IGNORECASE)
+_RATE_UNITS = "KMGTPEZY"
+
+
+def parse_rate(value: str) -> float:
+    """Parse a rate in bytes per second, with an optional binary unit (eg. 50K, 4.2M)"""
+    match = _RATE_PATTERN.fullmatch(value.strip())
+    if match is None:
+        raise ValueError(f"Invalid rate: {value}")
+    number, unit = match.groups()
+    exponent = _RATE_UNITS.index(unit.upper()) + 1 if unit else 0
+    return float(number) * 1024**exponent
+
+
+class BandwidthBudget:
+    """
+    Download rate shared by the download workers, split between their active downloads
+
+    - Downloads are identified by the progress board slot of their worker.
+    - Shares are max-min fair: downloads that don't use their share
+      (eg. throttled by their server, or finishing) get their speed with some headroom,
+      the rest of the budget is split equally between the others.
+    - Shares are recomputed from the speeds of downloads every time they are observed,
+      and when a download starts or ends.
+    - Shares don't go below a fraction of the equal share,
+      so that downloads that slowed down can speed up again.
+    - Downloads that can't change their rate once started (eg. yt-dlp processes)
+      get a fixed share, of the budget not reserved by the other fixed shares,
+      split between the slots that don't hold one. They keep it until they end,
+      so that the budget is never exceeded.
+    """
+
+    _HEADROOM = 1.25
+    _MIN_USAGE = 0.9
+    _MIN_SHARE = 0.25
+
+    _rate: float
+    _max_share: float
+    _lock: Lock
+    _active: Array
+    _fixed: Array
+    _speeds: Array
+    _shares: Array
+
+    def __init__(self, rate: float, max_share: Optional[float], n_slots: int) -> None:
+        self._rate = rate
+        self._max_share = math.inf if max_share is None else max_share
+        self._lock = Lock()
+        self._active = Array("b", n_slots, lock=False)
+        self._fixed = Array("b", n_slots, lock=False)
+        self._speeds = Array("d", n_slots, lock=False)
+        self._shares = Array("d", n_slots, lock=False)
+
+    def _get_demand(self, slot: int, min_share: float) -> float:
+        """Get the rate a download may use, infinite if it uses most of its share"""
+        speed = self._speeds[slot]
+        if math.isnan(speed) or speed >= self._shares[slot] * self._MIN_USAGE:
+            return self._max_share
+        return min(max(speed * self._HEADROOM, min_share), self._max_share)
+
+    def _rebalance(self) -> None:
+        """
+        Split the budget left by the fixed shares between the other active downloads,
+        the lock must be held
+        """
+        slots = [
+            slot
+            for slot in range(len(self._active))
+            if self._active[slot] and not self._fixed[slot]
+        ]
+        if len(slots) == 0:
+            return
+        unreserved = self._get_unreserved()
+        min_share = unreserved / len(slots) * self._MIN_SHARE
+        demands = {slot: self._get_demand(slot, min_share) for slot in slots}
+        # Smallest demands are served first, the others split what they leave
+        remaining = unreserved
+        for i, slot in enumerate(sorted(slots, key=demands.get)):
+            share = min(demands[slot], remaining / (len(slots) - i))
+            self._shares[slot] = share
+            remaining -= share
+
+    def _get_unreserved(self) -> float:
+        """Get the budget not reserved by fixed shares, the lock must be held"""
+        reserved = sum(
+            self._shares[slot]
+            for slot in range(len(self._active))
+            if self._active[slot] and self._fixed[slot]
+        )
+        return max(self._rate - reserved, 0)
+
+    @contextmanager
+    def share(self, slot: int, fixed: bool = False) -> Iterator[RateLimitCallback]:
+        """
+        Give a share of the budget to a download until the end of the context,
+        yield the callback of its current share.
+        A fixed share doesn't change until the end of the context.
+        """
+        with self._lock:
+            if fixed:
+                n_unfixed = sum(not self._fixed[i] for i in range(len(self._fixed)))
+                self._shares[slot] = min(
+                    self._get_unreserved() / n_unfixed, self._max_share
+                )
+            self._active[slot] = True
+            self._fixed[slot] = fixed
+            self._speeds[slot] = math.nan
+            self._rebalance()
+        try:
+            yield lambda: self._shares[slot]
+        finally:
+            with self._lock:
+                self._active[slot] = False
+                self._fixed[slot] = False
+                self._rebalance()
+
+    def observe(self, speeds: dict[int, float]) -> None:
+        """Update the shares from the speeds of the downloads, unknown ones are missing"""
+        with self._lock:
+            for slot in range(len(self._active)):
+                if self._active[slot]:
+                    self._speeds[slot] = speeds.get(slot, math.nan)
+            self._rebalance()
@@ -0,0 +1,146 @@
+import logging
+from contextlib import contextmanager
+from multiprocessing import Condition, Value
+from time import monotonic
+from typing import Iterator, Optional
+
+
+class ConcurrencyGate:
+    """
+    Limit of concurrent operations shared by processes, that may change at any time
+
+    - Lowering the limit doesn't interrupt operations, new ones wait
+      until enough of the running ones are over.
+    """
+
+    _condition: Condition
+    _limit: Value
+    _active: Value
+
+    def __init__(self, limit: int) -> None:
+        self._condition = Condition()
+        self._limit = Value("i", limit, lock=False)
+        self._active = Value("i", 0, lock=False)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Wait for a free slot and hold it until the end of the context"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._active.value < self._limit.value)
+            self._active.value += 1
+        try:
+            yield
+        finally:
+            self.release()
+
+    def try_acquire(self) -> bool:
+        """Take a slot if one is free, return whether it did"""
+        with self._condition:
+            if self._active.value >= self._limit.value:
+                return False
+            self._active.value += 1
+            return True
+
+    def release(self) -> None:
+        """Give back a slot"""
+        with self._condition:
+            self._active.value -= 1
+            self._condition.notify_all()
+
+    def get_limit(self) -> int:
+        return self._limit.value
+
+    def set_limit(self, limit: int) -> None:
+        with self._condition:
+            self._limit.value = limit
+            self._condition.notify_all()
+
+
+class AimdController:
+    """
+    Controller of a concurrency gate, driven by the aggregate download throughput
+
+    - Throughput samples are averaged over decision periods.
+    - The limit grows by one while that improves the throughput (additive increase),
+      and is cut by a factor when the throughput drops (multiplicative decrease).
+    - When the throughput is flat, the limit is held, and probed again later.
+    - The limit is held when downloads don't fill it,
+      their throughput says nothing about the limit then.
+    """
+
+    _GAIN_THRESHOLD = 0.05
+    _LOSS_THRESHOLD = 0.1
+    _DECREASE_FACTOR = 0.75
+    _HOLDS_BEFORE_PROBE = 3
+
+    _gate: ConcurrencyGate
+    _min_limit: int
+    _max_limit: int
+    _period: float
+
+    _period_start: Optional[float] = None
+    _throughput_sum: float = 0
+    _active_sum: float = 0
+    _n_samples: int = 0
+    _previous_throughput: Optional[float] = None
+    _n_holds: int = 0
+
+    def __init__(
+        self, gate: ConcurrencyGate, min_limit: int, max_limit: int, period: float
+    ) -> None:
+        self._gate = gate
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._period = period
+
+    def _decide(self, limit: int, throughput: float, n_active: float) -> int:
+        """Get the next limit, logging the decision"""
+        previous = self._previous_throughput
+        if n_active < limit - 0.5:
+            logging.info("Holding %d download slots, only %.1f in use", limit, n_active)
+            return limit
+        if previous is None or throughput >= previous * (1 + self._GAIN_THRESHOLD):
+            new_limit = min(limit + 1, self._max_limit)
+            reason = "throughput improved"
+        elif throughput < previous * (1 - self._LOSS_THRESHOLD):
+            new_limit = max(int(limit * self._DECREASE_FACTOR), self._min_limit)
+            reason = "throughput dropped"
+        elif self._n_holds >= self._HOLDS_BEFORE_PROBE:
+            new_limit = min(limit + 1, self._max_limit)
+            reason = "probing"
+        else:
+            new_limit = limit
+            reason = "throughput is flat"
+        self._n_holds = self._n_holds + 1 if new_limit == limit else 0
+        logging.info(
+            "Download slots %d -> %d, %s (%.0f B/s, previously %s)",
+            limit,
+            new_limit,
+            reason,
+            throughput,
+            "?" if previous is None else f"{previous:.0f} B/s",
+        )
+        return new_limit
+
+    def observe(self, throughput: float, n_active: int) -> None:
+        """Take a throughput sample, and adjust the limit at the end of a period"""
+        now = monotonic()
+        if self._period_start is None:
+            self._period_start = now
+        self._throughput_sum += throughput
+        self._active_sum += n_active
+        self._n_samples += 1
+        if now - self._period_start < self._period:
+            return
+        mean_throughput = self._throughput_sum / self._n_samples
+        mean_active = self._active_sum / self._n_samples
+        limit = self._gate.get_limit()
+        new_limit = self._decide(limit, mean_throughput, mean_active)
+        if new_limit != limit:
+            self._gate.set_limit(new_limit)
+        # Only compare with periods that used the whole limit
+        if mean_active >= limit - 0.5:
+            self._previous_throughput = mean_throughput
+        self._period_start = now
+        self._throughput_sum = self._active_sum = 0
+        self._n_samples = 0
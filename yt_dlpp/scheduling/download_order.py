@@ -0,0 +1,91 @@
+from abc import abstractmethod
+from itertools import count
+from typing import Any, Iterator, Optional
+
+from yt_dlpp.workers.info_worker import VideoInfoDict
+
+
+class DownloadOrder:
+    """
+    Policy of the order videos are downloaded in
+
+    - Videos with the lowest priority key are downloaded first.
+    - Keys end with the arrival order of videos, so that ties are first come first served.
+    """
+
+    _arrivals: Iterator[int]
+
+    def __init__(self) -> None:
+        self._arrivals = count()
+
+    @abstractmethod
+    def _get_priority(self, video: VideoInfoDict) -> tuple[Any, ...]:
+        """Get the priority of a video, before its arrival order"""
+
+    def get_key(self, video: VideoInfoDict) -> tuple[Any, ...]:
+        """Get the priority key of a video, must be called once per video"""
+        return (*self._get_priority(video), next(self._arrivals))
+
+
+class FifoOrder(DownloadOrder):
+    """Videos are downloaded in the order they are extracted"""
+
+    def _get_priority(self, video: VideoInfoDict) -> tuple[Any, ...]:
+        return ()
+
+
+class _SizeOrder(DownloadOrder):
+    """
+    Base of the policies ordering videos by size
+
+    - Videos of unknown size are estimated from their duration,
+      videos with neither come last.
+    """
+
+    _ESTIMATED_BYTES_PER_SECOND = 250_000
+
+    def _get_size(self, video: VideoInfoDict) -> Optional[float]:
+        if video["size"] is not None:
+            return video["size"]
+        if video["duration"] is not None:
+            return video["duration"] * self._ESTIMATED_BYTES_PER_SECOND
+        return None
+
+
+class ShortestFirstOrder(_SizeOrder):
+    """Smaller videos are downloaded first"""
+
+    def _get_priority(self, video: VideoInfoDict) -> tuple[Any, ...]:
+        size = self._get_size(video)
+        return (size is None, size or 0)
+
+
+class LargestFirstOrder(_SizeOrder):
+    """Larger videos are downloaded first"""
+
+    def _get_priority(self, video: VideoInfoDict) -> tuple[Any, ...]:
+        size = self._get_size(video)
+        return (size is None, -(size or 0))
+
+
+class FairOrder(DownloadOrder):
+    """Videos of the different playlists (source urls) are interleaved"""
+
+    _n_videos: dict[Optional[str], int]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._n_videos = {}
+
+    def _get_priority(self, video: VideoInfoDict) -> tuple[Any, ...]:
+        rank = self._n_videos.get(video["source_url"], 0)
+        self._n_videos[video["source_url"]] = rank + 1
+        return (rank,)
+
+
+DOWNLOAD_ORDERS: dict[str, type[DownloadOrder]] = {
+    "fifo": FifoOrder,
+    "shortest": ShortestFirstOrder,
+    "largest": LargestFirstOrder,
+    "fair": FairOrder,
+}
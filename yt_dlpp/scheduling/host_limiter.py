@@ -0,0 +1,137 @@
+from contextlib import contextmanager
+from hashlib import blake2b
+from multiprocessing import Array, Condition
+from time import monotonic
+from typing import Iterable, Iterator, TypedDict
+from urllib.parse import urlparse
+
+
+class HostLimitDict(TypedDict):
+    """
+    Limits of the yt-dlp runs on a host
+
+    - Concurrency is the maximum number of simultaneous runs, 0 for unlimited.
+    - Rate is the maximum number of runs started per second, 0 for unlimited.
+    """
+
+    concurrency: int
+    rate: float
+
+
+def get_host(url: str) -> str:
+    """Get the host a url is limited as"""
+    host = urlparse(url).hostname or ""
+    return host.removeprefix("www.")
+
+
+def host_limit(spec: str) -> tuple[str, HostLimitDict]:
+    """Parse a host limit from a HOST=CONCURRENCY[/RATE] spec"""
+    host, sep, limits = spec.partition("=")
+    if not sep or not host:
+        raise ValueError(f"Invalid host limit: {spec}")
+    concurrency, _, rate = limits.partition("/")
+    limit = HostLimitDict(concurrency=int(concurrency), rate=float(rate or 0))
+    if limit["concurrency"] < 0 or limit["rate"] < 0:
+        raise ValueError(f"Invalid host limit: {spec}")
+    return host.removeprefix("www."), limit
+
+
+class HostLimiter:
+    """
+    Concurrency and rate limits of yt-dlp runs per host, shared by processes
+
+    - The limit of a host applies to its subdomains, the most specific one wins.
+      Hosts without a limit of their own get the default one.
+    - Rates are enforced with token buckets,
+      allowing bursts of up to one second of runs.
+    - Hosts are counted in a fixed number of hashed buckets,
+      hosts colliding in a bucket share their counters.
+    """
+
+    _N_BUCKETS = 4096
+    _POLL_INTERVAL = 0.05
+
+    _limits: dict[str, HostLimitDict]
+    _default: HostLimitDict
+    _condition: Condition
+    _active: Array
+    _tokens: Array
+    _refill_times: Array
+
+    def __init__(self, limits: dict[str, HostLimitDict], default: HostLimitDict):
+        self._limits = limits
+        self._default = default
+        self._condition = Condition()
+        self._active = Array("i", self._N_BUCKETS, lock=False)
+        self._tokens = Array("d", self._N_BUCKETS, lock=False)
+        self._refill_times = Array("d", self._N_BUCKETS, lock=False)
+
+    def get_limit(self, host: str) -> HostLimitDict:
+        """Get the limit of a host, from its most specific domain"""
+        labels = host.split(".")
+        for i in range(len(labels)):
+            domain = ".".join(labels[i:])
+            if domain in self._limits:
+                return self._limits[domain]
+        return self._default
+
+    def _get_bucket(self, host: str) -> int:
+        digest = blake2b(host.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % self._N_BUCKETS
+
+    def _try_acquire_locked(self, host: str) -> bool:
+        """Take a slot of the host if its limits allow it, the lock must be held"""
+        limit = self.get_limit(host)
+        bucket = self._get_bucket(host)
+        active = self._active[bucket]
+        if limit["concurrency"] > 0 and active >= limit["concurrency"]:
+            return False
+        if limit["rate"] > 0:
+            now = monotonic()
+            elapsed = now - self._refill_times[bucket]
+            capacity = max(limit["rate"], 1)
+            tokens = min(self._tokens[bucket] + elapsed * limit["rate"], capacity)
+            self._tokens[bucket] = tokens
+            self._refill_times[bucket] = now
+            if tokens < 1:
+                return False
+            self._tokens[bucket] = tokens - 1
+        if limit["concurrency"] > 0:
+            self._active[bucket] += 1
+        return True
+
+    def try_acquire(self, host: str) -> bool:
+        """Take a slot of the host if its limits allow it, return whether it did"""
+        with self._condition:
+            return self._try_acquire_locked(host)
+
+    def acquire(self, host: str) -> None:
+        """Wait until the limits of the host allow taking one of its slots"""
+        with self._condition:
+            # Tokens refill with time, without notifications
+            while not self._try_acquire_locked(host):
+                self._condition.wait(self._POLL_INTERVAL)
+
+    def release(self, host: str) -> None:
+        """Give back a slot of the host"""
+        if self.get_limit(host)["concurrency"] == 0:
+            return
+        with self._condition:
+            self._active[self._get_bucket(host)] -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def hold(self, urls: Iterable[str]) -> Iterator[None]:
+        """
+        Hold a slot of every host of the urls until the end of the context.
+        Hosts are acquired in order, so that holders don't wait on each other.
+        """
+        acquired = []
+        try:
+            for host in sorted({get_host(url) for url in urls}):
+                self.acquire(host)
+                acquired.append(host)
+            yield
+        finally:
+            for host in acquired:
+                self.release(host)
@@ -0,0 +1,42 @@
+import random
+import re
+
+# Errors that won't go away by trying again
+_PERMANENT_ERRORS = re.compile(
+    "|".join(
+        (
+            r"Unsupported URL",
+            r"is not a valid URL",
+            r"Video unavailable",
+            r"Private video",
+            r"This video (is|has been) (private|removed|unavailable)",
+            r"members[- ]only",
+            r"Join this channel",
+            r"not available in your country",
+            r"confirm your age",
+            r"copyright",
+            r"account .* terminated",
+            r"Requested format is not available",
+            r"HTTP Error (400|401|403|404|410)",
+        )
+    ),
+    re.IGNORECASE,
+)
+
+
+def is_retryable(error: str) -> bool:
+    """
+    Check if a yt-dlp error may be transient (eg. rate limits, network errors).
+    Errors are retryable unless known to be permanent.
+    """
+    return _PERMANENT_ERRORS.search(error) is None
+
+
+def get_backoff(attempt: int, base_delay: float, max_delay: float) -> float:
+    """
+    Get the delay before retrying after the given failed attempt (starting at 1).
+    The delay doubles with every attempt, and half of it is random,
+    so that items failing together are not retried together.
+    """
+    delay = min(base_delay * 2 ** (attempt - 1), max_delay)
+    return delay / 2 + random.uniform(0, delay / 2)
@@ -0,0 +1,219 @@
+import logging
+import os
+import socket
+import sys
+import time
+from multiprocessing import Event, JoinableQueue
+from multiprocessing.context import AuthenticationError
+from multiprocessing.managers import BaseProxy
+from queue import Empty
+from typing import Optional
+
+from yt_dlpp.distributed.work_ledger import LeaseDict, LedgerManager
+from yt_dlpp.progress.progress_board import ProgressBoard
+from yt_dlpp.workers.download_worker import DownloadEndDict
+from yt_dlpp.workers.info_worker import VideoInfoDict
+from yt_dlpp.workers.retry_worker import RetryRequestDict
+from yt_dlpp.workers.worker import Worker
+
+
+class AgentWorker(Worker[DownloadEndDict | RetryRequestDict, VideoInfoDict]):
+    """
+    Worker process of an agent, that leases videos from a coordinator
+    for the local download workers
+
+    - Videos are leased to keep every download worker busy,
+      their infojsons are written to the info directory.
+    - Leases are renewed with heartbeats, that also carry the progress
+      of the downloads on the progress board.
+    - Download ends and failures are reported to the coordinator by lease id,
+      carried by the leased items, that retries failed videos itself. Download ends are then sent
+      to the progress queue.
+    - `connected` is set once connected to the coordinator.
+      Once the coordinator has no more videos, or can't be reached,
+      `finished` is set.
+    """
+
+    input_queue: JoinableQueue
+    output_queue: JoinableQueue
+
+    connected: Event
+    finished: Event
+
+    _POLL_INTERVAL = 0.1
+    _CONNECT_TIMEOUT = 30
+
+    _address: tuple[str, int]
+    _key: bytes
+    _capacity: int
+    _info_dir: str
+    _progress_board: ProgressBoard
+    _progress_queue: JoinableQueue
+    _agent: str
+    _ledger: Optional[BaseProxy]
+    _closed: bool
+    _lease_ids: set[int]
+    _failed_ends: dict[int, DownloadEndDict]
+    _heartbeat_interval: float
+    _next_heartbeat: float
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        key: bytes,
+        capacity: int,
+        info_dir: str,
+        progress_board: ProgressBoard,
+        progress_queue: JoinableQueue,
+        input_queue: JoinableQueue,
+        output_queue: JoinableQueue,
+    ) -> None:
+        super().__init__(input_queue, output_queue)
+        self.connected = Event()
+        self.finished = Event()
+        self._address = address
+        self._key = key
+        self._capacity = capacity
+        self._info_dir = info_dir
+        self._progress_board = progress_board
+        self._progress_queue = progress_queue
+
+    def _connect(self) -> Optional[BaseProxy]:
+        """Connect to the ledger of the coordinator, waiting for it to start"""
+        deadline = time.monotonic() + self._CONNECT_TIMEOUT
+        while True:
+            manager = LedgerManager(self._address, self._key)
+            try:
+                manager.connect()
+                return manager.get_ledger()
+            except AuthenticationError as e:
+                logging.error("Could not connect to the coordinator: %s", e)
+                return None
+            except ConnectionRefusedError as e:
+                if time.monotonic() >= deadline:
+                    logging.error("Could not connect to the coordinator: %s", e)
+                    return None
+                time.sleep(1)
+
+    def _lose_coordinator(self, error: Exception) -> None:
+        """Stop leasing videos, the coordinator can't be reached anymore"""
+        logging.error("Lost the connection to the coordinator: %s", error)
+        self._ledger = None
+        self.finished.set()
+
+    def _start_lease(self, lease: LeaseDict) -> None:
+        """Send a leased video to the download workers"""
+        item = VideoInfoDict(**{**lease["item"], "lease_id": lease["lease_id"]})
+        if lease["info_json"] is not None:
+            info_path = os.path.join(self._info_dir, f"{lease['lease_id']}.info.json")
+            try:
+                with open(info_path, "w", encoding="utf-8") as file:
+                    file.write(lease["info_json"])
+            except OSError as e:
+                logging.warning("Could not write the infojson of a video: %s", e)
+            else:
+                item = VideoInfoDict(**{**item, "info_path": info_path})
+        self._lease_ids.add(lease["lease_id"])
+        self._send_output(item)
+
+    def _take_leases(self) -> None:
+        """Lease videos for the idle download workers"""
+        n_wanted = self._capacity - len(self._lease_ids)
+        if self._closed or n_wanted <= 0:
+            return
+        leases = self._ledger.lease(self._agent, n_wanted)
+        if leases is None:
+            logging.debug("The coordinator has no more videos")
+            self._closed = True
+            return
+        for lease in leases:
+            self._start_lease(lease)
+
+    def _send_heartbeat(self) -> None:
+        """Renew the leases and report the progress, once per heartbeat interval"""
+        now = time.monotonic()
+        if now < self._next_heartbeat:
+            return
+        self._ledger.renew(self._agent, self._progress_board.read())
+        self._next_heartbeat = now + self._heartbeat_interval
+
+    def _report(
+        self, lease_id: int, end: DownloadEndDict, error: Optional[str]
+    ) -> None:
+        """Report the end of a leased video to the coordinator"""
+        if lease_id not in self._lease_ids:
+            return
+        self._lease_ids.remove(lease_id)
+        if self._ledger is None:
+            return
+        try:
+            if error is None:
+                counted = self._ledger.complete(lease_id, end)
+            else:
+                counted = self._ledger.fail(lease_id, end, error)
+        except (OSError, EOFError) as e:
+            self._lose_coordinator(e)
+            return
+        if not counted:
+            logging.warning(
+                "Lease of %s expired, it was reassigned", end["original_url"]
+            )
+
+    def _process_item(self, item: DownloadEndDict | RetryRequestDict) -> None:
+        match item:
+            case {"item": {"lease_id": int(lease_id)}, "error": str(error)}:
+                end = self._failed_ends.pop(
+                    lease_id,
+                    DownloadEndDict(
+                        original_url=item["item"]["original_url"],
+                        lease_id=lease_id,
+                        video_id=None,
+                        success=False,
+                        downloaded_bytes=0,
+                    ),
+                )
+                self._report(lease_id, end, error)
+            case {"lease_id": int(lease_id), "success": success}:
+                self._progress_queue.put(item)
+                if success:
+                    self._report(lease_id, item, None)
+                else:
+                    # Reported along with the error, that follows
+                    self._failed_ends[lease_id] = item
+
+    def _run(self) -> None:
+        self._agent = f"{socket.gethostname()}-{os.getpid()}"
+        self._closed = False
+        self._lease_ids = set()
+        self._failed_ends = {}
+        self._next_heartbeat = 0
+        self._ledger = self._connect()
+        if self._ledger is None:
+            self.finished.set()
+        else:
+            lease_timeout = self._ledger.get_lease_timeout()
+            self._heartbeat_interval = min(1, lease_timeout / 3)
+            logging.info("Connected to the coordinator as %s", self._agent)
+            self.connected.set()
+
+        while True:
+            if self._ledger is not None and not self.finished.is_set():
+                try:
+                    self._take_leases()
+                    self._send_heartbeat()
+                except (OSError, EOFError) as e:
+                    self._lose_coordinator(e)
+            if self._closed and len(self._lease_ids) == 0:
+                self.finished.set()
+            try:
+                item = self._get_input(timeout=self._POLL_INTERVAL)
+            except Empty:
+                continue
+            if item is None:
+                break
+            self._handle_item(item)
+            self.input_queue.task_done()
+
+        self._finish()
+        self.input_queue.task_done()
+        sys.exit(0)
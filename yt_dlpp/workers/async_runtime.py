@@ -0,0 +1,274 @@
+import asyncio
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Full, Queue
+from threading import Thread
+from time import monotonic
+from typing import Any, Coroutine, Optional
+
+from yt_dlpp.metrics.pipeline_metrics import QueueMetrics, StageMetrics
+from yt_dlpp.metrics.profiler import WorkerProfiler
+from yt_dlpp.metrics.trace import Tracer
+from yt_dlpp.workers.worker import (
+    TaskInputValueT,
+    TaskOutputValueT,
+    Worker,
+    WorkerInterface,
+)
+
+
+class AsyncRuntime:
+    """
+    Single process runtime, where an asyncio event loop replaces worker processes
+
+    - The loop runs in a background thread, so that the main process drives it
+      like it drives worker processes.
+    - Worker logic is blocking, so items are processed in a thread pool,
+      while the child processes they start are managed by the loop.
+    """
+
+    loop: asyncio.AbstractEventLoop
+    executor: ThreadPoolExecutor
+
+    _thread: Thread
+
+    def __init__(self, n_threads: int) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(n_threads, thread_name_prefix="Worker")
+        self._thread = Thread(target=self.loop.run_forever, name="Loop", daemon=True)
+        self._thread.start()
+
+    def run(self, coroutine: Coroutine) -> Future:
+        """Schedule a coroutine on the loop, from any thread"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+
+class AsyncQueue:
+    """
+    Thread-safe facade of an asyncio queue, with the interface of a JoinableQueue
+
+    - Items must not be put from the loop's thread, as puts to a full queue block.
+    - With metrics, its depth and the time items wait in it are recorded.
+      Items are then taken from the loop with `get_stamped`, not from the inner queue.
+    """
+
+    queue: asyncio.Queue
+
+    _runtime: AsyncRuntime
+    _metrics: Optional[QueueMetrics]
+
+    def __init__(
+        self,
+        runtime: AsyncRuntime,
+        maxsize: int = 0,
+        metrics: Optional[QueueMetrics] = None,
+    ) -> None:
+        self._runtime = runtime
+        self._metrics = metrics
+        self.queue = asyncio.Queue(maxsize)
+
+    async def _put_nowait(self, item: Any) -> None:
+        self.queue.put_nowait(item)
+
+    def put(self, item: Any, block: bool = True) -> None:
+        stamped_item = (monotonic(), item)
+        if self.queue.maxsize == 0:
+            self._runtime.loop.call_soon_threadsafe(self.queue.put_nowait, stamped_item)
+        else:
+            coroutine = (
+                self.queue.put(stamped_item)
+                if block
+                else self._put_nowait(stamped_item)
+            )
+            try:
+                self._runtime.run(coroutine).result()
+            except asyncio.QueueFull:
+                raise Full from None
+        if self._metrics is not None and item is not None:
+            self._metrics.record_put()
+
+    async def get_stamped(self) -> tuple[float, Any]:
+        """Take the next item with the time it was put at, from the loop"""
+        put_time, item = await self.queue.get()
+        if self._metrics is not None and item is not None:
+            self._metrics.record_get(monotonic() - put_time)
+        return put_time, item
+
+    def join(self) -> None:
+        self._runtime.run(self.queue.join()).result()
+
+    def close(self) -> None:
+        pass
+
+    def join_thread(self) -> None:
+        pass
+
+
+class ThreadQueue(Queue):
+    """
+    Queue between threads, with the interface of a JoinableQueue
+
+    - With metrics, its depth and the time items wait in it are recorded.
+    """
+
+    _metrics: Optional[QueueMetrics]
+
+    def __init__(self, maxsize: int = 0, metrics: Optional[QueueMetrics] = None):
+        super().__init__(maxsize)
+        self._metrics = metrics
+
+    def put(self, item: Any, block: bool = True, timeout: Optional[float] = None):
+        super().put((monotonic(), item), block, timeout)
+        if self._metrics is not None and item is not None:
+            self._metrics.record_put()
+
+    def get_stamped(
+        self, block: bool = True, timeout: Optional[float] = None
+    ) -> tuple[float, Any]:
+        """Take the next item, with the time it was put at"""
+        put_time, item = super().get(block, timeout)
+        if self._metrics is not None and item is not None:
+            self._metrics.record_get(monotonic() - put_time)
+        return put_time, item
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        return self.get_stamped(block, timeout)[1]
+
+    def close(self) -> None:
+        pass
+
+    def join_thread(self) -> None:
+        pass
+
+
+class AsyncWorkerPool(WorkerInterface[TaskInputValueT, TaskOutputValueT]):
+    """
+    Pool of workers whose items are processed concurrently by the asyncio runtime
+
+    - Workers are not started as processes, their item processing is reused.
+    - Every worker processes one item at a time, in a thread of the runtime,
+      so the number of workers is the pool's concurrency limit.
+    """
+
+    _runtime: AsyncRuntime
+    _workers: tuple[Worker[TaskInputValueT, TaskOutputValueT]]
+    _input_queue: AsyncQueue
+
+    def __init__(self, runtime: AsyncRuntime, *workers: Worker) -> None:
+        assert len(workers) > 0, "Cannot create pool with no workers"
+        self._runtime = runtime
+        self._workers = workers
+        self._input_queue = workers[0].get_input_queue()
+
+    @classmethod
+    def from_class(
+        cls, runtime: AsyncRuntime, n: int, klass: type[Worker], *args
+    ) -> "AsyncWorkerPool":
+        """
+        Create a pool containing n workers of the given class
+        with all the same constructor args
+        """
+        workers = (klass(*args) for _ in range(n))
+        return AsyncWorkerPool(runtime, *workers)
+
+    @staticmethod
+    def _handle_item(worker: Worker, item: TaskInputValueT) -> None:
+        """Process an item with a worker, from a thread of the runtime"""
+        with worker._profiling():
+            worker._handle_item(item)
+
+    async def _process(
+        self,
+        put_time: float,
+        item: TaskInputValueT,
+        idle_workers: list[Worker],
+        semaphore: asyncio.Semaphore,
+    ) -> None:
+        """Process an item with an idle worker"""
+        worker = idle_workers.pop()
+        # The item waited in the queue, then for an idle worker
+        worker._trace_wait(f"wait {worker._stage_name}", put_time, item)
+        try:
+            await self._runtime.loop.run_in_executor(
+                self._runtime.executor, self._handle_item, worker, item
+            )
+        except Exception:
+            logging.exception("Failed to process item: %s", item)
+            worker._record_failure()
+        finally:
+            idle_workers.append(worker)
+            semaphore.release()
+            self._input_queue.queue.task_done()
+
+    async def _run(self) -> None:
+        """Process items until dismissed"""
+        queue = self._input_queue.queue
+        idle_workers = list(self._workers)
+        semaphore = asyncio.Semaphore(len(self._workers))
+        tasks = set()
+        while True:
+            put_time, item = await self._input_queue.get_stamped()
+            if item is None:
+                break
+            await semaphore.acquire()
+            task = asyncio.create_task(
+                self._process(put_time, item, idle_workers, semaphore)
+            )
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+        for worker in self._workers:
+            worker._dump_profile()
+        queue.task_done()
+
+    def start(self) -> None:
+        self._runtime.run(self._run())
+
+    def record_metrics(self, metrics: StageMetrics) -> None:
+        for worker in self._workers:
+            worker.record_metrics(metrics)
+
+    def record_trace(self, tracer: Tracer) -> None:
+        for worker in self._workers:
+            worker.record_trace(tracer)
+
+    def record_profile(self, profiler: WorkerProfiler) -> None:
+        for index, worker in enumerate(self._workers):
+            worker.record_profile(profiler, index)
+
+    def get_input_queue(self) -> AsyncQueue:
+        return self._input_queue
+
+    def dismiss(self) -> None:
+        self._input_queue.put(None)
+
+
+class ThreadWorker(WorkerInterface[TaskInputValueT, TaskOutputValueT]):
+    """Worker whose main loop runs in a thread instead of a process"""
+
+    _worker: Worker[TaskInputValueT, TaskOutputValueT]
+    _thread: Thread
+
+    def __init__(self, worker: Worker[TaskInputValueT, TaskOutputValueT]) -> None:
+        self._worker = worker
+        self._thread = Thread(
+            target=worker.run, name=type(worker).__name__, daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def record_metrics(self, metrics: StageMetrics) -> None:
+        self._worker.record_metrics(metrics)
+
+    def record_trace(self, tracer: Tracer) -> None:
+        self._worker.record_trace(tracer)
+
+    def record_profile(self, profiler: WorkerProfiler) -> None:
+        self._worker.record_profile(profiler)
+
+    def get_input_queue(self) -> ThreadQueue:
+        return self._worker.get_input_queue()
+
+    def dismiss(self) -> None:
+        self._worker.dismiss()
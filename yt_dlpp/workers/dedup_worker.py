@@ -1,21 +1,86 @@
 import logging
+import os
+from typing import Optional
 
+from yt_dlpp.dedup.bloom_filter import ScalableBloomFilter
+from yt_dlpp.dedup.output_index import OutputIndex
+from yt_dlpp.dedup.video_archive import VideoArchive
+from yt_dlpp.journal.session_journal import SessionJournal
+from yt_dlpp.workers.info_worker import VideoInfoDict
 from yt_dlpp.workers.worker import Worker
 
 
-class DedupWorker(Worker[str, str]):
-    """Worker in charge of deduplicating inputs"""
+class DedupWorker(Worker[VideoInfoDict, VideoInfoDict]):
+    """
+    Worker in charge of deduplicating inputs
 
-    _seen: set[str]
+    - Videos are identified by their archive id when it is known,
+      so that a video reached from different urls is only downloaded once.
+    - The seen videos may be kept in a bloom filter to bound memory usage,
+      at the cost of rare false positives.
+    - Videos done or skipped in a resumed session are treated as duplicates,
+      its pending videos are deduplicated again.
+    - Skipped videos are recorded in the journal, so that they are not resumed.
+    - With an archive, videos downloaded by previous runs are skipped.
+    - With an output index, videos whose file already exists are skipped.
+    """
 
-    def __init__(self, input_queue, output_queue) -> None:
+    _seen: set[str] | ScalableBloomFilter
+    _archive: Optional[VideoArchive]
+    _output_index: Optional[OutputIndex]
+    _journal: Optional[SessionJournal]
+
+    def __init__(
+        self,
+        seen: set[str] | ScalableBloomFilter,
+        archive: Optional[VideoArchive],
+        output_index: Optional[OutputIndex],
+        journal: Optional[SessionJournal],
+        input_queue,
+        output_queue,
+    ) -> None:
         super().__init__(input_queue, output_queue)
-        self._seen = set()
+        self._seen = seen
+        self._archive = archive
+        self._output_index = output_index
+        self._journal = journal
+
+    def _send_output(self, value: VideoInfoDict) -> None:
+        if self._journal is not None:
+            self._journal.record("video", value["original_url"], "deduplicated")
+        super()._send_output(value)
+
+    def _skip(self, item: VideoInfoDict, reason: str) -> None:
+        """Drop an item, with its infojson"""
+        logging.debug("Skipping %s item: %s", reason, item["original_url"])
+        if self._journal is not None:
+            self._journal.record("video", item["original_url"], "skipped")
+        if item["info_path"] is not None:
+            os.remove(item["info_path"])
 
     def _process_item(self, item):
-        if item in self._seen:
-            logging.debug("Skipping duplicate item: %s", item)
+        video_url = item["original_url"]
+        archive_id = item["archive_id"]
+        # Urls are still checked, resumed sessions only know videos by url
+        keys = (video_url,) if archive_id is None else (archive_id, video_url)
+        if any(key in self._seen for key in keys):
+            self._skip(item, "duplicate")
+            return
+        for key in keys:
+            self._seen.add(key)
+        if (
+            archive_id is not None
+            and self._archive is not None
+            and archive_id in self._archive
+        ):
+            self._skip(item, "archived")
+            return
+        if (
+            item["filename"] is not None
+            and self._output_index is not None
+            and item["filename"] in self._output_index
+        ):
+            self._skip(item, "already downloaded")
             return
-        logging.debug("Relaying item: %s", item)
-        self._seen.add(item)
+        logging.debug("Relaying item: %s", video_url)
         self._send_output(item)
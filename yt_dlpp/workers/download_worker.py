@@ -1,85 +1,236 @@
-import json
 import logging
-from functools import lru_cache
+import os
+from contextlib import nullcontext
 from multiprocessing import JoinableQueue
-from subprocess import PIPE, Popen
-from typing import Literal, Sequence, TypedDict
+from time import monotonic
+from typing import Optional, TypedDict
 
-from yt_dlpp.interceptors.interceptor import DlInterceptor
+from yt_dlpp.dedup.video_archive import VideoArchive
+from yt_dlpp.engines.engine import (
+    Engine,
+    EngineError,
+    ProgressLineDict,
+    RateLimitCallback,
+)
+from yt_dlpp.journal.session_journal import JournalState, SessionJournal
+from yt_dlpp.progress.progress_board import ProgressBoard
+from yt_dlpp.scheduling.bandwidth import BandwidthBudget
+from yt_dlpp.scheduling.concurrency import ConcurrencyGate
+from yt_dlpp.scheduling.host_limiter import HostLimiter, get_host
+from yt_dlpp.workers.info_worker import VideoInfoDict
+from yt_dlpp.workers.retry_worker import RetryRequestDict
 from yt_dlpp.workers.worker import Worker
 
 
-class _VideoSubdict(TypedDict):
-    id: str
+class DownloadEndDict(TypedDict):
+    """
+    End of a video download
+
+    - The video id is None if the download never reported progress.
+    - The lease id is the one of the downloaded video, if leased by an agent.
+    """
+
     original_url: str
-    title: str
+    lease_id: Optional[int]
+    video_id: Optional[str]
+    success: bool
+    downloaded_bytes: float
 
 
-class _ProgressSubdict(TypedDict):
-    downloaded_bytes: int
-    total_bytes: int
-    total_bytes_estimate: int
-    eta: Literal["NA"] | float
-    speed: Literal["NA"] | float
-    elapsed: float
+class PostProcessRequestDict(TypedDict):
+    """Video whose media was downloaded, along with the end of its download"""
 
+    item: VideoInfoDict
+    end: DownloadEndDict
 
-class ProgressLineDict(TypedDict):
-    video: _VideoSubdict
-    progress: _ProgressSubdict
 
+class DownloadWorker(Worker[VideoInfoDict, DownloadEndDict]):
+    """
+    Worker process that downloads videos from their yt-dlp infojson
 
-class DownloadWorker(Worker):
-    """Worker process that downloads from yt-dlp video urls"""
+    - The infojson extracted by the info stage is loaded back,
+      so that videos are not extracted a second time.
+    - Videos without an infojson (from flat playlists) are downloaded from their url.
+    - If yt-dlp fails on the stored infojson (eg. expired format urls),
+      the download is retried from the video url.
+    - Failed downloads are handed over to the retry queue, from the video url.
+    - With a post-processing queue, only the media of videos is downloaded
+      from their infojson, they are then handed over to the post-processing workers
+      along with the end of their download.
+    - With a journal, the state of downloads is recorded.
+    - With an archive, downloaded videos are added to it.
+    - Progress is written to the worker's own slot of the progress board,
+      only the end of downloads is sent to the output queue.
+    - With a concurrency gate, downloads wait for one of its slots to start.
+    - With a bandwidth budget, downloads are limited to their share of it.
+    - With a scheduler, the dispatch slot and the slot of the video's host
+      it took are released at the end of the download.
+    """
 
     input_queue: JoinableQueue
     output_queue: JoinableQueue
 
-    _ydl_args: Sequence[str]
-
-    @property
-    @lru_cache(maxsize=1)
-    def _base_command(self) -> tuple[str]:
-        """Generate the base command"""
-        interceptor = DlInterceptor()
-        _, allowed = interceptor.parse_known_args(self._ydl_args)
-        progress_template = (
-            "{"
-            + '"video": %(info.{id,original_url,title})j,'
-            + '"progress": %(progress.{downloaded_bytes,total_bytes,total_bytes_estimate,eta,speed,elapsed})j'
-            + "}"
-        )
-        return (
-            "yt-dlp",
-            "--quiet",
-            "--progress",
-            "--newline",
-            "--progress-template",
-            progress_template,
-            *allowed,
-        )
+    _engine: Engine
+    _archive: Optional[VideoArchive]
+    _journal: Optional[SessionJournal]
+    _progress_board: ProgressBoard
+    _gate: Optional[ConcurrencyGate]
+    _dispatch_gate: Optional[ConcurrencyGate]
+    _limiter: Optional[HostLimiter]
+    _budget: Optional[BandwidthBudget]
+    _retry_queue: JoinableQueue
+    _post_process_queue: Optional[JoinableQueue]
+    _last_progress: Optional[ProgressLineDict] = None
+    _claimed_slot: Optional[int] = None
 
     def __init__(
         self,
-        ydl_args: Sequence[str],
+        engine: Engine,
+        archive: Optional[VideoArchive],
+        journal: Optional[SessionJournal],
+        progress_board: ProgressBoard,
+        gate: Optional[ConcurrencyGate],
+        dispatch_gate: Optional[ConcurrencyGate],
+        limiter: Optional[HostLimiter],
+        budget: Optional[BandwidthBudget],
+        retry_queue: JoinableQueue,
+        post_process_queue: Optional[JoinableQueue],
         input_queue: JoinableQueue,
         output_queue: JoinableQueue,
     ) -> None:
         super().__init__(input_queue, output_queue)
-        self._ydl_args = ydl_args
-
-    def _process_item(self, item: str) -> None:
-        # Download the video
-        logging.debug("Starting download for %s", item)
-        process = Popen(
-            (*self._base_command, item),
-            encoding="utf-8",
-            bufsize=1,
-            universal_newlines=True,
-            stdout=PIPE,
+        self._engine = engine
+        self._archive = archive
+        self._journal = journal
+        self._progress_board = progress_board
+        self._gate = gate
+        self._dispatch_gate = dispatch_gate
+        self._limiter = limiter
+        self._budget = budget
+        self._retry_queue = retry_queue
+        self._post_process_queue = post_process_queue
+
+    @property
+    def _progress_slot(self) -> int:
+        """
+        Get the progress board slot of the worker.
+        Not cached per process, as the asyncio runtime runs several workers in one.
+        """
+        if self._claimed_slot is None:
+            self._claimed_slot = self._progress_board.claim_slot()
+        return self._claimed_slot
+
+    def _on_progress(self, progress_line: ProgressLineDict) -> None:
+        """Publish a progress line to the progress board"""
+        self._last_progress = progress_line
+        self._progress_board.write(self._progress_slot, progress_line)
+
+    def _end_progress(self, item: VideoInfoDict, success: bool) -> DownloadEndDict:
+        """Clear the progress board slot, then get the end of the download"""
+        video_id, downloaded_bytes = None, 0
+        if self._last_progress is not None:
+            video_id = self._last_progress["video"]["id"]
+            try:
+                downloaded_bytes = float(
+                    self._last_progress["progress"]["downloaded_bytes"]
+                )
+            except (KeyError, TypeError, ValueError):
+                pass
+            self._progress_board.clear(self._progress_slot)
+        self._last_progress = None
+        return DownloadEndDict(
+            original_url=item["original_url"],
+            lease_id=item["lease_id"],
+            video_id=video_id,
+            success=success,
+            downloaded_bytes=downloaded_bytes,
         )
-        # Get progress as soon as a line is available
-        for line in process.stdout:
-            parsed_line: ProgressLineDict = json.loads(line)
-            self._send_output(parsed_line)
-        logging.debug("Download finished for %s", item)
+
+    def _journal_video(self, video_url: str, state: JournalState) -> None:
+        """Record the state transition of a video in the journal, if any"""
+        if self._journal is not None:
+            self._journal.record("video", video_url, state)
+
+    def _process_item(self, item: VideoInfoDict) -> None:
+        gate = self._gate.slot() if self._gate is not None else nullcontext()
+        share = nullcontext()
+        if self._budget is not None:
+            fixed = not self._engine.can_change_rate_limit()
+            share = self._budget.share(self._progress_slot, fixed)
+        wait_start = monotonic()
+        try:
+            with gate, share as get_rate_limit:
+                if self._gate is not None:
+                    self._trace_wait("wait download slot", wait_start, item)
+                self._download(item, get_rate_limit)
+        finally:
+            if self._limiter is not None:
+                self._limiter.release(get_host(item["original_url"]))
+            if self._dispatch_gate is not None:
+                self._dispatch_gate.release()
+
+    def _download(
+        self, item: VideoInfoDict, get_rate_limit: Optional[RateLimitCallback]
+    ) -> None:
+        """Download a video, recording its end"""
+        video_url = item["original_url"]
+        logging.debug("Starting download for %s", video_url)
+        self._journal_video(video_url, "downloading")
+        try:
+            if item["info_path"] is None:
+                self._engine.download_url(video_url, self._on_progress, get_rate_limit)
+                deferred = False
+            else:
+                deferred = self._download_info_file(item, get_rate_limit)
+        except EngineError as e:
+            logging.debug("Failed to download %s: %s", video_url, e)
+            self._record_failure()
+            self._journal_video(video_url, "failed")
+            self._send_output(self._end_progress(item, success=False))
+            # The infojson was consumed by the attempt
+            retry_item = VideoInfoDict(**{**item, "info_path": None})
+            self._retry_queue.put(
+                RetryRequestDict(item=retry_item, key=video_url, error=str(e))
+            )
+        else:
+            end = self._end_progress(item, success=True)
+            if deferred:
+                logging.debug("Deferring post-processing for %s", video_url)
+                self._post_process_queue.put(PostProcessRequestDict(item=item, end=end))
+                return
+            self._journal_video(video_url, "done")
+            self._send_output(end)
+            if self._archive is not None and item["archive_id"] is not None:
+                self._archive.add(item["archive_id"])
+        logging.debug("Download finished for %s", video_url)
+
+    def _download_info_file(
+        self, item: VideoInfoDict, get_rate_limit: Optional[RateLimitCallback]
+    ) -> bool:
+        """
+        Download a video from its infojson, falling back to its url.
+        Return whether its post-processing is deferred,
+        its infojson is then kept for the post-processing workers.
+        """
+        deferred = False
+        try:
+            if self._post_process_queue is None:
+                self._engine.download_info_file(
+                    item["info_path"], self._on_progress, get_rate_limit
+                )
+            else:
+                self._engine.fetch_info_file(
+                    item["info_path"], self._on_progress, get_rate_limit
+                )
+                deferred = True
+        except EngineError as e:
+            logging.debug(
+                "Retrying download from url for %s: %s", item["original_url"], e
+            )
+            self._engine.download_url(
+                item["original_url"], self._on_progress, get_rate_limit
+            )
+        finally:
+            if not deferred:
+                os.remove(item["info_path"])
+        return deferred
@@ -1,82 +1,419 @@
 import json
 import logging
+import os
+from contextlib import AbstractContextManager, nullcontext
 from multiprocessing import JoinableQueue
-from subprocess import CalledProcessError, run
-from typing import Sequence
+from queue import Full
+from tempfile import mkstemp
+from typing import Any, Optional, Sequence, TypedDict
 
-from yt_dlpp.interceptors.interceptor import InfoInterceptor
-from yt_dlpp.workers.worker import Worker
+from yt_dlpp.cache.info_cache import InfoCache
+from yt_dlpp.dedup.output_index import OutputTemplate
+from yt_dlpp.engines.engine import Engine, EngineError, InfoCallback
+from yt_dlpp.journal.session_journal import JournalState, SessionJournal
+from yt_dlpp.scheduling.host_limiter import HostLimiter
+from yt_dlpp.workers.retry_worker import RetryRequestDict
+from yt_dlpp.workers.worker import BatchWorker
 
+try:
+    from yt_dlp.extractor import get_info_extractor
+except ImportError:
+    get_info_extractor = None
 
-class InfoWorker(Worker[str, str]):
+
+class VideoInfoDict(TypedDict):
+    """
+    Reference to a video extracted by the info stage
+
+    - Videos from flat playlists have no infojson, they are downloaded from their url.
+    - The archive id identifies the video regardless of the url it was reached from,
+      in yt-dlp's download archive format. It is None if unknown.
+    - The filename is the path the video will be downloaded to, if known.
+    - The size (in bytes) and duration (in seconds) are None if unknown.
+    - The source url is the input url the video was extracted from, eg. its playlist.
+    - The lease id identifies the lease of a video downloaded by an agent.
+    """
+
+    original_url: str
+    archive_id: Optional[str]
+    info_path: Optional[str]
+    filename: Optional[str]
+    size: Optional[float]
+    duration: Optional[float]
+    source_url: Optional[str]
+    lease_id: Optional[int]
+
+
+class PlaylistShardDict(TypedDict):
+    """Range of entries of a playlist, to be extracted on its own"""
+
+    url: str
+    playlist_items: str
+
+
+InfoTask = str | PlaylistShardDict
+
+
+class InfoWorker(BatchWorker[InfoTask, VideoInfoDict]):
     """
-    Worker process that treats yt-dlp urls, gets info from them and passes video urls.
+    Worker process that treats yt-dlp urls, gets info from them and passes video infos.
 
     - The input url may refer to a video or playlist.
+    - Input urls may be extracted in batches, to save on yt-dlp startups.
+    - With flat playlists, playlist entries known to be videos are passed as-is,
+      the other entries (eg. nested playlists) are sent back to be enumerated.
+    - With sharding, big playlists are split in ranges of entries
+      that are sent back to be extracted in parallel by the pool.
+    - Tasks sent back to a full input queue are processed by the worker itself,
+      after its current batch.
+    - Failed tasks are handed over to the retry queue.
+    - With a cache, extraction results are stored and replayed on later runs
+      without running yt-dlp.
+    - With a journal, the state of input tasks and discovered videos is recorded.
+    - With an output template, the file each video will be downloaded to is resolved.
+    - With a host limiter, yt-dlp runs hold a slot of the hosts of their urls.
+    - Each video infojson is spilled to a file in the info directory,
+      so that it can be loaded back by the download stage.
     """
 
     input_queue: JoinableQueue
     output_queue: JoinableQueue
 
-    _base_command: Sequence[str]
+    _engine: Engine
+    _info_dir: str
+    _shard_size: int
+    _cache: Optional[InfoCache]
+    _journal: Optional[SessionJournal]
+    _output_template: Optional[OutputTemplate]
+    _limiter: Optional[HostLimiter]
+    _overflow: list[InfoTask]
+    _retry_queue: JoinableQueue
 
     def __init__(
         self,
-        ydl_args: Sequence[str],
+        engine: Engine,
+        info_dir: str,
+        batch_size: int,
+        batch_linger: float,
+        shard_size: int,
+        cache: Optional[InfoCache],
+        journal: Optional[SessionJournal],
+        output_template: Optional[OutputTemplate],
+        limiter: Optional[HostLimiter],
+        retry_queue: JoinableQueue,
         input_queue: JoinableQueue,
         output_queue: JoinableQueue,
     ) -> None:
-        super().__init__(input_queue, output_queue)
-        # Define base command args
-        interceptor = InfoInterceptor()
-        _, allowed = interceptor.parse_known_args(ydl_args)
-        self._base_command = (
-            "yt-dlp",
-            "--simulate",
-            "--dump-json",
-            *allowed,
-        )
-        logging.debug(
-            "InfoWorker initialised with base command: %s",
-            " ".join(self._base_command),
+        super().__init__(batch_size, batch_linger, input_queue, output_queue)
+        self._info_dir = info_dir
+        self._engine = engine
+        self._shard_size = shard_size
+        self._cache = cache
+        self._journal = journal
+        self._output_template = output_template
+        self._limiter = limiter
+        self._overflow = []
+        self._retry_queue = retry_queue
+
+    def _hold_hosts(self, urls: Sequence[str]) -> AbstractContextManager:
+        """Hold a slot of the hosts of the urls during a yt-dlp run, if limited"""
+        if self._limiter is None:
+            return nullcontext()
+        return self._limiter.hold(urls)
+
+    def _spill_info(self, info_json: str) -> str:
+        """Write a video infojson to the info directory and return its path"""
+        fd, path = mkstemp(dir=self._info_dir, suffix=".info.json")
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.write(info_json)
+        return path
+
+    def _process_batch(self, items: Sequence[InfoTask]) -> None:
+        self._process_tasks(items)
+        while len(self._overflow) > 0:
+            tasks, self._overflow = self._overflow, []
+            self._process_tasks(tasks)
+
+    def _process_tasks(self, items: Sequence[InfoTask]) -> None:
+        """
+        Process input urls to be handled by yt-dlp (may be videos or playlists)
+        and pass video infos to the output queue
+        """
+        urls = []
+        for item in items:
+            match item:
+                case dict():
+                    success = self._extract_shard(item)
+                case str():
+                    if self._replay_cached(item):
+                        success = True
+                    elif self._shard_size > 0:
+                        success = self._shard_playlist(item)
+                    else:
+                        urls.append(item)
+                        continue
+            self._journal_task(item, "extracted" if success else "failed")
+        if len(urls) == 0:
+            return
+        logging.debug("Processing urls: %s", " ".join(urls))
+        info_urls: dict[str, list[str]] = {}
+        failed_urls = set()
+
+        def on_error(url: str, error: EngineError) -> None:
+            failed_urls.add(url)
+            self._handle_error(url, error)
+
+        on_info = self._get_info_recorder(info_urls)
+        with self._hold_hosts(urls):
+            self._engine.extract_info_batch(urls, on_info, on_error)
+        for url in urls:
+            if url in failed_urls:
+                self._journal_task(url, "failed")
+                continue
+            self._store_expansion(url, None, info_urls)
+            self._journal_task(url, "extracted")
+
+    def _journal_task(self, task: InfoTask, state: JournalState) -> None:
+        """Record the state transition of an input task in the journal, if any"""
+        if self._journal is not None:
+            self._journal.record_task(task, state)
+
+    def _requeue(self, task: InfoTask) -> None:
+        """
+        Send a task back to the input queue, to be processed by the pool.
+        If the queue is full, the task is kept to be processed after the current batch,
+        as waiting for room could deadlock the pool on its own queue.
+        """
+        self._journal_task(task, "queued")
+        try:
+            self.input_queue.put(task, block=False)
+        except Full:
+            logging.debug("Input queue is full, keeping task: %s", task)
+            self._overflow.append(task)
+
+    def _send_output(self, value: VideoInfoDict) -> None:
+        if self._journal is not None:
+            # The infojson is temporary, resumed videos are downloaded from their url
+            info = {**value, "info_path": None}
+            self._journal.record("video", value["original_url"], "discovered", info)
+        super()._send_output(value)
+
+    def _replay_cached(self, url: str, playlist_items: Optional[str] = None) -> bool:
+        """Handle the cached infos of an input url, return whether there were any"""
+        if self._cache is None:
+            return False
+        info_jsons = self._cache.get_infos(url, playlist_items)
+        if info_jsons is None:
+            return False
+        logging.debug("Replaying %d cached infos for url: %s", len(info_jsons), url)
+        for info_json in info_jsons:
+            self._handle_info(url, json.loads(info_json), info_json)
+        return True
+
+    def _get_info_recorder(self, info_urls: dict[str, list[str]]) -> InfoCallback:
+        """
+        Get an info callback that also stores infos in the cache,
+        recording the urls they are stored under by input url
+        """
+        if self._cache is None:
+            return self._handle_info
+
+        def on_info(url: str, info_dict: dict[str, Any], info_json: str) -> None:
+            if info_dict.get("_type") in ("url", "url_transparent"):
+                info_url = self._get_flat_entry_url(info_dict)
+            else:
+                info_url = info_dict.get("original_url")
+            if info_url is not None:
+                self._cache.put_info(info_url, info_json)
+                info_urls.setdefault(url, []).append(info_url)
+            self._handle_info(url, info_dict, info_json)
+
+        return on_info
+
+    def _store_expansion(
+        self, url: str, playlist_items: Optional[str], info_urls: dict[str, list[str]]
+    ) -> None:
+        """Store the infos recorded for a successfully extracted input url"""
+        if self._cache is not None:
+            self._cache.put_expansion(url, playlist_items, info_urls.get(url, []))
+
+    def _probe_playlist(self, url: str) -> Optional[int]:
+        """Probe a playlist url, storing the result in the cache"""
+        info_urls = {}
+        with self._hold_hosts((url,)):
+            count = self._engine.probe_playlist(url, self._get_info_recorder(info_urls))
+        if count is None:
+            self._store_expansion(url, None, info_urls)
+        elif self._cache is not None:
+            self._cache.put_playlist_count(url, count)
+        return count
+
+    def _shard_playlist(self, url: str) -> bool:
+        """
+        Split a playlist url in shards, or extract it if it's not a big playlist.
+        Return whether it succeeded.
+        """
+        count = None if self._cache is None else self._cache.get_playlist_count(url)
+        if count is None:
+            logging.debug("Probing url: %s", url)
+            try:
+                count = self._probe_playlist(url)
+            except EngineError as e:
+                self._handle_error(url, e)
+                return False
+        if count is None:
+            return True
+        if count <= self._shard_size:
+            logging.debug("Processing url: %s", url)
+            info_urls = {}
+            try:
+                with self._hold_hosts((url,)):
+                    self._engine.extract_info(url, self._get_info_recorder(info_urls))
+            except EngineError as e:
+                self._handle_error(url, e)
+                return False
+            self._store_expansion(url, None, info_urls)
+            return True
+        logging.debug("Sharding playlist of %d entries: %s", count, url)
+        for start in range(1, count + 1, self._shard_size):
+            # The last shard is open-ended, to get entries added since the probe
+            stop = start + self._shard_size - 1
+            playlist_items = f"{start}:{stop}" if stop < count else f"{start}:"
+            self._requeue(PlaylistShardDict(url=url, playlist_items=playlist_items))
+        return True
+
+    def _extract_shard(self, shard: PlaylistShardDict) -> bool:
+        """Extract a range of entries of a playlist, return whether it succeeded"""
+        url = shard["url"]
+        playlist_items = shard["playlist_items"]
+        if self._replay_cached(url, playlist_items):
+            return True
+        logging.debug("Processing items %s of url: %s", playlist_items, url)
+        info_urls = {}
+        on_info = self._get_info_recorder(info_urls)
+        try:
+            with self._hold_hosts((url,)):
+                self._engine.extract_info(url, on_info, playlist_items)
+        except EngineError as e:
+            self._handle_error(shard, e)
+            return False
+        self._store_expansion(url, playlist_items, info_urls)
+        return True
+
+    @staticmethod
+    def _get_task_name(task: InfoTask) -> str:
+        """Get a readable name of an input task"""
+        match task:
+            case dict():
+                return f"{task['url']} (items {task['playlist_items']})"
+            case str():
+                return task
+
+    def _handle_error(self, task: InfoTask, error: EngineError) -> None:
+        """Hand an input task that could not be extracted over to the retry queue"""
+        logging.debug("Failed to get info from %s: %s", task, error)
+        self._record_failure()
+        self._retry_queue.put(
+            RetryRequestDict(item=task, key=self._get_task_name(task), error=str(error))
         )
 
-    def _process_item(self, item: str) -> None:
+    @staticmethod
+    def _get_flat_entry_url(entry: dict[str, Any]) -> Optional[str]:
         """
-        Process an input url to be handled by yt-dlp (may be a video or a playlist)
-        and pass video urls to the output queue
+        Get the url to extract a flat playlist entry from.
+
+        `url` is what yt-dlp would resolve the entry from,
+        `webpage_url` defaults to it but may be overriden by the extractor.
         """
-        logging.debug("Processing url: %s", item)
+        return entry.get("url") or entry.get("webpage_url")
 
-        # Call yt-dlp in a subprocess
+    @staticmethod
+    def _get_archive_id(info_dict: dict[str, Any]) -> Optional[str]:
+        """Get the id of a video in yt-dlp's download archive format"""
+        extractor_key = info_dict.get("extractor_key") or info_dict.get("ie_key")
+        video_id = info_dict.get("id")
+        if extractor_key is None or video_id is None:
+            return None
+        return f"{extractor_key.lower()} {video_id}"
+
+    @staticmethod
+    def _get_size(info_dict: dict[str, Any]) -> Optional[float]:
+        """Get the size of the formats a video will be downloaded in, if known"""
+        formats = info_dict.get("requested_formats") or (info_dict,)
+        sizes = [f.get("filesize") or f.get("filesize_approx") for f in formats]
+        if None in sizes:
+            return None
+        return float(sum(sizes))
+
+    @staticmethod
+    def _get_duration(info_dict: dict[str, Any]) -> Optional[float]:
+        """Get the duration of a video, if known"""
         try:
-            completed_process = run(
-                (*self._base_command, item),
-                capture_output=True,
-                check=True,
-                encoding="utf-8",
-            )
-        except CalledProcessError as e:
-            logging.error("Failed to get info from url %s: %s", item, e)
-            return
+            return float(info_dict["duration"])
+        except (KeyError, TypeError, ValueError):
+            return None
 
-        # Extract video URLs (one video infojson per line)
-        for output_line in completed_process.stdout.splitlines():
-            stripped_line = output_line.strip()
-            if len(stripped_line) == 0:
-                logging.debug("Empty line from yt-dlp")
-                continue
+    @staticmethod
+    def _is_single_video(entry: dict[str, Any], url: str) -> bool:
+        """Check if a flat playlist entry is known to be a single video"""
+        if get_info_extractor is not None and entry.get("ie_key") is not None:
             try:
-                video_info_dict = json.loads(stripped_line)
-            except json.JSONDecodeError:
-                logging.debug("Invalid JSON line from yt-dlp: %s", stripped_line)
-                continue
-            if not isinstance(video_info_dict, dict):
-                logging.debug("Invalid parsed value: %s", video_info_dict)
-                continue
-            video_url = video_info_dict.get("original_url")
-            if video_url is None:
-                logging.debug("No video URL in infojson: %s", video_info_dict)
-                continue
-            logging.debug("Got video URL from yt-dlp: %s", video_url)
-            self._send_output(video_url)
+                extractor = get_info_extractor(entry["ie_key"])
+                is_single_video = extractor.is_single_video(url)
+            except (AttributeError, KeyError):
+                is_single_video = None
+            if is_single_video is not None:
+                return is_single_video
+        # Without the extractor's opinion, only videos are expected to have a duration
+        return entry.get("duration") is not None
+
+    def _handle_flat_entry(self, url: str, entry: dict[str, Any]) -> None:
+        """Pass a flat playlist entry to the output queue, or back to the input queue"""
+        entry_url = self._get_flat_entry_url(entry)
+        if entry_url is None:
+            logging.debug("No URL in flat entry: %s", entry)
+            return
+        if self._is_single_video(entry, entry_url):
+            logging.debug("Got video URL from flat playlist %s: %s", url, entry_url)
+            self._send_output(
+                VideoInfoDict(
+                    original_url=entry_url,
+                    archive_id=self._get_archive_id(entry),
+                    info_path=None,
+                    filename=None,
+                    size=self._get_size(entry),
+                    duration=self._get_duration(entry),
+                    source_url=url,
+                    lease_id=None,
+                )
+            )
+        else:
+            logging.debug("Enumerating nested entry of %s: %s", url, entry_url)
+            self._requeue(entry_url)
+
+    def _handle_info(self, url: str, info_dict: dict[str, Any], info_json: str) -> None:
+        """Pass a video infojson extracted by the engine to the output queue"""
+        if info_dict.get("_type") in ("url", "url_transparent"):
+            self._handle_flat_entry(url, info_dict)
+            return
+        video_url = info_dict.get("original_url")
+        if video_url is None:
+            logging.debug("No video URL in infojson: %s", info_dict)
+            return
+        logging.debug("Got video URL from yt-dlp for %s: %s", url, video_url)
+        info_path = self._spill_info(info_json)
+        filename = None
+        if self._output_template is not None:
+            filename = self._output_template.get_filename(info_dict)
+        self._send_output(
+            VideoInfoDict(
+                original_url=video_url,
+                archive_id=self._get_archive_id(info_dict),
+                info_path=info_path,
+                filename=filename,
+                size=self._get_size(info_dict),
+                duration=self._get_duration(info_dict),
+                source_url=url,
+                lease_id=None,
+            )
+        )
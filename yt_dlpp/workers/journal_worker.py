@@ -0,0 +1,46 @@
+import sqlite3
+from multiprocessing import JoinableQueue
+from typing import Optional, Sequence
+
+from yt_dlpp.journal.session_journal import JournalEventDict, connect_journal
+from yt_dlpp.workers.worker import BatchWorker
+
+
+class JournalWorker(BatchWorker[JournalEventDict, None]):
+    """
+    Worker process that appends the session's events to its journal
+
+    - Events are written in batches, one transaction each,
+      so that journaling keeps up with thousands of events per second.
+    """
+
+    input_queue: JoinableQueue
+    output_queue: None = None
+
+    _path: str
+    _cached_connection: Optional[sqlite3.Connection] = None
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int,
+        batch_linger: float,
+        input_queue: JoinableQueue,
+    ) -> None:
+        super().__init__(batch_size, batch_linger, input_queue, None)
+        self._path = path
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        """Get the process' connection to the journal"""
+        if self._cached_connection is None:
+            self._cached_connection = connect_journal(self._path)
+        return self._cached_connection
+
+    def _process_batch(self, items: Sequence[JournalEventDict]) -> None:
+        with self._connection as connection:
+            connection.executemany(
+                "INSERT INTO events (time, kind, key, state, info) "
+                "VALUES (:time, :kind, :key, :state, :info)",
+                items,
+            )
@@ -0,0 +1,174 @@
+import logging
+import os
+import sys
+import time
+from multiprocessing import Event, JoinableQueue, Value
+from queue import Empty
+from typing import Optional
+
+from yt_dlpp.dedup.video_archive import VideoArchive
+from yt_dlpp.distributed.work_ledger import (
+    LeaseReportDict,
+    WorkLedger,
+    serve_ledger,
+    stop_ledger_server,
+)
+from yt_dlpp.journal.session_journal import JournalState, SessionJournal
+from yt_dlpp.progress.progress_board import ProgressBoard
+from yt_dlpp.workers.download_worker import DownloadEndDict
+from yt_dlpp.workers.info_worker import VideoInfoDict
+from yt_dlpp.workers.retry_worker import RetryRequestDict
+from yt_dlpp.workers.worker import Worker
+
+
+class LeaseWorker(Worker[VideoInfoDict, DownloadEndDict]):
+    """
+    Worker process of a coordinator, that leases the videos to download to its agents
+
+    - The work ledger is served to the agents over TCP from the worker's process.
+      `port` is set to the port it is served on (0 if it can't be), then `ready`.
+    - Videos are acknowledged once an agent reports their end,
+      so that joining the input queue waits for the agents to download them.
+    - Failed videos are handed over to the retry queue, from their url.
+    - Reported ends are sent to the output queue.
+      With a journal, the state of videos is recorded.
+      With an archive, downloaded videos are added to it.
+    - The progress reported by the agents is mirrored on the progress board,
+      in as many slots as it has.
+    - Once dismissed, the ledger is closed, and served until the live agents
+      were told that there will be no more videos, for up to a lease timeout.
+    """
+
+    input_queue: JoinableQueue
+    output_queue: JoinableQueue
+
+    ready: Event
+    port: Value
+
+    _POLL_INTERVAL = 0.1
+
+    _address: tuple[str, int]
+    _key: bytes
+    _lease_timeout: float
+    _archive: Optional[VideoArchive]
+    _journal: Optional[SessionJournal]
+    _progress_board: ProgressBoard
+    _retry_queue: JoinableQueue
+    _ledger: WorkLedger
+    _progress_slots: list[int]
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        key: bytes,
+        lease_timeout: float,
+        archive: Optional[VideoArchive],
+        journal: Optional[SessionJournal],
+        progress_board: ProgressBoard,
+        retry_queue: JoinableQueue,
+        input_queue: JoinableQueue,
+        output_queue: JoinableQueue,
+    ) -> None:
+        super().__init__(input_queue, output_queue)
+        self.ready = Event()
+        self.port = Value("i", 0)
+        self._address = address
+        self._key = key
+        self._lease_timeout = lease_timeout
+        self._archive = archive
+        self._journal = journal
+        self._progress_board = progress_board
+        self._retry_queue = retry_queue
+
+    def _journal_video(self, video_url: str, state: JournalState) -> None:
+        """Record the state transition of a video in the journal, if any"""
+        if self._journal is not None:
+            self._journal.record("video", video_url, state)
+
+    def _process_item(self, item: VideoInfoDict) -> None:
+        self._ledger.add(item)
+
+    def _handle_report(self, report: LeaseReportDict) -> None:
+        """Handle the end of a leased video, then acknowledge it"""
+        item = report["item"]
+        video_url = item["original_url"]
+        if report["error"] is None:
+            logging.debug("Download finished for %s", video_url)
+            self._journal_video(video_url, "done")
+            if self._archive is not None and item["archive_id"] is not None:
+                self._archive.add(item["archive_id"])
+        else:
+            logging.debug("Failed to download %s: %s", video_url, report["error"])
+            self._record_failure()
+            self._journal_video(video_url, "failed")
+            retry_item = VideoInfoDict(**{**item, "info_path": None})
+            self._retry_queue.put(
+                RetryRequestDict(item=retry_item, key=video_url, error=report["error"])
+            )
+        self._send_output(report["end"])
+        if item["info_path"] is not None:
+            os.remove(item["info_path"])
+        self.input_queue.task_done()
+
+    def _claim_progress_slots(self) -> list[int]:
+        """Claim all the slots of the progress board"""
+        slots = []
+        while True:
+            try:
+                slots.append(self._progress_board.claim_slot())
+            except IndexError:
+                return slots
+
+    def _mirror_progress(self) -> None:
+        """Show the progress reported by the agents on the progress board"""
+        progress_lines = self._ledger.get_progress()
+        for i, slot in enumerate(self._progress_slots):
+            if i < len(progress_lines):
+                self._progress_board.write(slot, progress_lines[i])
+            else:
+                self._progress_board.clear(slot)
+
+    def _run(self) -> None:
+        self._ledger = WorkLedger(self._lease_timeout)
+        self._progress_slots = self._claim_progress_slots()
+        try:
+            server = serve_ledger(self._ledger, self._address, self._key)
+        except OSError as e:
+            logging.error("Could not serve the work ledger: %s", e)
+            self.ready.set()
+            sys.exit(1)
+        self.port.value = server.address[1]
+        self.ready.set()
+
+        dismissed = False
+        while not dismissed:
+            try:
+                item = self._get_input(timeout=self._POLL_INTERVAL)
+            except Empty:
+                pass
+            else:
+                if item is None:
+                    dismissed = True
+                else:
+                    self._handle_item(item)
+            for lease in self._ledger.expire():
+                logging.warning(
+                    "Lease of %s by agent %s expired, reassigning it",
+                    lease["item"]["original_url"],
+                    lease["agent"],
+                )
+            for report in self._ledger.take_reports():
+                self._handle_report(report)
+            self._mirror_progress()
+
+        # Agents are told that there are no more videos when they ask for some
+        self._ledger.close()
+        deadline = time.monotonic() + self._lease_timeout
+        while self._ledger.has_waiting_agents() and time.monotonic() < deadline:
+            time.sleep(self._POLL_INTERVAL)
+        stop_ledger_server(server)
+        for slot in self._progress_slots:
+            self._progress_board.clear(slot)
+        self._finish()
+        self.input_queue.task_done()
+        sys.exit(0)
@@ -0,0 +1,83 @@
+import logging
+import os
+from multiprocessing import JoinableQueue
+from typing import Optional
+
+from yt_dlpp.dedup.video_archive import VideoArchive
+from yt_dlpp.engines.engine import Engine, EngineError
+from yt_dlpp.journal.session_journal import JournalState, SessionJournal
+from yt_dlpp.workers.download_worker import DownloadEndDict, PostProcessRequestDict
+from yt_dlpp.workers.info_worker import VideoInfoDict
+from yt_dlpp.workers.retry_worker import RetryRequestDict
+from yt_dlpp.workers.worker import Worker
+
+
+class PostProcessWorker(Worker[PostProcessRequestDict, DownloadEndDict]):
+    """
+    Worker process that post-processes the videos downloaded by the download workers
+
+    - yt-dlp runs again on the infojson of the video, finds its downloaded files
+      and only merges their formats, fixes them up and runs the post-processors.
+      Those are mostly CPU-bound, so download slots are not held meanwhile.
+    - The end of the download is sent to the output queue once post-processed.
+    - Failed post-processings are handed over to the download retry queue,
+      from the video url.
+    - With a journal, the end state of videos is recorded.
+    - With an archive, post-processed videos are added to it.
+    """
+
+    input_queue: JoinableQueue
+    output_queue: JoinableQueue
+
+    _engine: Engine
+    _archive: Optional[VideoArchive]
+    _journal: Optional[SessionJournal]
+    _retry_queue: JoinableQueue
+
+    def __init__(
+        self,
+        engine: Engine,
+        archive: Optional[VideoArchive],
+        journal: Optional[SessionJournal],
+        retry_queue: JoinableQueue,
+        input_queue: JoinableQueue,
+        output_queue: JoinableQueue,
+    ) -> None:
+        super().__init__(input_queue, output_queue)
+        self._engine = engine
+        self._archive = archive
+        self._journal = journal
+        self._retry_queue = retry_queue
+
+    def _journal_video(self, video_url: str, state: JournalState) -> None:
+        """Record the state transition of a video in the journal, if any"""
+        if self._journal is not None:
+            self._journal.record("video", video_url, state)
+
+    def _process_item(self, item: PostProcessRequestDict) -> None:
+        video = item["item"]
+        video_url = video["original_url"]
+        logging.debug("Starting post-processing for %s", video_url)
+        try:
+            self._engine.post_process_info_file(video["info_path"])
+        except EngineError as e:
+            logging.debug("Failed to post-process %s: %s", video_url, e)
+            self._record_failure()
+            self._journal_video(video_url, "failed")
+            self._send_output(DownloadEndDict(**{**item["end"], "success": False}))
+            retry_item = VideoInfoDict(**{**video, "info_path": None})
+            self._retry_queue.put(
+                RetryRequestDict(item=retry_item, key=video_url, error=str(e))
+            )
+        else:
+            self._journal_video(video_url, "done")
+            self._send_output(item["end"])
+            if self._archive is not None and video["archive_id"] is not None:
+                self._archive.add(video["archive_id"])
+        finally:
+            # yt-dlp or a retry may have removed it already
+            try:
+                os.remove(video["info_path"])
+            except FileNotFoundError:
+                pass
+        logging.debug("Post-processing finished for %s", video_url)
@@ -1,6 +1,8 @@
 import logging
 from multiprocessing import JoinableQueue
-from typing import Optional, TypedDict
+from queue import Empty
+from time import monotonic
+from typing import Optional, Sequence, TypedDict
 
 from rich.progress import (
     BarColumn,
@@ -11,8 +13,12 @@ from rich.progress import (
     filesize,
 )
 
-from yt_dlpp.workers.download_worker import ProgressLineDict
-from yt_dlpp.workers.worker import Worker
+from yt_dlpp.engines.engine import ProgressLineDict
+from yt_dlpp.progress.progress_board import ProgressBoard, get_board_video_id
+from yt_dlpp.scheduling.bandwidth import BandwidthBudget
+from yt_dlpp.scheduling.concurrency import AimdController
+from yt_dlpp.workers.download_worker import DownloadEndDict
+from yt_dlpp.workers.worker import BatchWorker
 
 
 class _VideoTaskInfo(TypedDict):
@@ -30,34 +36,69 @@ class _CustomFields(TypedDict):
     custom_eta: str
 
 
-class ProgressWorker(Worker):
-    """Worker in charge of displaying progress info"""
+class _SummaryInfo(TypedDict):
+    """Aggregated information about the finished video tasks"""
+
+    task_id: TaskID
+    n_succeeded: int
+    n_failed: int
+    downloaded_bytes: float
+
+
+class ProgressWorker(BatchWorker[DownloadEndDict, None]):
+    """
+    Worker in charge of displaying progress info
+
+    - The progress board is polled once per refresh,
+      download ends received in between are processed as a batch.
+    - Finished videos are removed and counted in a summary row,
+      so that rendering doesn't slow down as the session goes on.
+    - With a concurrency controller, the aggregate speed of downloads
+      is fed to it on every refresh.
+    - With a bandwidth budget, the speed of every download
+      is fed to it on every refresh.
+    """
 
     input_queue: JoinableQueue
     output_queue: None = None
 
     _progress_bar: Progress
     _tasks: dict[str, _VideoTaskInfo]
+    _summary: Optional[_SummaryInfo]
+    _progress_board: ProgressBoard
+    _refresh_rate: float
+    _controller: Optional[AimdController]
+    _budget: Optional[BandwidthBudget]
     _unknown_value = "?"
 
-    def __init__(self, input_queue: JoinableQueue):
-        super().__init__(input_queue, None)
+    def __init__(
+        self,
+        progress_board: ProgressBoard,
+        refresh_rate: float,
+        controller: Optional[AimdController],
+        budget: Optional[BandwidthBudget],
+        input_queue: JoinableQueue,
+    ):
+        super().__init__(1000, 1 / refresh_rate, input_queue, None)
+        self._progress_board = progress_board
+        self._refresh_rate = refresh_rate
+        self._controller = controller
+        self._budget = budget
 
-    def run(self) -> None:
+    def _run(self) -> None:
         self._tasks = {}
+        self._summary = None
         columns = (
-            TextColumn('"[progress.description]{task.description}"'),
+            TextColumn("[progress.description]{task.description}"),
             BarColumn(),
             TaskProgressColumn(),
-            TextColumn("of"),
             TextColumn("{task.fields[custom_total]}", style="progress.filesize"),
-            TextColumn("at"),
             TextColumn("{task.fields[custom_speed]}", style="progress.data.speed"),
-            TextColumn("ETA"),
             TextColumn("{task.fields[custom_eta]}", style="progress.eta"),
         )
-        with Progress(*columns) as self._progress_bar:
-            super().run()
+        with Progress(*columns, refresh_per_second=self._refresh_rate) as bar:
+            self._progress_bar = bar
+            super()._run()
 
     def _get_estimated_total_bytes(
         self, progress_info: ProgressLineDict
@@ -94,26 +135,25 @@ class ProgressWorker(Worker):
     def _format_custom_total(self, total_bytes: float, is_estimate: bool) -> str:
         # No total bytes available
         if total_bytes is None:
-            return self._unknown_value
+            return f"of {self._unknown_value}"
         # Pretty format total bytes
         prefix = "~ " if is_estimate else ""
-        return prefix + filesize.decimal(int(total_bytes))
+        return f"of {prefix}{filesize.decimal(int(total_bytes))}"
 
     def _format_custom_speed(self, speed: float) -> str:
-        return filesize.decimal(int(speed)) + "/s"
+        return f"at {filesize.decimal(int(speed))}/s"
 
     def _format_custom_eta(self, eta_seconds: Optional[float]) -> str:
         # No ETA available
-        style = "progress.eta"
         if eta_seconds is None:
-            return self._unknown_value
+            return f"ETA {self._unknown_value}"
         # Pretty format ETA
         minutes, seconds = divmod(int(eta_seconds), 60)
         hours, minutes = divmod(minutes, 60)
         return (
-            f"{hours:d}:{minutes:02d}:{seconds:02d}"
+            f"ETA {hours:d}:{minutes:02d}:{seconds:02d}"
             if hours
-            else f"{minutes:02d}:{seconds:02d}"
+            else f"ETA {minutes:02d}:{seconds:02d}"
         )
 
     def _create_empty_custom_fields(self) -> _CustomFields:
@@ -131,7 +171,7 @@ class ProgressWorker(Worker):
         """Create a new progress task for a video ID"""
         logging.debug("Creating progress task for %s", video_id)
         task_id = self._progress_bar.add_task(
-            description=title, start=False, **self._create_empty_custom_fields()
+            description=f'"{title}"', start=False, **self._create_empty_custom_fields()
         )
         self._tasks[video_id] = _VideoTaskInfo(task_id=task_id, started=False)
 
@@ -166,7 +206,82 @@ class ProgressWorker(Worker):
             task_id, completed=downloaded_bytes, total=total_bytes, **fields
         )
 
-    def _process_item(self, progress_info: ProgressLineDict) -> None:
+    def _end_task(self, end: DownloadEndDict) -> None:
+        """Remove the progress task of a finished video and count it in the summary"""
+        # Tasks are keyed by the ids read from the board
+        video_id = end["video_id"]
+        if video_id is not None:
+            video_id = get_board_video_id(video_id)
+        if video_id in self._tasks:
+            logging.debug("Removing progress task for %s", video_id)
+            self._progress_bar.remove_task(self._tasks.pop(video_id)["task_id"])
+        if self._summary is None:
+            task_id = self._progress_bar.add_task(
+                description="", **self._create_empty_custom_fields()
+            )
+            self._summary = _SummaryInfo(
+                task_id=task_id, n_succeeded=0, n_failed=0, downloaded_bytes=0
+            )
+        if end["success"]:
+            self._summary["n_succeeded"] += 1
+        else:
+            self._summary["n_failed"] += 1
+        self._summary["downloaded_bytes"] += end["downloaded_bytes"]
+
+    def _update_summary(self) -> None:
+        """Update the summary row of the finished videos"""
+        if self._summary is None:
+            return
+        n_finished = self._summary["n_succeeded"] + self._summary["n_failed"]
+        description = f"Finished: {self._summary['n_succeeded']} downloaded"
+        if self._summary["n_failed"] > 0:
+            description += f", {self._summary['n_failed']} failed attempts"
+        self._progress_bar.update(
+            self._summary["task_id"],
+            description=description,
+            completed=n_finished,
+            total=n_finished + len(self._tasks),
+            custom_total=filesize.decimal(int(self._summary["downloaded_bytes"])),
+            custom_speed="",
+            custom_eta="",
+        )
+
+    def _get_batch(self) -> list[Optional[DownloadEndDict]]:
+        """Get the download ends received until the next refresh"""
+        batch = []
+        deadline = monotonic() + self._batch_linger
+        while len(batch) == 0 or batch[-1] is not None:
+            timeout = max(deadline - monotonic(), 0)
+            try:
+                batch.append(self._get_input(timeout=timeout))
+            except Empty:
+                break
+        return batch
+
+    def _process_batch(self, items: Sequence[DownloadEndDict]) -> None:
+        # Slots are cleared before download ends are sent,
+        # so ended videos are not on the board anymore.
+        slot_progress_infos = self._progress_board.read_slots()
+        progress_infos = slot_progress_infos.values()
+        for progress_info in progress_infos:
+            self._process_progress(progress_info)
+        if self._controller is not None:
+            speed = sum(self._get_speed(info) for info in progress_infos)
+            self._controller.observe(speed, len(progress_infos))
+        if self._budget is not None:
+            self._budget.observe(
+                {
+                    slot: info["progress"]["speed"]
+                    for slot, info in slot_progress_infos.items()
+                    if "speed" in info["progress"]
+                }
+            )
+        for end in items:
+            self._end_task(end)
+        self._update_summary()
+
+    def _process_progress(self, progress_info: ProgressLineDict) -> None:
+        """Create, start or update the progress task of a video"""
         # Get current info
         video_id = progress_info["video"]["id"]
         real_total_bytes = self._get_real_total_bytes(progress_info)
@@ -0,0 +1,158 @@
+import heapq
+import json
+import logging
+import sys
+from itertools import count
+from multiprocessing import JoinableQueue, Value
+from queue import Empty
+from time import monotonic
+from typing import Any, Iterator, Optional, TypedDict
+
+from yt_dlpp.scheduling.retry import get_backoff, is_retryable
+from yt_dlpp.workers.worker import Worker
+
+
+class RetryRequestDict(TypedDict):
+    """
+    Item whose processing failed, to be retried later
+
+    - The key identifies the item across its attempts.
+    """
+
+    item: Any
+    key: str
+    error: str
+
+
+class FailureDict(TypedDict):
+    """Item that failed for good, as written to the failure report"""
+
+    stage: str
+    key: str
+    attempts: int
+    error: str
+
+
+class RetryWorker(Worker[RetryRequestDict, Any]):
+    """
+    Worker process that sends failed items back to their stage after a delay
+
+    - Workers hand failed items over right away, so that they are free
+      for other items during the delay.
+    - The delay grows exponentially with the attempts of an item, with jitter.
+    - Items that failed with a permanent error, or too many times, are not retried.
+      They are appended to the failure report when the worker is dismissed.
+    - Items are acknowledged once sent back, so that joining the input queue
+      waits for all the pending retries.
+    """
+
+    input_queue: JoinableQueue
+    output_queue: JoinableQueue
+
+    n_retried: Value
+    n_failed: Value
+
+    _stage: str
+    _max_attempts: int
+    _base_delay: float
+    _max_delay: float
+    _report_path: Optional[str]
+    _attempts: dict[str, int]
+    _delayed: list[tuple[float, int, float, RetryRequestDict]]
+    _failures: list[FailureDict]
+    _seq: Iterator[int]
+
+    def __init__(
+        self,
+        stage: str,
+        max_attempts: int,
+        base_delay: float,
+        max_delay: float,
+        report_path: Optional[str],
+        input_queue: JoinableQueue,
+        output_queue: JoinableQueue,
+    ) -> None:
+        super().__init__(input_queue, output_queue)
+        self.n_retried = Value("i", 0)
+        self.n_failed = Value("i", 0)
+        self._stage = stage
+        self._max_attempts = max_attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._report_path = report_path
+
+    def _process_item(self, item: RetryRequestDict) -> None:
+        attempt = self._attempts.get(item["key"], 0) + 1
+        self._attempts[item["key"]] = attempt
+        if not is_retryable(item["error"]) or attempt >= self._max_attempts:
+            logging.error("Giving up on %s: %s", item["key"], item["error"])
+            self._record_failure()
+            self._failures.append(
+                FailureDict(
+                    stage=self._stage,
+                    key=item["key"],
+                    attempts=attempt,
+                    error=item["error"],
+                )
+            )
+            with self.n_failed.get_lock():
+                self.n_failed.value += 1
+            self.input_queue.task_done()
+            return
+        delay = get_backoff(attempt, self._base_delay, self._max_delay)
+        logging.warning(
+            "Retrying %s in %.1f s (attempt %d failed): %s",
+            item["key"],
+            delay,
+            attempt,
+            item["error"],
+        )
+        now = monotonic()
+        heapq.heappush(self._delayed, (now + delay, next(self._seq), now, item))
+
+    def _send_due(self) -> None:
+        """Send the items whose delay is over back to their stage"""
+        while len(self._delayed) > 0 and self._delayed[0][0] <= monotonic():
+            _, _, delay_start, item = heapq.heappop(self._delayed)
+            self._trace_wait("wait retry", delay_start, item)
+            self._send_output(item["item"])
+            # Counted before acknowledging, so that joiners see it
+            with self.n_retried.get_lock():
+                self.n_retried.value += 1
+            self.input_queue.task_done()
+
+    def _write_report(self) -> None:
+        """Append the items that failed for good to the failure report"""
+        if self._report_path is None or len(self._failures) == 0:
+            return
+        try:
+            with open(self._report_path, "a", encoding="utf-8") as file:
+                for failure in self._failures:
+                    file.write(json.dumps(failure) + "\n")
+        except OSError as e:
+            logging.error("Could not write the failure report: %s", e)
+
+    def _run(self) -> None:
+        self._attempts = {}
+        self._delayed = []
+        self._failures = []
+        self._seq = count()
+        while True:
+            timeout = None
+            if len(self._delayed) > 0:
+                timeout = max(self._delayed[0][0] - monotonic(), 0)
+            try:
+                item = self._get_input(timeout=timeout)
+            except Empty:
+                pass
+            else:
+                if item is None:
+                    break
+                self._handle_item(item)
+            self._send_due()
+
+        # Dismissed once no retry is pending
+        self._write_report()
+        self._finish()
+        self.input_queue.task_done()
+        sys.exit(0)
@@ -0,0 +1,125 @@
+import heapq
+import logging
+import sys
+import time
+from collections import OrderedDict
+from multiprocessing import JoinableQueue
+from queue import Empty
+from typing import Any, Optional
+
+from yt_dlpp.scheduling.concurrency import ConcurrencyGate
+from yt_dlpp.scheduling.download_order import DownloadOrder
+from yt_dlpp.scheduling.host_limiter import HostLimiter, get_host
+from yt_dlpp.workers.info_worker import VideoInfoDict
+from yt_dlpp.workers.worker import Worker
+
+_PendingVideo = tuple[tuple[Any, ...], float, VideoInfoDict]
+
+
+class SchedulerWorker(Worker[VideoInfoDict, VideoInfoDict]):
+    """
+    Worker process that dispatches videos to the download workers
+
+    - Videos are held back until a download worker is free (a slot of the
+      dispatch gate), then the first one in the download order is dispatched.
+    - With a host limiter, videos wait in a priority queue per host,
+      hosts are served round-robin so that a slow or strict host doesn't hold back
+      the others. A video is dispatched once the limiter gives a slot of its host.
+    - Download workers release the slots at the end of the download.
+    - Videos are acknowledged once dispatched, so that joining the input queue
+      waits for all of them to be dispatched.
+    - With a bound, no more videos are taken in while that many are pending,
+      the download order then applies to the pending ones.
+    """
+
+    input_queue: JoinableQueue
+    output_queue: JoinableQueue
+
+    _POLL_INTERVAL = 0.05
+
+    _order: DownloadOrder
+    _dispatch_gate: ConcurrencyGate
+    _limiter: Optional[HostLimiter]
+    _max_pending: int
+    _pending: OrderedDict[str, list[_PendingVideo]]
+    _n_pending: int
+
+    def __init__(
+        self,
+        order: DownloadOrder,
+        dispatch_gate: ConcurrencyGate,
+        limiter: Optional[HostLimiter],
+        max_pending: int,
+        input_queue: JoinableQueue,
+        output_queue: JoinableQueue,
+    ) -> None:
+        super().__init__(input_queue, output_queue)
+        self._order = order
+        self._dispatch_gate = dispatch_gate
+        self._limiter = limiter
+        self._max_pending = max_pending
+
+    def _process_item(self, item: VideoInfoDict) -> None:
+        # Without limits, all videos share a single queue
+        host = "" if self._limiter is None else get_host(item["original_url"])
+        heap = self._pending.setdefault(host, [])
+        heapq.heappush(heap, (self._order.get_key(item), time.monotonic(), item))
+        self._n_pending += 1
+
+    def _try_acquire(self, host: str) -> bool:
+        """Take a dispatch slot, and a slot of the host if limited"""
+        if not self._dispatch_gate.try_acquire():
+            return False
+        if self._limiter is not None and not self._limiter.try_acquire(host):
+            self._dispatch_gate.release()
+            return False
+        return True
+
+    def _dispatch_round(self) -> bool:
+        """Dispatch a video of every host that allows it, return whether any was"""
+        dispatched = False
+        for host in list(self._pending):
+            if not self._try_acquire(host):
+                continue
+            heap = self._pending.pop(host)
+            _, pending_time, video = heapq.heappop(heap)
+            self._n_pending -= 1
+            self._trace_wait("wait download slot", pending_time, video)
+            logging.debug("Dispatching %s", video["original_url"])
+            self._send_output(video)
+            self.input_queue.task_done()
+            dispatched = True
+            # Served hosts go to the back of the round
+            if len(heap) > 0:
+                self._pending[host] = heap
+        return dispatched
+
+    def _take_item(self) -> bool:
+        """Wait for the next input item, return whether it is the dismissal signal"""
+        timeout = self._POLL_INTERVAL if self._n_pending > 0 else None
+        try:
+            item = self._get_input(timeout=timeout)
+        except Empty:
+            return False
+        if item is None:
+            return True
+        self._handle_item(item)
+        return False
+
+    def _run(self) -> None:
+        self._pending = OrderedDict()
+        self._n_pending = 0
+        dismissed = False
+        while not dismissed or self._n_pending > 0:
+            # Wait for new videos, or for slots to be freed
+            if dismissed or 0 < self._max_pending <= self._n_pending:
+                time.sleep(self._POLL_INTERVAL)
+            else:
+                dismissed = self._take_item()
+            while self._dispatch_round():
+                pass
+
+        # Acknowledge the dismissal once outputs are written
+        self._finish()
+        self.input_queue.task_done()
+        sys.exit(0)
@@ -1,7 +1,15 @@
 import sys
 from abc import abstractmethod
+from contextlib import contextmanager
+from cProfile import Profile
 from multiprocessing import Process
-from typing import Any, Generic, TypeVar
+from queue import Empty
+from time import monotonic
+from typing import Any, Generic, Iterator, Optional, Sequence, TypeVar
+
+from yt_dlpp.metrics.pipeline_metrics import StageMetrics
+from yt_dlpp.metrics.profiler import WorkerProfiler
+from yt_dlpp.metrics.trace import Tracer, TraceWriter
 
 # HACK: Type hints are bad, but it's not my fault.
 # mutiprocessing queues don't support type hints, for some god-forsaken reason.
@@ -22,6 +30,18 @@ class WorkerInterface(Generic[TaskInputValueT, TaskOutputValueT]):
     def get_input_queue(self) -> Any:
         """Get the worker's input queue"""
 
+    @abstractmethod
+    def record_metrics(self, metrics: StageMetrics) -> None:
+        """Record the processing of items to the metrics, must be set before start"""
+
+    @abstractmethod
+    def record_trace(self, tracer: Tracer) -> None:
+        """Record the spans of items to the tracer, must be set before start"""
+
+    @abstractmethod
+    def record_profile(self, profiler: WorkerProfiler) -> None:
+        """Profile the worker with the profiler, must be set before start"""
+
     @abstractmethod
     def dismiss(self) -> None:
         """Signal to the worker to exit"""
@@ -30,18 +50,125 @@ class WorkerInterface(Generic[TaskInputValueT, TaskOutputValueT]):
 class Worker(Process, WorkerInterface[TaskInputValueT, TaskOutputValueT]):
     """Worker process with input and output queues"""
 
+    _metrics: Optional[StageMetrics] = None
+    _tracer: Optional[Tracer] = None
+    _trace_writer: Optional[TraceWriter] = None
+    _profiler: Optional[WorkerProfiler] = None
+    _profile_index: int = 0
+    _profile: Optional[Profile] = None
+
     # --- Protected methods
 
+    @property
+    def _stage_name(self) -> str:
+        """Name of the worker's stage, to name its spans"""
+        if self._metrics is None:
+            return type(self).__name__
+        return self._metrics.name
+
+    def _get_trace_writer(self) -> Optional[TraceWriter]:
+        """Get the trace writer of the worker if tracing, opened on first use"""
+        if self._tracer is not None and self._trace_writer is None:
+            self._trace_writer = self._tracer.open(self.name)
+        return self._trace_writer
+
+    def _trace_span(self, name: str, start: float, item: Any, n_items: int = 1) -> None:
+        """Trace the span of an item (or of a batch) that ends now, if tracing"""
+        if (writer := self._get_trace_writer()) is not None:
+            writer.span(name, start, monotonic(), item, n_items)
+
+    def _trace_wait(self, name: str, start: float, item: Any) -> None:
+        """Trace a wait of an item that ends now, if tracing"""
+        if (writer := self._get_trace_writer()) is not None:
+            writer.wait(name, start, monotonic(), item)
+
+    def _get_input(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        """Take the next input item, tracing the time it waited in the queue"""
+        put_time, item = self.input_queue.get_stamped(block, timeout)
+        if item is not None:
+            self._trace_wait(f"wait {self._stage_name}", put_time, item)
+        return item
+
+    @contextmanager
+    def _profiling(self) -> Iterator[None]:
+        """Profile the code run in the context, in the current thread, if profiling"""
+        if self._profiler is not None and self._profile is None:
+            self._profile = Profile()
+        enabled = False
+        if self._profile is not None:
+            try:
+                self._profile.enable()
+                enabled = True
+            except ValueError:
+                # Since Python 3.12, a single profiler may be active per process
+                pass
+        try:
+            yield
+        finally:
+            if enabled:
+                self._profile.disable()
+
+    def _dump_profile(self) -> None:
+        """Write the profile of the worker, if profiling"""
+        if self._profile is not None:
+            path = self._profiler.get_path(self._stage_name, self._profile_index)
+            self._profile.dump_stats(path)
+
+    def _record_failure(self) -> None:
+        """Record a failed item in the metrics, if any"""
+        if self._metrics is not None:
+            self._metrics.record_failure()
+
     def _send_output(self, value: TaskOutputValueT) -> None:
         """Send an item to the output queue if it exists, else do nothing"""
         if self.output_queue is None:
             return
         self.output_queue.put(value)
 
+    def _flush_output(self) -> None:
+        """Wait for the items sent to the output queue to be actually written to it"""
+        if self.output_queue is None:
+            return
+        self.output_queue.close()
+        self.output_queue.join_thread()
+
+    def _finish(self) -> None:
+        """Flush the outputs and dump the profile, before acknowledging the dismissal"""
+        self._flush_output()
+        self._dump_profile()
+
     @abstractmethod
     def _process_item(self, item: TaskInputValueT) -> None:
         """Process an item and pass results to the output queue"""
 
+    def _handle_item(self, item: TaskInputValueT) -> None:
+        """Process an item, recording its processing time and span"""
+        start = monotonic()
+        self._process_item(item)
+        if self._metrics is not None:
+            self._metrics.record_processing(monotonic() - start)
+        self._trace_span(self._stage_name, start, item)
+
+    def _run(self) -> None:
+        """Main loop of the worker"""
+        while True:
+            # Process the next item
+            item: TaskInputValueT = self._get_input()
+            if item is not None:
+                self._handle_item(item)
+            else:
+                # Queue puts are asynchronous, outputs must be written before
+                # the dismissal is acknowledged and the next worker is dismissed.
+                self._finish()
+            self.input_queue.task_done()
+
+            # Stop if requested to
+            if item is None:
+                break
+
+        # Exit gracefuly
+        sys.exit(0)
+
     # --- Init
 
     def __init__(
@@ -55,21 +182,10 @@ class Worker(Process, WorkerInterface[TaskInputValueT, TaskOutputValueT]):
 
     # --- Public methods
 
-    def run(self):
-        """Subprocess' main function"""
-        while True:
-            # Process the next item
-            item: TaskInputValueT = self.input_queue.get()
-            if item is not None:
-                self._process_item(item)
-            self.input_queue.task_done()
-
-            # Stop if requested to
-            if item is None:
-                break
-
-        # Exit gracefuly
-        sys.exit(0)
+    def run(self) -> None:
+        """Subprocess' main function, profiled if asked to"""
+        with self._profiling():
+            self._run()
 
     def start(self):
         super(Process, self).start()
@@ -80,6 +196,95 @@ class Worker(Process, WorkerInterface[TaskInputValueT, TaskOutputValueT]):
     def get_input_queue(self):
         return self.input_queue
 
+    def record_metrics(self, metrics: StageMetrics) -> None:
+        self._metrics = metrics
+
+    def record_trace(self, tracer: Tracer) -> None:
+        self._tracer = tracer
+
+    def record_profile(self, profiler: WorkerProfiler, index: int = 0) -> None:
+        self._profiler = profiler
+        self._profile_index = index
+
+
+class BatchWorker(Worker[TaskInputValueT, TaskOutputValueT]):
+    """
+    Worker process that processes its input items in batches
+
+    - A batch is made of up to `batch_size` items,
+      or of the items that arrive within `batch_linger` seconds of the first one.
+    """
+
+    _batch_size: int
+    _batch_linger: float
+
+    # --- Protected methods
+
+    @abstractmethod
+    def _process_batch(self, items: Sequence[TaskInputValueT]) -> None:
+        """
+        Process a batch of items and pass results to the output queue.
+        The batch may be empty, eg. if the dismissal signal came alone.
+        """
+
+    def _process_item(self, item: TaskInputValueT) -> None:
+        self._process_batch((item,))
+
+    def _handle_batch(self, items: Sequence[TaskInputValueT]) -> None:
+        """Process a batch of items, recording its processing time and span"""
+        if len(items) == 0:
+            self._process_batch(items)
+            return
+        start = monotonic()
+        self._process_batch(items)
+        if self._metrics is not None:
+            self._metrics.record_processing(monotonic() - start, len(items))
+        self._trace_span(self._stage_name, start, items[0], len(items))
+
+    def _get_batch(self) -> list[TaskInputValueT]:
+        """Get the next batch of items, ending at the dismissal signal if any"""
+        batch = [self._get_input()]
+        deadline = monotonic() + self._batch_linger
+        while batch[-1] is not None and len(batch) < self._batch_size:
+            timeout = max(deadline - monotonic(), 0)
+            try:
+                batch.append(self._get_input(timeout=timeout))
+            except Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            # Process the next batch
+            batch = self._get_batch()
+            items = [item for item in batch if item is not None]
+            self._handle_batch(items)
+            dismissed = len(batch) > 0 and batch[-1] is None
+            if dismissed:
+                self._finish()
+            for _ in batch:
+                self.input_queue.task_done()
+
+            # Stop if requested to
+            if dismissed:
+                break
+
+        # Exit gracefuly
+        sys.exit(0)
+
+    # --- Init
+
+    def __init__(
+        self,
+        batch_size: int,
+        batch_linger: float,
+        input_queue: Any,
+        output_queue: None | Any,
+    ) -> None:
+        super().__init__(input_queue, output_queue)
+        self._batch_size = batch_size
+        self._batch_linger = batch_linger
+
 
 class WorkerPool(WorkerInterface[TaskInputValueT, TaskOutputValueT]):
     """Pool of workers sharing an input queue"""
@@ -120,5 +325,17 @@ class WorkerPool(WorkerInterface[TaskInputValueT, TaskOutputValueT]):
         for worker in self.__workers:
             worker.dismiss()
 
+    def record_metrics(self, metrics: StageMetrics) -> None:
+        for worker in self.__workers:
+            worker.record_metrics(metrics)
+
+    def record_trace(self, tracer: Tracer) -> None:
+        for worker in self.__workers:
+            worker.record_trace(tracer)
+
+    def record_profile(self, profiler: WorkerProfiler) -> None:
+        for index, worker in enumerate(self.__workers):
+            worker.record_profile(profiler, index)
+
     def get_input_queue(self):
         return self.__workers[0].get_input_queue()